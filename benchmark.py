@@ -0,0 +1,204 @@
+"""Benchmarks for building MusicXML scores with musicpy.
+
+Each benchmark runs in a fresh interpreter so that settings which are read
+when musicpy_schema is imported (such as MUSICPY_COMPILED_CONSTRUCTORS and
+MUSICPY_SLOTS) can be compared side by side.
+
+The score is scaled up by repeating the measures of its last part `--copies`
+times, so that a run takes long enough for the differences between the
+settings to stand out from timer noise.
+
+Usage:
+  python benchmark.py [--score example/op299-no1.py] [--copies 10]
+      [--repeat 11] [--validation eager|deferred|off]
+      [--backend lxml|etree|columnar]
+"""
+
+import argparse
+import ctypes
+import gc
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import textwrap
+import time
+import xml.etree.ElementTree as ET
+
+_DEFAULT_SCORE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "example", "op299-no1.py"
+)
+
+
+def load_score(path: str, copies: int = 1) -> str:
+  """Reads a musicpy score, dropping its import lines.
+
+  The body of the last `with Part(...)` block at the top level of the score
+  is repeated `copies` times.
+  """
+  import musicpy_ast
+
+  with open(path, "r") as f:
+    lines = musicpy_ast.strip_imports(f.read()).splitlines()
+  part = max(
+      i
+      for i, line in enumerate(lines)
+      if line.lstrip().startswith("with Part(")
+  )
+  return "\n".join(lines + lines[part + 1 :] * (copies - 1)) + "\n"
+
+
+def measure_construction(path: str, copies: int, repeat: int) -> dict:
+  """Builds the score `repeat` times in this process and reports the timing."""
+  import logging
+  import musicpy_ast
+  import musicpy
+
+  logging.disable(logging.WARNING)
+  source = load_score(path, copies)
+  code = compile(
+      musicpy_ast.PREEMBLE + textwrap.indent(source, "  "), path, "exec"
+  )
+  timings = []
+  for _ in range(repeat):
+    result = musicpy.ScopedNames()
+    start = time.perf_counter()
+    exec(code, {}, result)
+    timings.append(time.perf_counter() - start)
+    del result  # Free the previous tree before building the next one.
+  memory = measure_memory(code)
+  elements = memory.pop("elements")
+  median = statistics.median(timings)
+  return {
+      "compiled_constructors": musicpy.COMPILED_CONSTRUCTORS,
+      "slots": musicpy.SLOTTED_WRAPPERS,
+      "elements": elements,
+      "median_seconds": median,
+      "min_seconds": min(timings),
+      "max_seconds": max(timings),
+      "elements_per_second": elements / median,
+      **memory,
+  }
+
+
+def measure_memory(code) -> dict:
+  """Builds the score once more and measures the memory it holds.
+
+  Reports how much the resident set grew while the built score is alive,
+  which covers both the Python wrappers and the nodes of the tree, and how
+  many element wrappers are still alive. tracemalloc is not used: it resolves
+  the line number of every allocation, which takes time proportional to the
+  length of the score's code.
+  """
+  import musicpy
+
+  gc.collect()
+  _trim_heap()
+  before = _resident_bytes()
+  result = musicpy.ScopedNames()
+  exec(code, {}, result)
+  gc.collect()
+  resident = _resident_bytes() - before
+  wrappers = sum(
+      1 for o in gc.get_objects() if isinstance(o, musicpy.MusicElementBase)
+  )
+  elements = sum(1 for _ in ET.fromstring(result["__score"].get_xml()).iter())
+  return {
+      "elements": elements,
+      "resident_bytes": resident,
+      "live_wrappers": wrappers,
+      # ru_maxrss is in kilobytes on Linux.
+      "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+      * 1024,
+  }
+
+
+def _trim_heap():
+  """Returns the free heap to the system, so the score cannot reuse it."""
+  try:
+    ctypes.CDLL("libc.so.6").malloc_trim(0)
+  except (OSError, AttributeError):  # Not glibc.
+    pass
+
+
+def _resident_bytes() -> int:
+  with open("/proc/self/statm") as f:
+    return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def run_isolated(
+    path: str, copies: int, repeat: int, env: dict[str, str]
+) -> dict:
+  """Runs `measure_construction` in a child interpreter with `env` applied."""
+  output = subprocess.run(
+      [
+          sys.executable,
+          os.path.abspath(__file__),
+          "--score",
+          path,
+          "--copies",
+          str(copies),
+          "--repeat",
+          str(repeat),
+          "--child",
+      ],
+      env={**os.environ, **env},
+      check=True,
+      capture_output=True,
+      text=True,
+  ).stdout
+  return json.loads(output.splitlines()[-1])
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--score", default=_DEFAULT_SCORE)
+  parser.add_argument("--copies", type=int, default=10)
+  parser.add_argument("--repeat", type=int, default=11)
+  parser.add_argument(
+      "--validation", choices=("eager", "deferred", "off"), default="eager"
+  )
+  parser.add_argument(
+      "--backend", choices=("lxml", "etree", "columnar"), default="lxml"
+  )
+  parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.child:
+    result = measure_construction(args.score, args.copies, args.repeat)
+    print(json.dumps(result))
+    return
+
+  print(
+      f"Score: {args.score} x {args.copies} (validation: {args.validation},"
+      f" backend: {args.backend}, median of {args.repeat} runs)"
+  )
+  for label, env in (
+      ("frame introspection", {"MUSICPY_COMPILED_CONSTRUCTORS": "0"}),
+      ("compiled constructors", {"MUSICPY_COMPILED_CONSTRUCTORS": "1"}),
+      (
+          "compiled, no __slots__",
+          {"MUSICPY_COMPILED_CONSTRUCTORS": "1", "MUSICPY_SLOTS": "0"},
+      ),
+  ):
+    env["MUSICPY_VALIDATION"] = args.validation
+    env["MUSICPY_BACKEND"] = args.backend
+    result = run_isolated(args.score, args.copies, args.repeat, env)
+    print(
+        f"  {label:<24} {result['elements']} elements in"
+        f" {result['median_seconds'] * 1000:8.1f} ms"
+        f" ({result['min_seconds'] * 1000:.1f}"
+        f"-{result['max_seconds'] * 1000:.1f})"
+        f" = {result['elements_per_second']:10.0f} elements/s"
+    )
+    print(
+        f"  {'':<24} {result['resident_bytes'] / 1048576:.1f} MiB resident"
+        f" for the built score, {result['live_wrappers']} element wrappers"
+        f" alive, {result['peak_rss_bytes'] / 1048576:.1f} MiB peak RSS"
+    )
+
+
+if __name__ == "__main__":
+  main()
@@ -19,25 +19,46 @@ Key Concepts:
 - Hierarchical Structure: Elements are nested by entering their respective
   context manager blocks within an outer element's block. For example, a
   `Measure` is created within a `Part`, and a `Note` within a `Measure`.
-- Global Context (`_current_context`): A global variable, `_current_context`,
-  is used internally to keep track of the current parent element in the XML
-  hierarchy. When a new MusicXML element object is instantiated, it typically
-  appends its XML representation to the XML element of the `_current_context`.
-  Upon entering a `with` block, the new object becomes the `_current_context`,
-  and upon exiting, the `_current_context` is restored.
-- XML Generation: The library uses `xml.etree.ElementTree` to build the XML
-  document in memory. The `ScorePartwise` class, as the root context, is
-  responsible for serializing the entire structure into an XML string upon
-  exiting its context manager.
+  Scores run with a `ScopedNames` namespace (as `musicpy_ast` does) can name
+  the element classes nested in an open block directly, e.g. `Staff` inside
+  `with Note():`.
+- Build Context (`_current_context`): A `contextvars.ContextVar`,
+  `_current_context`, is used internally to keep track of the current parent
+  element in the XML hierarchy. When a new MusicXML element object is
+  instantiated, it typically appends its XML representation to the XML element
+  of the `_current_context`. Upon entering a `with` block, the new object
+  becomes the `_current_context`, and upon exiting, the `_current_context` is
+  restored. Since the context is a ContextVar, scores can be built
+  concurrently in separate threads or asyncio tasks.
+- Sessions (`MusicPy`): A `with MusicPy(...)` block holds the settings of the
+  score built inside it (validation policy, backend, output stream). Elements
+  built outside of any session use the module defaults, see
+  `set_validation_policy` and `set_backend`.
+- XML Generation: The library uses `lxml.etree` (or `xml.etree.ElementTree`,
+  see `set_backend`) to build the XML document in memory. The
+  `ScorePartwise` class, as the root context, is responsible for serializing
+  the entire structure into an XML string upon exiting its context manager.
+  The tree holds no whitespace; `get_xml(indent=...)` indents the output in a
+  single pass, or leaves it compact with `indent=None`.
+- Columnar Notes: With the "columnar" backend, the pitch, duration, voice and
+  similar children of the notes of each completed measure are stored in
+  per-part arrays (see `musicpy_columnar`) and only turned back into XML when
+  the score is serialized.
+- Streaming: `MusicPy(stream=sink)` writes a partwise score to `sink` while
+  it is built, dropping each measure from memory once it is written.
 - Schema Validation: The library uses `lxml` for schema validation. It loads a
   local copy of the MusicXML schema (`musicxml.xsd` and related files like
-  `xml.xsd`, `xlink.xsd`) using a custom resolver (`LocalSchemaResolver`).
-  For each MusicXML element class, a specific schema is dynamically created
-  (if not already cached) using `create_schema`. The `_validate_xml_subtree`
+  `xml.xsd`, `xlink.xsd`), which `musicpy_xsd` compiles once per process and
+  caches on disk. Each MusicXML element class looks up its validator (if not
+  already cached) using `create_schema`. The `_validate_xml_subtree`
   method in `MusicElementBase` validates the element's generated XML against
-  this schema when its context manager is exited.
+  this schema when its context manager is exited. `set_validation_policy`
+  (or the MUSICPY_VALIDATION environment variable) can instead defer
+  validation to a single pass over the finished tree, or turn it off.
 - Auto-Aliasing: A metaclass `AutoAlias` is used to automatically create
   alias classes, potentially for different naming conventions or shorthand.
+  It also compiles each generated `__init__` stub into a constructor that
+  forwards its parameters directly (see `COMPILED_CONSTRUCTORS`).
 - Argument Handling: The `MusicElementArg` dataclass and `_` helper function
   are used for more flexible argument passing to element constructors.
 
@@ -74,15 +95,24 @@ This example creates a simple score with one part (Piano), one measure,
 and two notes with lyrics. The output will be a MusicXML string.
 """
 
+import bisect
+import contextvars
+import copy
 import dataclasses
+import functools
+import importlib
 import inspect
 import logging
 import os
 import sys
+import time
 import traceback
-from typing import Any
+import types
+from typing import Any, Iterable
 import xml.etree.ElementTree as ET
 from lxml import etree
+import musicpy_columnar
+import musicpy_xsd
 
 logging.basicConfig(
     level=logging.INFO,
@@ -93,36 +123,324 @@ logging.basicConfig(
 )
 
 
-# Global context for building the XML tree
-_current_context = None
+# The element (or `MusicPy` session) that new elements are added to, and the
+# session they are built in. Each thread and asyncio task sees its own values.
+_current_context = contextvars.ContextVar("musicpy_context", default=None)
+_current_session = contextvars.ContextVar("musicpy_session")
+# The `(filename, lineno)` of the innermost `with` block, set by code that
+# builds scores without a frame running their source (`musicpy_ast`'s
+# evaluator). Eager validation reports errors there rather than at the frame
+# that exited the block.
+block_origin = contextvars.ContextVar("musicpy_block_origin", default=None)
 
 
 class MusicPy:
+  """The session a score is built in.
 
-  def __init__(self):
-    global _current_context
-    _current_context = self
+  Entering the session makes it the build context of the current thread or
+  asyncio task, so several scores can be built concurrently.
+
+  Args:
+    stream: Optional binary file object or path. When given, the partwise
+      score is written to it incrementally as its measures are completed
+      (see `_StreamWriter`) instead of being kept in memory.
+    validation_policy: One of `VALIDATION_POLICIES`. Defaults to the policy
+      selected by `set_validation_policy`.
+    backend: One of `BACKENDS`. Defaults to the backend selected by
+      `set_backend`.
+  """
+
+  def __init__(
+      self,
+      stream=None,
+      validation_policy: str | None = None,
+      backend: str | None = None,
+  ):
+    if validation_policy is None:
+      validation_policy = _default_session.validation_policy
+    elif validation_policy not in VALIDATION_POLICIES:
+      raise ValueError(
+          f"Unknown validation policy {validation_policy!r}, expected one of"
+          f" {VALIDATION_POLICIES}"
+      )
+    if backend is None:
+      backend = _default_session.backend.name
+    self.backend = _new_backend(backend)
+    if stream is not None and self.backend.name == "columnar":
+      raise ValueError("The columnar backend cannot stream scores.")
+    self.validation_policy = validation_policy
+    # Source location of each element created under the "deferred" policy,
+    # used to report errors found at the root. See `_caller_origin`.
+    # Cleared whenever a root element has been validated. This holds the
+    # elements strongly, since lxml element proxies cannot be used as weak
+    # keys.
+    self.element_origins = {}
+    self.stream_writer = (
+        _StreamWriter(stream, self) if stream is not None else None
+    )
+    self.child = None
+    self._tokens = []
 
   def add_child(self, child):
     self.child = child
 
-  def get_xml(self):
-    return str(self.child)
+  def get_xml(self, indent: int | None = 2):
+    """Serializes the score.
+
+    Args:
+      indent: Number of spaces to indent each level by, or None for compact
+        output without any whitespace between elements.
+    """
+    if self.stream_writer is not None:
+      raise ValueError("The score was streamed and is not kept in memory.")
+    return self.backend.tostring(self.child.element, indent)
+
+  def note_columns(self) -> dict[str, musicpy_columnar.NoteColumns]:
+    """Returns the column-stored notes of each part, by part id.
+
+    Only available with the "columnar" backend, see `_ColumnarBackend`.
+    """
+    if self.backend.name != "columnar":
+      raise ValueError("Only the columnar backend stores notes in columns.")
+    return {
+        part.get("id"): columns
+        for part, columns in self.backend.columns.items()
+    }
 
   def __enter__(self):
+    self._tokens.append(
+        (_current_session.set(self), _current_context.set(self))
+    )
     return self
 
   def __exit__(self, exc_type, exc_val, exc_tb):
-    pass
+    session_token, context_token = self._tokens.pop()
+    _current_context.reset(context_token)
+    _current_session.reset(session_token)
+    writer = self.stream_writer
+    if writer is not None and exc_type is not None:
+      writer.abort(exc_type, exc_val, exc_tb)
+    elif writer is not None:
+      writer.close()
+
+
+# How `with` blocks are validated against the MusicXML schema:
+#   "eager"    - every block validates its own subtree when it exits.
+#   "deferred" - only the outermost block validates, once, against the schema
+#                of its root element; errors are reported at the source line
+#                that created the offending element.
+#   "off"      - no validation.
+VALIDATION_POLICIES = ("eager", "deferred", "off")
+
+
+def set_validation_policy(policy: str):
+  """Selects one of `VALIDATION_POLICIES` for subsequently built elements.
+
+  This is the default of new `MusicPy` sessions and of elements built outside
+  of a session.
+  """
+  if policy not in VALIDATION_POLICIES:
+    raise ValueError(
+        f"Unknown validation policy {policy!r}, expected one of"
+        f" {VALIDATION_POLICIES}"
+    )
+  _default_session.validation_policy = policy
+
+
+def _caller_origin() -> tuple[types.CodeType, int] | None:
+  """Returns the (code, instruction offset) of the nearest frame outside musicpy.
+
+  The line number is resolved later by `_format_origin`, since computing
+  `f_lineno` scans the code's line table and would be quadratic for large
+  module-level scores.
+  """
+  frame = sys._getframe(1)
+  while frame is not None and frame.f_globals.get("__name__") in (
+      __name__,
+      "musicpy_schema",
+  ):
+    frame = frame.f_back
+  if frame is None:
+    return None
+  return frame.f_code, frame.f_lasti
+
+
+@functools.lru_cache(maxsize=8)
+def _line_table(code: types.CodeType) -> tuple[list[int], list[int]]:
+  """Returns the sorted start offsets of `code`'s line ranges and their lines."""
+  starts, lines = [], []
+  for start, _, line in code.co_lines():
+    starts.append(start)
+    lines.append(line or 0)
+  return starts, lines
+
+
+def _format_origin(origin: tuple | None) -> str:
+  """Formats an origin as "filename:lineno".
+
+  Args:
+    origin: A `(code, instruction offset)` pair from `_caller_origin`, or a
+      `(filename, lineno)` pair from code that knows the line itself.
+  """
+  if origin is None:
+    return "Unknown location"
+  code, lasti = origin
+  if isinstance(code, str):
+    return f"{os.path.basename(code)}:{lasti}"
+  starts, lines = _line_table(code)
+  index = bisect.bisect_right(starts, lasti) - 1
+  lineno = lines[index] if index >= 0 else 0
+  return f"{os.path.basename(code.co_filename)}:{lineno}"
+
+
+def _validate_tree(
+    element, schema: etree.XMLSchema, session: MusicPy
+) -> bool:
+  """Validates `element` with `schema`, reporting errors at their origin.
+
+  Every error is logged with the source line that created the element it was
+  found in, as recorded in `session.element_origins`.
+  """
+  lxml_tree_for_validation = session.backend.to_lxml(element)
+  if schema.validate(lxml_tree_for_validation):
+    logging.info(f"Validated {element.tag}")
+    return True
+  elements = None
+  if lxml_tree_for_validation is not element:
+    elements = session.backend.node_map(lxml_tree_for_validation, element)
+  for error in schema.error_log:
+    # Error paths start at the validated element, which may not be the root
+    # of its document.
+    _, _, relative_path = (error.path or "").lstrip("/").partition("/")
+    nodes = (
+        lxml_tree_for_validation.xpath(f"./{relative_path}")
+        if relative_path
+        else [lxml_tree_for_validation]
+    )
+    node = nodes[0] if nodes else None
+    origin = None
+    # Nodes without an origin of their own (e.g. restored by the columnar
+    # backend) are reported at their nearest ancestor that has one.
+    ancestor = node
+    while ancestor is not None and origin is None:
+      original = elements.get(ancestor) if elements is not None else ancestor
+      origin = session.element_origins.get(original)
+      ancestor = ancestor.getparent()
+    logging.info(
+        f"{_format_origin(origin)}: Schema Validation Error for"
+        f" {node.tag if node is not None else element.tag}: {error.message}"
+    )
+  return False
+
+
+def _validate_detached(element, session: MusicPy):
+  """Validates a subtree that is about to leave memory ("deferred" policy).
+
+  Elements without a validator of their own (like measures) are validated
+  child by child. Their recorded origins are released afterwards.
+  """
+  try:
+    schema = musicpy_xsd.validator(element.tag)
+  except Exception as e:
+    logging.warning(f"Failed to create schema for {element.tag}: {e}")
+    schema = None
+  if schema is not None:
+    _validate_tree(element, schema, session)
+  else:
+    for child in element:
+      _validate_detached(child, session)
+  for node in element.iter():
+    session.element_origins.pop(node, None)
+
+
+class _StreamWriter:
+  """Writes a partwise score to a sink while it is being built.
+
+  The score and part start tags are written when their `with` blocks are
+  entered. Completed children are written and removed from the tree as soon
+  as a later sibling starts or a measure ends, so memory holds at most the
+  measure being built rather than the whole score.
+
+  If the build raises, writing stops at the last completed measure and the
+  document is left unterminated, so a failed build cannot be mistaken for a
+  well-formed (truncated) score. `failed` is set in that case.
+  """
 
+  CONTAINERS = ("score-partwise", "part")
+  UNIT = "measure"
 
-# Global variables for schema, parser, and schema details.
-_MUSICXML_GLOBAL_SCHEMA_PARSER = None
-_MUSICXML_SCHEMA_FILE_NAME = "musicxml.xsd"
+  def __init__(self, sink, session: MusicPy):
+    self._file = etree.xmlfile(sink, encoding="utf-8")
+    self._session = session
+    self._writer = None
+    self._open = []  # (element, start tag context) of the open containers.
+    self._closed = False
+    self.failed = False
 
+  def enter(self, element):
+    if self.failed or element.tag not in self.CONTAINERS:
+      return
+    if self._writer is None:
+      self._writer = self._file.__enter__()
+      self._writer.write_declaration()
+    elif self._open:
+      self._flush(self._open[-1][0], until=element)
+    start_tag = self._writer.element(element.tag, dict(element.attrib))
+    start_tag.__enter__()
+    self._open.append((element, start_tag))
+    self._flush(element)
+
+  def exit(self, element):
+    if self.failed or not self._open:
+      return
+    parent = self._open[-1][0]
+    if element.tag == self.UNIT and len(parent) and parent[-1] is element:
+      self._flush(parent)
+    elif element is parent:
+      self._flush(element)
+      self._open.pop()[1].__exit__(None, None, None)
+      if self._open:
+        self._open[-1][0].remove(element)
+      else:
+        self.close()
 
-def get_xml():
-  return _current_context.get_xml()
+  def close(self):
+    if self.failed:
+      return
+    while self._open:
+      self._open.pop()[1].__exit__(None, None, None)
+    if self._writer is not None:
+      self._writer = None
+      self._file.__exit__(None, None, None)
+      self._closed = True
+
+  def abort(self, exc_type, exc_val, exc_tb):
+    """Stops writing without closing the open start tags."""
+    if self.failed or self._closed:
+      return  # An exception after the score was complete does not fail it.
+    self.failed = True
+    self._open.clear()
+    if self._writer is not None:
+      self._writer = None
+      # Given an exception, xmlfile flushes and closes the sink without
+      # checking for or writing the missing end tags.
+      self._file.__exit__(exc_type, exc_val, exc_tb)
+
+  def _flush(self, container, until=None):
+    """Writes and drops the children of `container` that precede `until`."""
+    for child in list(container):
+      if child is until:
+        break
+      if self._session.validation_policy == "deferred":
+        _validate_detached(child, self._session)
+      self._writer.write(
+          self._session.backend.to_lxml(child), with_tail=False
+      )
+      container.remove(child)
+
+
+def get_xml(indent: int | None = 2):
+  return _current_context.get().get_xml(indent)
 
 
 @dataclasses.dataclass(frozen=True)
@@ -135,31 +453,6 @@ def _(*args, **kwargs):
   return MusicElementArg(args, kwargs)
 
 
-# Define LocalSchemaResolver before its use in _ensure_schema_loaded
-class LocalSchemaResolver(etree.Resolver):
-  """A custom lxml resolver to load specific schema files from local paths
-
-  instead of their online URLs.
-  """
-
-  def __init__(self, local_mapping):
-    # local_mapping is a dictionary e.g.:
-    # {"http://www.musicxml.org/xsd/xml.xsd": "xml.xsd"}
-    self.local_mapping = local_mapping
-
-  def resolve(self, system_url, public_id, context):
-    local_path = self.local_mapping.get(system_url)
-    if local_path:
-      if os.path.exists(local_path):
-        return self.resolve_filename(local_path, context)
-      else:
-        logging.warning(
-            f"Local schema file '{local_path}' for URL '{system_url}'"
-            " not found."
-        )
-    return None
-
-
 def to_kebab_case(name: str, namespace: str = "") -> str:
   """Converts a PascalCase or CamelCase string to snake_case.
 
@@ -183,53 +476,605 @@ def to_kebab_case(name: str, namespace: str = "") -> str:
   return result
 
 
+# Interned tag and attribute names, keyed by (python name, namespace). The
+# AutoAlias metaclass fills it with every element tag and declared attribute
+# while musicpy_schema is imported, so lookups during construction and
+# validation never have to convert names again.
+_KEBAB_NAMES: dict[tuple[str, str], str] = {}
+
+
+def kebab_name(name: str, namespace: str = "") -> str:
+  """Memoized and interned version of `to_kebab_case`."""
+  key = (name, namespace)
+  kebab = _KEBAB_NAMES.get(key)
+  if kebab is None:
+    kebab = _KEBAB_NAMES[key] = sys.intern(to_kebab_case(name, namespace))
+  return kebab
+
+
 def to_pascal_case(snake_str: str) -> str:
   """Converts a snake_case string to PascalCase."""
   return "".join(word.capitalize() for word in snake_str.split("_"))
 
 
-def loaded_musicxml_schema():
-  """Loads the MusicXML schema if not already loaded. Uses global variables."""
-  global _MUSICXML_GLOBAL_SCHEMA_PARSER
-  local_files_map = {
-      "http://www.musicxml.org/xsd/xml.xsd": "xml.xsd",
-      "http://www.musicxml.org/xsd/xlink.xsd": "xlink.xsd",
-  }
-  custom_resolver = LocalSchemaResolver(local_files_map)
-  _MUSICXML_GLOBAL_SCHEMA_PARSER = etree.XMLParser(
-      resolve_entities=False, load_dtd=False
-  )
-  _MUSICXML_GLOBAL_SCHEMA_PARSER.resolvers.add(custom_resolver)
+# Namespaces of the prefixed attributes used by MusicXML (xml:lang, xlink:href).
+_NAMESPACES = {
+    "xml": "http://www.w3.org/XML/1998/namespace",
+    "xlink": "http://www.w3.org/1999/xlink",
+}
+etree.register_namespace("xlink", _NAMESPACES["xlink"])
+
+
+class _LxmlBackend:
+  """Builds `lxml.etree` elements, which are validated in place."""
+
+  name = "lxml"
+  element_type = etree._Element
+  Element = staticmethod(etree.Element)
+
+  @staticmethod
+  def attribute_name(name: str, namespace: str) -> str:
+    if namespace:
+      return f"{{{_NAMESPACES[namespace]}}}{kebab_name(name)}"
+    return kebab_name(name)
 
+  @staticmethod
+  def tostring(element, indent: int | None = None) -> str:
+    if indent is None:
+      return etree.tostring(element, encoding="unicode", with_tail=False)
+    if indent == 2:
+      # libxml2 indents by two spaces without touching the tree.
+      return etree.tostring(
+          element, encoding="unicode", with_tail=False, pretty_print=True
+      ).rstrip("\n")
+    element = copy.deepcopy(element)
+    etree.indent(element, space=" " * indent)
+    return etree.tostring(element, encoding="unicode", with_tail=False)
 
-loaded_musicxml_schema()
+  @staticmethod
+  def to_lxml(element):
+    return element
+
+  @staticmethod
+  def close(element, session: MusicPy):
+    """Called when the `with` block of `element` exits."""
+
+
+class _ElementTreeBackend:
+  """Builds `xml.etree.ElementTree` elements.
+
+  They have to be serialized and reparsed into lxml to be validated.
+  """
+
+  name = "etree"
+  element_type = ET.Element
+  Element = staticmethod(ET.Element)
+
+  @staticmethod
+  def attribute_name(name: str, namespace: str) -> str:
+    return kebab_name(name, namespace)
+
+  @staticmethod
+  def tostring(element, indent: int | None = None) -> str:
+    if indent is not None:
+      element = copy.deepcopy(element)
+      ET.indent(element, space=" " * indent)
+    return ET.tostring(element, encoding="unicode")
+
+  @staticmethod
+  def to_lxml(element):
+    instance_parser = etree.XMLParser(resolve_entities=True, load_dtd=False)
+    return etree.fromstring(
+        ET.tostring(element, encoding="utf-8"), parser=instance_parser
+    )
+
+  @staticmethod
+  def node_map(tree, element) -> dict:
+    """Maps the nodes of `to_lxml(element)` to those of `element`."""
+    # A reparsed copy has the same document order as the original tree.
+    return dict(zip(tree.iter(), element.iter()))
+
+  @staticmethod
+  def close(element, session: MusicPy):
+    """Called when the `with` block of `element` exits."""
+
+
+class _ColumnarBackend(_LxmlBackend):
+  """Builds `lxml.etree` elements and stores the values of notes in columns.
+
+  When a measure of a partwise score is complete, the pitch, rest, chord,
+  duration, voice, type and staff children of its notes are moved into the
+  `musicpy_columnar.NoteColumns` of its part. They are restored in a copy of
+  the tree when it is serialized or validated. Every session gets its own
+  instance, which holds the columns of the score built in it.
+  """
+
+  name = "columnar"
+
+  def __init__(self):
+    # `NoteColumns` by part element. Holding the part elements keeps their
+    # lxml proxies, and thus the keys, alive.
+    self.columns = {}
+
+  def tostring(self, element, indent: int | None = None) -> str:
+    return _LxmlBackend.tostring(self.to_lxml(element), indent)
+
+  def to_lxml(self, element):
+    if not musicpy_columnar.has_compacted_notes(element, self.columns):
+      return element
+    return musicpy_columnar.materialize(element, self.columns)
+
+  @staticmethod
+  def node_map(tree, element) -> dict:
+    """Maps the nodes of `to_lxml(element)` to those of `element`."""
+    return musicpy_columnar.original_nodes(tree, element)
+
+  def close(self, element, session: MusicPy):
+    if element.tag != "measure":
+      return
+    part = element.getparent()
+    if part is None or part.tag != "part":
+      return
+    columns = self.columns.get(part)
+    if columns is None:
+      columns = self.columns[part] = musicpy_columnar.NoteColumns()
+    for child in musicpy_columnar.compact(part, columns):
+      if session.element_origins:
+        # The origin of a removed node is reported at its note.
+        for node in child.iter():
+          session.element_origins.pop(node, None)
+
+
+_BACKENDS = {
+    backend.name: backend
+    for backend in (_LxmlBackend, _ElementTreeBackend, _ColumnarBackend)
+}
+BACKENDS = tuple(_BACKENDS)
+
+
+def _new_backend(name: str):
+  """Returns the backend `name` for a new session."""
+  if name not in _BACKENDS:
+    raise ValueError(f"Unknown backend {name!r}, expected one of {BACKENDS}")
+  backend = _BACKENDS[name]
+  # The columnar backend holds the columns of one score.
+  return backend() if backend is _ColumnarBackend else backend
+
+
+def _backend_of(element):
+  """Returns the backend to serialize or validate `element` with.
+
+  That is the backend of the current session if it built elements of this
+  type, so that columnar scores are restored.
+  """
+  backend = _current_session.get(_default_session).backend
+  if isinstance(element, backend.element_type):
+    return backend
+  if isinstance(element, etree._Element):
+    return _LxmlBackend
+  return _ElementTreeBackend
+
+
+def set_backend(name: str):
+  """Selects the XML library (one of `BACKENDS`) for new elements.
+
+  This is the default of new `MusicPy` sessions and of elements built outside
+  of a session.
+  """
+  _default_session.backend = _new_backend(name)
+
+
+# The settings of elements built outside of a `MusicPy` session. They are
+# shared by every thread, unlike those of a session.
+_default_session = MusicPy(
+    validation_policy=os.environ.get("MUSICPY_VALIDATION", "eager"),
+    backend=os.environ.get("MUSICPY_BACKEND", "lxml"),
+)
+
+
+def _clear_class_caches(cls: type):
+  """Empties the per-class caches of `cls` and all of its subclasses.
+
+  These are `_kwarg_targets` and `_nested_classes`.
+  """
+  pending = [cls]
+  while pending:
+    klass = pending.pop()
+    klass._kwarg_targets.clear()
+    klass._nested_classes = None
+    pending.extend(klass.__subclasses__())
 
 
 def create_schema(element_name: str) -> etree.XMLSchema:
-  element = (
-      ""
-      if element_name in ("score-partwise", "score-timewise")
-      else f' <xs:element name="{element_name}" type="{element_name}"/>'
+  """Returns the schema validating `element_name`, see `musicpy_xsd`."""
+  schema = musicpy_xsd.validator(element_name)
+  if schema is None:
+    raise ValueError(f"{element_name} is not declared in the MusicXML schema")
+  return schema
+
+
+# Elements validated by nearly every score, see `prewarm`.
+PREWARM_ELEMENTS = (
+    "ScorePartwise",
+    "Attributes",
+    "Note",
+    "Pitch",
+    "Rest",
+    "Backup",
+    "Forward",
+    "Direction",
+    "Harmony",
+    "Barline",
+    "Print",
+    "Notations",
+    "Lyric",
+)
+
+
+def prewarm(
+    elements: Iterable[str | type["MusicElementBase"]] = PREWARM_ELEMENTS,
+) -> dict[str, float]:
+  """Compiles the validators of `elements` ahead of their first use.
+
+  This moves the schema compilation out of the first requests of a server
+  process. The compiled schemas are plain process memory, so calling this in
+  a parent process before `fork()` lets every child inherit them. Other
+  threads still compile their own copy of the schema on first use, but read
+  the resolved schema document loaded here.
+
+  Args:
+    elements: Element classes, or their names in musicpy_schema. Nested
+      classes can be named with dots, e.g. "ScorePartwise.Part".
+
+  Returns:
+    The seconds spent warming each element that has a validator, by name.
+    The first element also pays for compiling the MusicXML schema itself.
+  """
+  schema_module = importlib.import_module("musicpy_schema")
+  warmed = {}
+  for element in elements:
+    if isinstance(element, str):
+      name, element_class = element, schema_module
+      for part in element.split("."):
+        element_class = getattr(element_class, part)
+    else:
+      name, element_class = element.__qualname__, element
+    start = time.perf_counter()
+    if element_class._load_schema() is not None:
+      warmed[name] = time.perf_counter() - start
+  logging.info(f"Prewarmed validators: {warmed}")
+  return warmed
+
+
+# When enabled, the generated `__init__` stubs in musicpy_schema (whose body is
+# just `self.init()`) are replaced at class-creation time by constructors that
+# forward their declared parameters straight to `MusicElementBase.__init__`,
+# instead of recovering them from the caller frame on every instantiation.
+COMPILED_CONSTRUCTORS = (
+    os.environ.get("MUSICPY_COMPILED_CONSTRUCTORS", "1") != "0"
+)
+
+# When enabled, element classes declare empty `__slots__`, so their instances
+# carry no `__dict__`. Only disabled to measure what the slots save.
+SLOTTED_WRAPPERS = os.environ.get("MUSICPY_SLOTS", "1") != "0"
+
+# Constructor code objects keyed by parameter layout, shared by every class
+# with the same signature (e.g. all the `(self, plain_text)` leaf elements).
+_CONSTRUCTOR_CODE: dict[tuple[tuple[str, ...], tuple[str, ...]], Any] = {}
+
+
+def _is_init_stub(init) -> bool:
+  """Returns True if `init` is a generated `def __init__(...): self.init()`."""
+  code = getattr(init, "__code__", None)
+  return (
+      code is not None
+      and code.co_names == ("init",)
+      and not code.co_flags & (inspect.CO_VARARGS | inspect.CO_VARKEYWORDS)
   )
 
-  wrapper_schema_str = f"""
-<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
-          elementFormDefault="qualified">
-  <xs:include schemaLocation="musicxml.xsd"/>
-  {element}
-</xs:schema>
-"""
-  wrapper_schema_doc_lxml = etree.fromstring(
-      wrapper_schema_str.encode("utf-8"), parser=_MUSICXML_GLOBAL_SCHEMA_PARSER
+
+def _compile_constructor(init):
+  """Returns an equivalent of `init` that calls the base constructor directly.
+
+  Args:
+    init: A generated `__init__` stub whose body is `self.init()`.
+
+  Returns:
+    A function with the same signature, defaults and annotations as `init`
+    that passes its parameters as keyword arguments to
+    `MusicElementBase.__init__`, in declaration order.
+  """
+  code = init.__code__
+  names = code.co_varnames[: code.co_argcount + code.co_kwonlyargcount]
+  positional = names[1 : code.co_argcount]
+  keyword_only = names[code.co_argcount :]
+  layout = (positional, keyword_only)
+  constructor_code = _CONSTRUCTOR_CODE.get(layout)
+  if constructor_code is None:
+    signature = ", ".join(
+        (names[0],) + positional + (("*",) + keyword_only if keyword_only else ())
+    )
+    # `build_element` skips None arguments, so only the given ones are
+    # forwarded: most elements declare many optional children and attributes
+    # but are called with a few.
+    forwarded = "".join(
+        f"  if {n} is not None:\n    kwargs[{n!r}] = {n}\n" for n in names[1:]
+    )
+    namespace = {}
+    exec(
+        f"def __init__({signature}):\n"
+        "  kwargs = {}\n"
+        f"{forwarded}"
+        f"  _base_init({names[0]}, **kwargs)\n",
+        {},
+        namespace,
+    )
+    constructor_code = namespace["__init__"].__code__
+    _CONSTRUCTOR_CODE[layout] = constructor_code
+  constructor = types.FunctionType(
+      constructor_code,
+      {"__name__": __name__, "_base_init": MusicElementBase.__init__},
+      "__init__",
+      init.__defaults__,
+  )
+  constructor.__kwdefaults__ = init.__kwdefaults__
+  constructor.__qualname__ = init.__qualname__
+  constructor.__module__ = init.__module__
+  constructor.__doc__ = init.__doc__
+  constructor.__annotations__ = init.__annotations__
+  return constructor
+
+
+# Kinds of constructor keyword arguments, see `_resolve_kwarg`.
+_PLAIN_TEXT = 0
+_ATTRIBUTE = 1
+_NAMESPACED_ATTRIBUTE = 2
+_CHILD = 3
+
+
+def _resolve_kwarg(cls: type, k: str) -> tuple[int, Any] | None:
+  """Finds what constructor keyword `k` of `cls` maps to.
+
+  Args:
+    cls: The element class being constructed.
+    k: The keyword argument name.
+
+  Returns:
+    `(_PLAIN_TEXT, None)` for the element text, `(_ATTRIBUTE, name)` with the
+    kebab-case attribute name for lowercase keywords, or
+    `(_NAMESPACED_ATTRIBUTE, (k, namespace))` if the attribute is in a
+    namespace, whose name depends on the backend.
+    `(_CHILD, child_class)` for PascalCase keywords naming an element class,
+    or None if `k` cannot be resolved.
+  """
+  if k == "plain_text":
+    return _PLAIN_TEXT, None
+  if k == k.lower():
+    namespace = getattr(cls, k, "")
+    if namespace:
+      return _NAMESPACED_ATTRIBUTE, (k, namespace)
+    return _ATTRIBUTE, kebab_name(k)
+  # Nested and aliased classes first, then the musicpy_schema module.
+  child_class_type = getattr(cls, k, None)
+  if child_class_type is None:
+    child_class_type = getattr(sys.modules.get("musicpy_schema"), k, None)
+  if isinstance(child_class_type, type) and issubclass(
+      child_class_type, MusicElementBase
+  ):
+    return _CHILD, child_class_type
+  return None
+
+
+def nested_classes_of(cls: type) -> dict[str, type]:
+  """Returns the element classes nested in or aliased by `cls`, by name.
+
+  Classes declared on `cls` take precedence over those of its bases.
+  """
+  nested = cls._nested_classes
+  if nested is None:
+    nested = {}
+    for klass in cls.__mro__:
+      for name, attr_value in list(klass.__dict__.items()):
+        if isinstance(attr_value, AutoAlias):
+          nested.setdefault(name, attr_value)
+    cls._nested_classes = nested
+  return nested
+
+
+# (parameter positions, required parameters, defaults that are not None,
+# number of positional parameters) of each element constructor, see
+# `bind_arguments`. None for `MusicElementBase.__init__` itself.
+_PARAMETERS: dict[Any, tuple | None] = {}
+
+
+def _parameters_of(cls: type) -> tuple | None:
+  init = cls.__init__
+  try:
+    return _PARAMETERS[init]
+  except KeyError:
+    pass
+  if init is MusicElementBase.__init__:
+    parameters = None
+  else:
+    code = init.__code__
+    names = code.co_varnames[1 : code.co_argcount + code.co_kwonlyargcount]
+    defaults = dict(init.__kwdefaults__ or {})
+    positional_defaults = init.__defaults__ or ()
+    first = code.co_argcount - 1 - len(positional_defaults)
+    defaults.update(zip(names[first:], positional_defaults))
+    parameters = (
+        {name: index for index, name in enumerate(names)},
+        frozenset(names) - defaults.keys(),
+        tuple((k, v) for k, v in defaults.items() if v is not None),
+        code.co_argcount - 1,
+    )
+  _PARAMETERS[init] = parameters
+  return parameters
+
+
+def bind_arguments(cls: type, args: tuple, kwargs: dict) -> dict:
+  """Returns the keyword arguments that `cls(*args, **kwargs)` passes on.
+
+  That is what the constructor of `cls` forwards to `MusicElementBase`: its
+  parameters in declaration order, leaving out those that default to None.
+
+  Raises:
+    TypeError: If the arguments do not match the constructor's signature.
+  """
+  parameters = _parameters_of(cls)
+  if parameters is None:
+    return kwargs
+  positions, required, defaults, positional = parameters
+  if not defaults:
+    # Fast paths for leaf values and single keywords, which most keyword
+    # children are.
+    if len(args) == 1 and not kwargs and positional:
+      bound = {next(iter(positions)): args[0]}
+      if required <= bound.keys():
+        return bound
+    elif not args and len(kwargs) == 1 and kwargs.keys() <= positions.keys():
+      if required <= kwargs.keys():
+        return kwargs
+  name = f"{cls.__qualname__}.__init__()"
+  if len(args) > positional:
+    raise TypeError(
+        f"{name} takes {positional + 1} positional arguments but"
+        f" {len(args) + 1} were given"
+    )
+  bound = dict(zip(positions, args)) if args else {}
+  for k, v in kwargs.items():
+    if k not in positions:
+      raise TypeError(f"{name} got an unexpected keyword argument {k!r}")
+    if k in bound:
+      raise TypeError(f"{name} got multiple values for argument {k!r}")
+    bound[k] = v
+  if not required <= bound.keys():
+    missing = sorted(required - bound.keys(), key=positions.__getitem__)
+    listed = ", ".join(repr(k) for k in missing[:-1])
+    listed = f"{listed} and {missing[-1]!r}" if listed else repr(missing[-1])
+    plural = "s" if len(missing) > 1 else ""
+    raise TypeError(
+        f"{name} missing {len(missing)} required positional argument{plural}:"
+        f" {listed}"
+    )
+  for k, v in defaults:
+    bound.setdefault(k, v)
+  if len(bound) > 1:
+    bound = {k: bound[k] for k in sorted(bound, key=positions.__getitem__)}
+  return bound
+
+
+def build_element(cls: type, kwargs: dict, session: MusicPy, origin):
+  """Builds the element of `cls` from its constructor's keyword arguments.
+
+  This is the work of `MusicElementBase.__init__`, without a wrapper and
+  without attaching the element to the current context, so that it can also
+  be used without instantiating `cls` (see `bind_arguments`).
+
+  Args:
+    cls: The element class.
+    kwargs: The arguments as passed to `MusicElementBase.__init__`, i.e. in
+      declaration order.
+    session: The session the element is built in.
+    origin: Where the element was created, recorded in the session for the
+      "deferred" policy (None for others), see `_format_origin`. Its keyword
+      children share it.
+
+  Returns:
+    The element with its attributes, text and keyword children, not yet
+    attached to a parent.
+  """
+  element = session.backend.Element(cls._tag)
+  if origin is not None:
+    session.element_origins[element] = origin
+  kwarg_targets = cls._kwarg_targets
+  for k, v_args in kwargs.items():
+    if v_args is None:
+      continue
+    target = kwarg_targets.get(k)
+    if target is None:
+      target = _resolve_kwarg(cls, k)
+      if target is None:
+        if isinstance(v_args, MusicElementBase):
+          raise ValueError("use _() instead.")
+        raise ValueError(f"No class found for {k}")
+      kwarg_targets[k] = target
+    kind, value = target
+    if kind == _ATTRIBUTE:
+      element.set(value, str(v_args))
+    elif kind == _CHILD:
+      if isinstance(v_args, MusicElementBase):
+        raise ValueError("use _() instead.")
+      element.append(_build_child(value, v_args, session, origin))
+    elif kind == _NAMESPACED_ATTRIBUTE:
+      element.set(session.backend.attribute_name(*value), str(v_args))
+    else:
+      element.text = str(v_args)
+  return element
+
+
+def _build_child(child_class: type, arg: Any, session: MusicPy, origin):
+  """Builds a child given as a keyword argument, like `child_class(arg)`.
+
+  `_()` arguments are unpacked into positional and keyword arguments, tuples
+  into positional and dicts into keyword arguments.
+  """
+  if isinstance(arg, MusicElementArg):
+    args, kwargs = arg.args, arg.kwargs
+  elif isinstance(arg, tuple):
+    args, kwargs = arg, {}
+  elif isinstance(arg, dict):
+    args, kwargs = (), arg
+  else:
+    args, kwargs = (arg,), {}
+  return build_element(
+      child_class,
+      bind_arguments(child_class, args, kwargs),
+      session,
+      origin,
   )
-  return etree.XMLSchema(wrapper_schema_doc_lxml)
+
+
+class ScopedNames(dict):
+  """A namespace in which scores can use the nested names of their blocks.
+
+  Used as the locals of `exec`, it resolves a name that is neither a local
+  nor defined in the namespace itself to the element class of that name
+  nested in an open `with` block, e.g. `Staff` to `Note.Staff` inside
+  `with Note():`. Outer blocks take precedence over inner ones. Names that
+  are not nested in any open block fall back to the globals.
+  """
+
+  def __missing__(self, name):
+    scopes = []
+    context = _current_context.get()
+    while isinstance(context, MusicElementBase):
+      scopes.append(context)
+      token = getattr(context, "_context_token", None)
+      if token is None:
+        break
+      context = token.old_value
+    for scope in reversed(scopes):
+      nested = nested_classes_of(type(scope)).get(name)
+      if nested is not None:
+        return nested
+    raise KeyError(name)
 
 
 class AutoAlias(type):
 
   def __new__(mcs, name, bases, dct):
+    # Per-class cache of `_resolve_kwarg` results, filled on first use.
+    dct["_kwarg_targets"] = {}
+    # Per-class cache of `nested_classes_of`, computed on first use.
+    dct["_nested_classes"] = None
+    # Instances only hold their XML element, so they need no `__dict__`.
+    if SLOTTED_WRAPPERS:
+      dct.setdefault("__slots__", ())
     if name == "MusicElementBase":
       return super().__new__(mcs, name, bases, dct)
+    if COMPILED_CONSTRUCTORS and _is_init_stub(dct.get("__init__")):
+      dct["__init__"] = _compile_constructor(dct["__init__"])
     for attr_name, value in dct.items():
       if (
           isinstance(value, type(MusicElementBase))
@@ -242,7 +1087,14 @@ class AutoAlias(type):
         )
       elif value is _:
         dct[attr_name] = to_kebab_case(attr_name)
-    return super().__new__(mcs, name, bases, dct)
+    cls = super().__new__(mcs, name, bases, dct)
+    cls._tag = kebab_name(name)
+    init_code = getattr(dct.get("__init__"), "__code__", None)
+    if init_code is not None:
+      for param in init_code.co_varnames[1 : init_code.co_argcount]:
+        if param != "plain_text" and param == param.lower():
+          kebab_name(param, getattr(cls, param, "") or "")
+    return cls
 
   def __setattr__(cls, name, value):
     if isinstance(value, type(MusicElementBase)) and name != value.__name__:
@@ -250,92 +1102,77 @@ class AutoAlias(type):
           name, (value,), {}  # Name of the new class  # Tuple of base classes
       )
     super().__setattr__(name, value)
+    if not name.startswith("_"):
+      # Rebinding e.g. `Tuplet.TupletActual` changes how keywords and nested
+      # names resolve for this class and every class inheriting from it.
+      _clear_class_caches(cls)
 
 
 class MusicElementBase(metaclass=AutoAlias):
-  """A base class for MusicXML elements to handle common context management."""
+  """A base class for MusicXML elements to handle common context management.
+
+  Instances are thin wrappers around their XML element. A parent only keeps
+  the element of each child, so the wrapper of an element that is not used
+  as a `with` block is discarded as soon as it has been attached.
+  """
 
+  __slots__ = ("element", "_context_token")
   schema = None
-  element: ET.Element
+  element: etree._Element | ET.Element
+  _tag = "music-element-base"
 
   def __init__(self, *args, **kwargs):
-    self.element = ET.Element(to_kebab_case(self.__class__.__name__))
-    global _current_context
-    previous_context = _current_context
-    _current_context = self
-    for k, v_args in kwargs.items():
-      if v_args is None:
-        continue
-      if k == "plain_text":
-        self.element.text = str(v_args)
-        continue
-      if k == k.lower():
-        namespace = getattr(self.__class__, k, "")
-        self.element.set(to_kebab_case(k, namespace), str(v_args))
-        continue
-      # Try to get the class from the musicxml_schema module first
-      music_schema_module = sys.modules.get("musicpy_schema")
-      child_class_type = getattr(self.__class__, k, None)
-      if child_class_type is None:
-        for base_class in inspect.getmro(self.__class__):
-          child_class_type = getattr(base_class, k, None)
-          if child_class_type is not None:
-            break
-      if child_class_type is None:
-        child_class_type = getattr(music_schema_module, k, None)
-      if isinstance(v_args, MusicElementBase):
-        raise ValueError("use _() instead.")
-      elif child_class_type and issubclass(child_class_type, MusicElementBase):
-        self.create_child(child_class_type, v_args)
-      else:
-        raise ValueError(f"No class found for {k}")
-    _current_context = previous_context
-    if _current_context:
-      _current_context.add_child(self)
+    session = _current_session.get(_default_session)
+    origin = (
+        _caller_origin() if session.validation_policy == "deferred" else None
+    )
+    self.element = build_element(type(self), kwargs, session, origin)
+    parent = _current_context.get()
+    if parent is not None:
+      parent.add_child(self)
 
   def init(self, **kwargs):
+    """Forwards the calling `__init__`'s arguments to the base constructor.
+
+    Only used by constructors that were not compiled by `AutoAlias`.
+    """
     caller_frame = inspect.currentframe().f_back
     MusicElementBase.__init__(**caller_frame.f_locals)
 
   def __enter__(self):
-    global _current_context
-    self.previous_context = _current_context  # For XML context management
-    _current_context = self
-
-    # For injecting class-level MusicElementBase instances into caller's locals
-    self._added_to_caller_locals = {}
-    caller_frame = inspect.currentframe().f_back
-
-    for cls in inspect.getmro(self.__class__):
-      for name, attr_value in cls.__dict__.items():
-        if inspect.isclass(attr_value) and issubclass(
-            attr_value, MusicElementBase
-        ):
-          if name not in caller_frame.f_locals:
-            caller_frame.f_locals[name] = attr_value  # Inject the class (type)
-            self._added_to_caller_locals[name] = attr_value
+    # For XML context management
+    self._context_token = _current_context.set(self)
+    writer = _current_session.get(_default_session).stream_writer
+    if writer is not None:
+      writer.enter(self.element)
     return self
 
   def __exit__(self, exc_type, exc_val, exc_tb):
-    global _current_context
-
-    # Restore caller's locals
-    caller_frame = inspect.currentframe().f_back
-    if hasattr(self, "_added_to_caller_locals"):
-      for name, original_value in self._added_to_caller_locals.items():
-        if (
-            name in caller_frame.f_locals
-            and caller_frame.f_locals[name] is original_value
-        ):
-          del caller_frame.f_locals[name]
-      del self._added_to_caller_locals  # Clean up
-
     # Restore XML context
-    _current_context = self.previous_context
-
-    self._validate_xml_subtree(allow_missing_elements=False)
+    _current_context.reset(self._context_token)
+    del self._context_token
+    parent = _current_context.get()
+
+    session = _current_session.get(_default_session)
+    policy = session.validation_policy
+    writer = session.stream_writer
+    if writer is not None and exc_type is not None:
+      writer.abort(exc_type, exc_val, exc_tb)
+    elif writer is None:
+      if policy == "eager":
+        self._validate_xml_subtree(allow_missing_elements=False)
+      elif policy == "deferred" and not isinstance(parent, MusicElementBase):
+        self._validate_document(session)
+        session.element_origins.clear()
+      session.backend.close(self.element, session)
+    else:
+      # Streamed containers no longer hold their written children, and in
+      # "deferred" mode the writer validates each subtree before dropping it.
+      if policy == "eager" and self._tag not in _StreamWriter.CONTAINERS:
+        self._validate_xml_subtree(allow_missing_elements=False)
+      writer.exit(self.element)
 
-    if not _current_context:
+    if parent is None:
       print(self)
     return False  # Propagate exceptions
 
@@ -345,61 +1182,86 @@ class MusicElementBase(metaclass=AutoAlias):
   def create_child(self, child_class: type["MusicElementBase"], arg: Any):
     if arg is None:
       return
-    if isinstance(arg, MusicElementArg):
-      child_class(*arg.args, **arg.kwargs)
-    elif isinstance(arg, tuple):
-      child_class(*arg)
-    elif isinstance(arg, dict):
-      child_class(**arg)
-    else:
-      child_class(arg)
+    session = _current_session.get(_default_session)
+    origin = (
+        _caller_origin() if session.validation_policy == "deferred" else None
+    )
+    self.element.append(_build_child(child_class, arg, session, origin))
 
   def sort(self):
     pass
 
+  def get_xml(self, indent: int | None = 2) -> str:
+    """Serializes this element, see `MusicPy.get_xml`.
+
+    Indentation is applied to the output only; the tree itself never holds
+    whitespace, so validating it or serializing it again stays cheap.
+    """
+    return _backend_of(self.element).tostring(self.element, indent)
+
   def __str__(self):
-    ET.indent(self.element)
-    return ET.tostring(self.element, encoding="unicode")
+    return self.get_xml()
 
-  def _validate_xml_subtree(self, allow_missing_elements=True):
-    if self.__class__.schema is None:
+  @classmethod
+  def _load_schema(cls) -> etree.XMLSchema | None:
+    """Returns the class schema for the current thread, None if unavailable."""
+    # Aliases have their own tag, so they must not inherit the base schema.
+    if cls.__dict__.get("schema") is None:
       try:
-        self.__class__.schema = create_schema(
-            to_kebab_case(self.__class__.__name__)
-        )
+        cls.schema = create_schema(cls._tag)
+        return cls.schema
       except Exception as e:
-        logging.warning(
-            f"Failed to create schema for {self.__class__.__name__}: {e}"
-        )
-        return True
+        logging.warning(f"Failed to create schema for {cls.__name__}: {e}")
+        # Do not retry for every instance of this class.
+        cls.schema = False
+    if not cls.schema:
+      return None
+    # `cls.schema` belongs to the thread that loaded it.
+    return create_schema(cls._tag)
+
+  def _validate_document(self, session: MusicPy):
+    """Validates the whole tree at once for the "deferred" policy."""
+    schema = self._load_schema()
+    if schema is None:
+      return True
+    return _validate_tree(self.element, schema, session)
+
+  def _validate_xml_subtree(self, allow_missing_elements=True):
+    schema = self._load_schema()
+    if schema is None:
+      return True
     try:
-      ET.indent(self.element)
-      xml_string_for_validation = ET.tostring(self.element, encoding="unicode")
-      instance_parser = etree.XMLParser(resolve_entities=True, load_dtd=False)
-      lxml_tree_for_validation = etree.fromstring(
-          xml_string_for_validation.encode("utf-8"), parser=instance_parser
-      )
-      self.schema.assertValid(lxml_tree_for_validation)
+      schema.assertValid(_backend_of(self.element).to_lxml(self.element))
       logging.info(f"Validated {self.element.tag}")
       return True
     except etree.DocumentInvalid as e:
-      stack = traceback.extract_stack()
-      # stack[-1] is this current method (_validate_xml_subtree)
-      # stack[-2] is the caller of _validate_xml_subtree
-      relevant_frame = stack[-3] if len(stack) > 2 else None
-      caller_info = "Unknown location"
-      if relevant_frame:
-        filename = os.path.basename(relevant_frame.filename)
-        caller_info = f"{filename}:{relevant_frame.lineno}"
+      origin = block_origin.get()
+      if origin is not None:
+        caller_info = _format_origin(origin)
+      else:
+        stack = traceback.extract_stack()
+        # stack[-1] is this current method (_validate_xml_subtree)
+        # stack[-2] is the caller of _validate_xml_subtree
+        relevant_frame = stack[-3] if len(stack) > 2 else None
+        caller_info = "Unknown location"
+        if relevant_frame:
+          filename = os.path.basename(relevant_frame.filename)
+          caller_info = f"{filename}:{relevant_frame.lineno}"
       if allow_missing_elements and "Missing" in str(e):
         return True
       logging.info(
           f"{caller_info}: Schema Validation Error for {self.element.tag}: {e}"
       )
+      # Validate an indented copy again to show the error in context.
+      xml_string_for_validation = _backend_of(self.element).tostring(
+          self.element, indent=2
+      )
+      schema.validate(etree.fromstring(xml_string_for_validation))
+      error_line = schema.error_log[0].line
       lineno = 0
       for line in xml_string_for_validation.splitlines():
         lineno += 1
-        if lineno < e.error_log[0].line - 3 or lineno > e.error_log[0].line + 3:
+        if lineno < error_line - 3 or lineno > error_line + 3:
           continue
         logging.info(f"{lineno} {line}")
       return False
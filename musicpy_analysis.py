@@ -0,0 +1,321 @@
+"""Vectorized analysis of the notes of partwise scores.
+
+`score_tables` extracts the notes, backups and forwards of each part of a
+score into a `NoteTable` of NumPy arrays, in document order. The functions
+below compute common statistics from a table without walking XML:
+
+  onsets             Start of every event in divisions, from `<chord/>`,
+                     `<backup>` and `<forward>` via cumulative sums.
+  measure_durations  Length of every measure in divisions.
+  voice_durations    Summed durations per measure and voice.
+  voice_counts       Number of notes per voice.
+  pitch_range        Lowest and highest pitch as MIDI note numbers.
+
+Scores built with the "columnar" backend are read from their
+`musicpy_columnar.NoteColumns` without restoring their notes.
+
+Durations are in the divisions in effect where they occur; a score that
+changes `<divisions>` part way through mixes units (see `NoteTable.divisions`).
+"""
+
+import dataclasses
+import math
+import numpy as np
+from lxml import etree
+import musicpy
+import musicpy_columnar
+
+# Values of `NoteTable.kind`.
+NOTE = 0
+BACKUP = 1
+FORWARD = 2
+
+# Semitones above C of the steps in `musicpy_columnar.STEPS`.
+_SEMITONES = np.array([9, 11, 0, 2, 4, 5, 7], dtype=np.int16)
+
+
+@dataclasses.dataclass
+class NoteTable:
+  """The notes, backups and forwards of one part, one row per event.
+
+  Attributes:
+    measure_numbers: The `number` attribute of every measure of the part.
+    measure: Index into `measure_numbers` of the measure of each event.
+    kind: `NOTE`, `BACKUP` or `FORWARD`.
+    chord: Whether a note has `<chord/>`, i.e. starts with the previous note.
+    rest: Whether a note is a rest.
+    step: Index into `musicpy_columnar.STEPS`, -1 if the note has no pitch.
+    alter: Chromatic alteration in semitones, 0 if not given.
+    octave: Octave of pitched notes, -1 otherwise.
+    duration: Duration in divisions, 0 for grace notes.
+    voice: Voice number, -1 if not given or not a number.
+    staff: Staff number, -1 if not given.
+    divisions: Divisions per quarter note in effect at each event.
+  """
+
+  measure_numbers: list[str]
+  measure: np.ndarray
+  kind: np.ndarray
+  chord: np.ndarray
+  rest: np.ndarray
+  step: np.ndarray
+  alter: np.ndarray
+  octave: np.ndarray
+  duration: np.ndarray
+  voice: np.ndarray
+  staff: np.ndarray
+  divisions: np.ndarray
+
+  def __len__(self) -> int:
+    return len(self.kind)
+
+
+_DTYPES = {
+    "measure": np.int32,
+    "kind": np.int8,
+    "chord": np.bool_,
+    "rest": np.bool_,
+    "step": np.int8,
+    "alter": np.float64,
+    "octave": np.int8,
+    "duration": np.float64,
+    "voice": np.int32,
+    "staff": np.int16,
+    "divisions": np.float64,
+}
+
+
+def _float(text: str | None, default: float = 0.0) -> float:
+  try:
+    return float(text)
+  except (TypeError, ValueError):
+    return default
+
+
+def _int(text: str | None) -> int:
+  try:
+    return int(text)
+  except (TypeError, ValueError):
+    return -1
+
+
+def _parse_note(note) -> tuple:
+  """Returns the values of a `note` element in `NoteTable` column order.
+
+  These are chord, rest, step, alter, octave, duration, voice and staff.
+  """
+  pitch = note.find("pitch")
+  if pitch is not None:
+    step = musicpy_columnar.STEPS.find(pitch.findtext("step") or "?")
+    alter = _float(pitch.findtext("alter"))
+    octave = _int(pitch.findtext("octave"))
+  else:
+    step, alter, octave = -1, 0.0, -1
+  return (
+      note.find("chord") is not None,
+      note.find("rest") is not None,
+      step,
+      alter,
+      octave if step >= 0 else -1,
+      _float(note.findtext("duration")),
+      _int(note.findtext("voice")),
+      _int(note.findtext("staff")),
+  )
+
+
+def _column_note(columns: musicpy_columnar.NoteColumns, row: int) -> tuple:
+  """Returns the values of `_parse_note` for a compacted note."""
+  flags = columns.flags[row]
+  alter = columns.alter[row]
+  duration = columns.duration[row]
+  return (
+      bool(flags & musicpy_columnar.CHORD),
+      bool(flags & musicpy_columnar.REST),
+      columns.step[row],
+      0.0 if math.isnan(alter) else alter,
+      columns.octave[row],
+      0.0 if math.isnan(duration) else duration,
+      columns.voice[row],
+      columns.staff[row],
+  )
+
+
+def _part_table(
+    part, columns: musicpy_columnar.NoteColumns | None
+) -> NoteTable:
+  """Extracts the events of a `part` element, see `score_tables`."""
+  rows = []
+  measure_numbers = []
+  divisions = 1.0
+  row = 0
+  for measure in part:
+    if measure.tag != "measure":
+      continue
+    index = len(measure_numbers)
+    measure_numbers.append(measure.get("number"))
+    for child in measure:
+      tag = child.tag
+      if tag == "note":
+        if (
+            columns is not None
+            and row < len(columns)
+            and not columns.flags[row] & musicpy_columnar.RAW
+        ):
+          values = _column_note(columns, row)
+        else:
+          values = _parse_note(child)
+        row += 1
+        rows.append((index, NOTE) + values + (divisions,))
+      elif tag in ("backup", "forward"):
+        rows.append((
+            index,
+            BACKUP if tag == "backup" else FORWARD,
+            False,
+            False,
+            -1,
+            0.0,
+            -1,
+            _float(child.findtext("duration")),
+            _int(child.findtext("voice")),
+            _int(child.findtext("staff")),
+            divisions,
+        ))
+      elif tag == "attributes":
+        divisions = _float(child.findtext("divisions"), divisions)
+  values = zip(*rows) if rows else ((),) * len(_DTYPES)
+  return NoteTable(
+      measure_numbers,
+      **{
+          name: np.array(column, dtype=dtype)
+          for (name, dtype), column in zip(_DTYPES.items(), values)
+      },
+  )
+
+
+def score_tables(score) -> dict[str, NoteTable]:
+  """Returns the `NoteTable` of every part of a partwise score, by part id.
+
+  Args:
+    score: A `musicpy.MusicPy` session that built a score, a `score-partwise`
+      element, or MusicXML as `str` or `bytes`.
+  """
+  columns_by_part = {}
+  if isinstance(score, musicpy.MusicPy):
+    if score.stream_writer is not None:
+      raise ValueError("The score was streamed and is not kept in memory.")
+    columns_by_part = getattr(score.backend, "columns", {})
+    root = score.child.element
+  elif isinstance(score, (str, bytes)):
+    root = etree.fromstring(
+        score.encode("utf-8") if isinstance(score, str) else score
+    )
+  else:
+    root = score
+  if root.tag != "score-partwise":
+    raise ValueError(f"Expected a partwise score, not {root.tag}")
+  return {
+      part.get("id"): _part_table(part, columns_by_part.get(part))
+      for part in root
+      if part.tag == "part"
+  }
+
+
+def _measure_positions(table: NoteTable) -> np.ndarray:
+  """Returns the position of each event within its measure, in divisions."""
+  notes = table.kind == NOTE
+  delta = np.where(
+      table.kind == BACKUP,
+      -table.duration,
+      np.where(notes & table.chord, 0.0, table.duration),
+  )
+  before = np.cumsum(delta) - delta
+  # Positions restart at the first event of every measure.
+  starts = np.flatnonzero(np.diff(table.measure, prepend=-1))
+  counts = np.diff(np.append(starts, len(table)))
+  before -= np.repeat(before[starts], counts)
+  # Chord notes start with the last note that was not one.
+  leading = np.where(notes & ~table.chord, np.arange(len(table)), 0)
+  before = np.where(
+      notes & table.chord, before[np.maximum.accumulate(leading)], before
+  )
+  return before
+
+
+def measure_durations(table: NoteTable) -> np.ndarray:
+  """Returns the length of every measure in divisions.
+
+  That is the latest end of any note or forward in it, so an incomplete
+  voice does not shorten a measure that another voice fills.
+  """
+  lengths = np.zeros(len(table.measure_numbers))
+  if len(table):
+    before = _measure_positions(table)
+    ends = np.where(table.kind == BACKUP, 0.0, before + table.duration)
+    np.maximum.at(lengths, table.measure, ends)
+  return lengths
+
+
+def onsets(table: NoteTable, absolute: bool = True) -> np.ndarray:
+  """Returns the start of every event in divisions.
+
+  Args:
+    table: The events of a part.
+    absolute: Whether to count from the start of the part, as the sum of the
+      `measure_durations` of the measures before, instead of from the start
+      of each event's measure.
+  """
+  if not len(table):
+    return np.zeros(0)
+  before = _measure_positions(table)
+  if not absolute:
+    return before
+  lengths = measure_durations(table)
+  return before + (np.cumsum(lengths) - lengths)[table.measure]
+
+
+def voice_durations(table: NoteTable) -> tuple[np.ndarray, np.ndarray]:
+  """Sums the durations of the notes and forwards of each voice per measure.
+
+  Chord notes are not counted, since they do not advance time.
+
+  Returns:
+    The voices, and a (measure, voice) matrix of summed durations.
+  """
+  counted = (table.kind == FORWARD) | ((table.kind == NOTE) & ~table.chord)
+  voices, voice_index = np.unique(table.voice[counted], return_inverse=True)
+  measures = len(table.measure_numbers)
+  sums = np.bincount(
+      table.measure[counted] * len(voices) + voice_index,
+      weights=table.duration[counted],
+      minlength=measures * len(voices),
+  )
+  return voices, sums.reshape(measures, len(voices))
+
+
+def voice_counts(table: NoteTable) -> dict[int, int]:
+  """Returns the number of notes (including rests and chord notes) per voice."""
+  voices, counts = np.unique(
+      table.voice[table.kind == NOTE], return_counts=True
+  )
+  return dict(zip(voices.tolist(), counts.tolist()))
+
+
+def midi_pitches(table: NoteTable) -> np.ndarray:
+  """Returns the MIDI note number of every event, NaN if it has no pitch."""
+  pitched = table.step >= 0
+  return np.where(
+      pitched,
+      12 * (table.octave.astype(np.float64) + 1)
+      + _SEMITONES[np.where(pitched, table.step, 0)]
+      + table.alter,
+      np.nan,
+  )
+
+
+def pitch_range(table: NoteTable) -> tuple[float, float] | None:
+  """Returns the lowest and highest MIDI note number, None without pitches."""
+  pitches = midi_pitches(table)
+  pitches = pitches[~np.isnan(pitches)]
+  if not len(pitches):
+    return None
+  return float(pitches.min()), float(pitches.max())
@@ -1,6 +1,19 @@
 import argparse
 import ast
-import textwrap
+import collections
+import functools
+import hashlib
+import logging
+import marshal
+import os
+import sys
+import threading
+import types
+import musicpy
+from musicpy import MusicPy, ScopedNames
+import musicpy_cache
+import musicpy_schema
+import musicpy_xsd
 
 
 def _get_callable_name(node):
@@ -71,8 +84,8 @@ def get_ast_node_types(file_path):
     return is_vallina_musicpy(source.read())
 
 
-def is_vallina_musicpy(musicpy: str) -> bool:
-  tree = ast.parse(musicpy)
+def is_vallina_musicpy(musicpy: str | ast.Module) -> bool:
+  tree = ast.parse(musicpy) if isinstance(musicpy, str) else musicpy
   node_types = set()
   invoked_callables = set()
   for node in ast.walk(tree):
@@ -97,13 +110,371 @@ with MusicPy() as __score:
 """
 
 
-def safe_exec_musicpy(musicpy: str) -> str:
-  """Safely executes the musicpy code and returns the result."""
-  result = {}
-  if not is_vallina_musicpy(musicpy)[0]:
-    raise ValueError("musicpy not vallina")
-  exec(PREEMBLE + textwrap.indent(musicpy, "  "), {}, result)
-  return str(result["__score"].get_xml())
+def strip_imports(musicpy: str) -> str:
+  """Drops the import lines of a musicpy score.
+
+  Scores may start with `from ... import *` lines so that they can be opened
+  in an editor; the sandbox provides those names itself.
+  """
+  return "\n".join(
+      line
+      for line in musicpy.splitlines()
+      if not line.startswith(("from ", "import "))
+  )
+
+
+def _wrap(tree: ast.Module) -> ast.Module:
+  """Puts the statements of `tree` into the `with` block of `PREEMBLE`.
+
+  The statements keep their locations, so line numbers in errors and element
+  origins are those of the musicpy source.
+  """
+  wrapper = ast.parse(PREEMBLE + "  pass\n")
+  wrapper.body[-1].body = tree.body
+  return wrapper
+
+
+# File name of sandboxed code in error messages and element origins.
+_FILENAME = "<string>"
+
+# Compiled sandboxed code by `_code_key`, least recently used first.
+_CODE_CACHE_SIZE = 64
+_codes = collections.OrderedDict()
+_codes_lock = threading.Lock()
+
+
+def _code_key(musicpy: str) -> str:
+  # Code objects are specific to the interpreter, and PREEMBLE to musicpy.
+  digest = hashlib.sha256()
+  for part in (
+      sys.implementation.cache_tag or "",
+      musicpy_cache.musicpy_version(),
+      musicpy,
+  ):
+    digest.update(part.encode("utf-8") + b"\0")
+  return digest.hexdigest()
+
+
+@functools.cache
+def _code_disk_cache() -> musicpy_cache.DiskCache | None:
+  """Returns the on-disk tier of the code cache, None if disabled.
+
+  Its size is MUSICPY_CODE_DISK_CACHE_MB (default 256, 0 disables it), under
+  $MUSICPY_CACHE_DIR/code.
+  """
+  max_bytes = int(os.environ.get("MUSICPY_CODE_DISK_CACHE_MB", "256")) << 20
+  if max_bytes <= 0:
+    return None
+  return musicpy_cache.DiskCache(
+      os.path.join(musicpy_xsd.cache_dir(), "code"), max_bytes, ".marshal"
+  )
+
+
+# `(source, tree)` of the last `parse_musicpy`.
+_last_parse = None
+
+
+def parse_musicpy(musicpy: str) -> ast.Module:
+  """Parses musicpy source, reusing the tree of the last call for it.
+
+  This lets the build (`_plan`, `compile_musicpy`) and checks of the same
+  source, like `musicpy_timeline.check_timeline`, share one parse. Only the
+  last tree is kept, since the tree of a large score takes many times the
+  memory of its source. Callers must not modify the tree.
+
+  Raises:
+    SyntaxError: If `musicpy` is not valid Python.
+  """
+  global _last_parse
+  last = _last_parse
+  if last is not None and last[0] == musicpy:
+    return last[1]
+  tree = ast.parse(musicpy)
+  _last_parse = musicpy, tree
+  return tree
+
+
+def compile_musicpy(musicpy: str) -> types.CodeType:
+  """Checks musicpy source and compiles it for `safe_exec_musicpy`.
+
+  The source is parsed once, for both the check and the compilation. Code
+  that passed the check is cached in memory and, marshalled, on disk (see
+  `_code_disk_cache`), so compiling the same source again skips both.
+
+  Raises:
+    SyntaxError: If `musicpy` is not valid Python.
+    ValueError: If `musicpy` is empty or not vanilla musicpy, see
+      `is_vallina_musicpy`.
+  """
+  key = _code_key(musicpy)
+  with _codes_lock:
+    code = _codes.get(key)
+    if code is not None:
+      _codes.move_to_end(key)
+      return code
+  disk = _code_disk_cache()
+  data = disk.get(key) if disk is not None else None
+  if data is not None:
+    try:
+      code = marshal.loads(data)
+    except (EOFError, ValueError, TypeError) as e:
+      logging.warning(f"Ignoring corrupt {disk.path(key)}: {e}")
+  if code is None:
+    tree = parse_musicpy(musicpy)
+    if not tree.body:
+      raise ValueError("musicpy is empty")
+    if not is_vallina_musicpy(tree)[0]:
+      raise ValueError("musicpy not vallina")
+    code = compile(_wrap(tree), _FILENAME, "exec")
+    if disk is not None:
+      disk.put(key, marshal.dumps(code))
+  with _codes_lock:
+    _codes[key] = code
+    if len(_codes) > _CODE_CACHE_SIZE:
+      _codes.popitem(last=False)
+  return code
+
+
+# Whether `safe_exec_musicpy` builds scores with the evaluator below rather than
+# `exec`. Both produce the same XML; the evaluator skips compiling the source
+# and instantiating element classes.
+EVALUATOR = os.environ.get("MUSICPY_EVALUATOR", "1") != "0"
+
+
+class _Unsupported(Exception):
+  """A construct that the evaluator leaves to `exec`."""
+
+
+def _lower_value(node: ast.expr):
+  """Evaluates an argument: a constant, a tuple of them, or `_(...)`."""
+  if isinstance(node, ast.Constant):
+    return node.value
+  if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+    return -_lower_value(node.operand)
+  if isinstance(node, ast.Tuple):
+    return tuple(_lower_value(element) for element in node.elts)
+  if (
+      isinstance(node, ast.Call)
+      and isinstance(node.func, ast.Name)
+      and node.func.id == "_"
+  ):
+    return musicpy.MusicElementArg(*_lower_arguments(node))
+  raise _Unsupported(type(node).__name__)
+
+
+def _lower_arguments(call: ast.Call) -> tuple[tuple, dict]:
+  keywords = {}
+  for keyword in call.keywords:
+    if keyword.arg is None:
+      raise _Unsupported("**")
+    keywords[keyword.arg] = _lower_value(keyword.value)
+  return tuple(_lower_value(arg) for arg in call.args), keywords
+
+
+def _lower_call(node: ast.expr) -> tuple:
+  if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Name):
+    raise _Unsupported(type(node).__name__)
+  name = node.func.id
+  if name[0].islower():
+    raise _Unsupported(name)
+  return (node.lineno, name) + _lower_arguments(node)
+
+
+def _lower(statements: list[ast.stmt]) -> tuple:
+  """Translates vetted musicpy statements into a plan for `_Evaluator`.
+
+  Every element of the plan is `(lineno, class name, args, kwargs, target,
+  body, with_lineno)`, where the arguments are already evaluated, `target` is
+  the name of `with ... as target`, `body` the plan of the `with` block and
+  `with_lineno` the line of its `with` statement, both None for elements that
+  are not used as one. `with A(), B():` becomes `B` nested in `A`.
+
+  Raises:
+    _Unsupported: For anything outside the subset of Python that the
+      evaluator implements, which is narrower than `is_vallina_musicpy`.
+  """
+  plan = []
+  for statement in statements:
+    if isinstance(statement, ast.Expr):
+      if not isinstance(statement.value, ast.Constant):
+        plan.append(_lower_call(statement.value) + (None, None, None))
+    elif isinstance(statement, ast.With):
+      body = _lower(statement.body)
+      for item in reversed(statement.items):
+        target = item.optional_vars
+        if target is not None:
+          if not isinstance(target, ast.Name) or target.id == "_":
+            raise _Unsupported(type(target).__name__)
+          target = target.id
+        body = (
+            _lower_call(item.context_expr)
+            + (target, body, statement.lineno),
+        )
+      plan.extend(body)
+    elif not isinstance(statement, ast.Pass):
+      raise _Unsupported(type(statement).__name__)
+  return tuple(plan)
+
+
+class _Evaluator:
+  """Builds a score from a plan of `_lower`, without `exec`.
+
+  Element classes are resolved like `ScopedNames` does for `exec`: the names
+  PREEMBLE imports and `with ... as` binds first, then the classes nested in
+  the open blocks, outermost first. Elements are built by
+  `musicpy.build_element` without instantiating their class; only `with`
+  blocks get a wrapper, whose `__enter__` and `__exit__` validate, stream or
+  compact them as usual.
+  """
+
+  def __init__(self, session: musicpy.MusicPy, bindings: dict):
+    """Initializes the evaluator.
+
+    Args:
+      session: The session to build the score in.
+      bindings: `(class, bound arguments)` by `id` of the plan entry, shared
+        by the runs of a plan so that its arguments are bound only once.
+    """
+    self.session = session
+    self.bindings = bindings
+    self.deferred = session.validation_policy == "deferred"
+    self.names = {
+        name: getattr(musicpy_schema, name) for name in musicpy_schema.__all__
+    }
+    self.names["MusicPy"] = musicpy.MusicPy
+    self.names["__score"] = session
+    self.scopes = []  # Classes of the open `with` blocks.
+
+  def element_class(self, name: str) -> type:
+    cls = self.names.get(name)
+    if cls is None:
+      for scope in self.scopes:
+        cls = musicpy.nested_classes_of(scope).get(name)
+        if cls is not None:
+          break
+    if not isinstance(cls, musicpy.AutoAlias):
+      # Builtins, unknown names and non-element values.
+      raise _Unsupported(name)
+    return cls
+
+  def run(self, plan: tuple, parent):
+    """Builds the elements of `plan` into `parent`, None for the session."""
+    build = musicpy.build_element
+    session = self.session
+    bindings = self.bindings
+    for entry in plan:
+      lineno, name, args, kwargs, target, body, with_lineno = entry
+      cls = self.element_class(name)
+      binding = bindings.get(id(entry))
+      if binding is None or binding[0] is not cls:
+        binding = cls, musicpy.bind_arguments(cls, args, kwargs)
+        bindings[id(entry)] = binding
+      element = build(
+          cls,
+          binding[1],
+          session,
+          (_FILENAME, lineno) if self.deferred else None,
+      )
+      if parent is not None:
+        parent.append(element)
+        if body is None:
+          continue
+      wrapper = cls.__new__(cls)
+      wrapper.element = element
+      if parent is None:
+        session.add_child(wrapper)
+      if body is None:
+        continue
+      if target is not None:
+        self.names[target] = wrapper
+      self.scopes.append(cls)
+      # Where eager validation reports the errors of the block, see
+      # `musicpy.block_origin`.
+      token = musicpy.block_origin.set((_FILENAME, with_lineno))
+      try:
+        with wrapper:
+          self.run(body, element)
+      finally:
+        musicpy.block_origin.reset(token)
+        self.scopes.pop()
+
+
+# `(plan, bindings)` of `_Evaluator` by `_code_key`, least recently used
+# first. None marks sources that need `exec`.
+_PLAN_CACHE_SIZE = 64
+_plans = collections.OrderedDict()
+
+
+def _plan(musicpy: str) -> tuple | None:
+  """Returns the cached `_lower` plan of `musicpy` and its bindings.
+
+  Returns:
+    `(plan, bindings)` for `_Evaluator`, None if the source is unsupported.
+  """
+  key = _code_key(musicpy)
+  with _codes_lock:
+    if key in _plans:
+      _plans.move_to_end(key)
+      return _plans[key]
+  tree = parse_musicpy(musicpy)
+  if not tree.body:
+    raise ValueError("musicpy is empty")
+  try:
+    plan = _lower(tree.body)
+  except (_Unsupported, TypeError) as e:
+    logging.info(f"Executing musicpy with exec, the evaluator lacks {e}")
+    _remember_plan(key, None)
+    return None
+  planned = plan, {}
+  _remember_plan(key, planned)
+  return planned
+
+
+def _remember_plan(key: str, planned: tuple | None):
+  with _codes_lock:
+    _plans[key] = planned
+    _plans.move_to_end(key)
+    if len(_plans) > _PLAN_CACHE_SIZE:
+      _plans.popitem(last=False)
+
+
+def evaluate_musicpy(musicpy: str, indent: int | None = 2) -> str | None:
+  """Builds a score like `safe_exec_musicpy`, but without `exec`.
+
+  Returns:
+    The XML, or None if the source uses constructs that only `exec` runs.
+    Sources that `is_vallina_musicpy` rejects are always among those.
+  """
+  planned = _plan(musicpy)
+  if planned is None:
+    return None
+  plan, bindings = planned
+  try:
+    with MusicPy() as session:
+      _Evaluator(session, bindings).run(plan, None)
+  except _Unsupported as e:
+    logging.info(f"Executing musicpy with exec, the evaluator lacks {e}")
+    _remember_plan(_code_key(musicpy), None)
+    return None
+  return str(session.get_xml(indent))
+
+
+def safe_exec_musicpy(musicpy: str, indent: int | None = 2) -> str:
+  """Safely executes the musicpy code and returns the result.
+
+  Args:
+    musicpy: The musicpy source code.
+    indent: Indentation of the returned XML, or None for compact output.
+  """
+  if EVALUATOR:
+    xml = evaluate_musicpy(musicpy, indent)
+    if xml is not None:
+      return xml
+  code = compile_musicpy(musicpy)
+  # Resolves the nested names of open blocks, e.g. `Staff` in `with Note():`.
+  result = ScopedNames()
+  exec(code, {}, result)
+  return str(result["__score"].get_xml(indent))
 
 
 def print_ast_node_field_values(file_path):
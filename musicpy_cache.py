@@ -0,0 +1,249 @@
+"""Content-addressed cache of the MusicXML built from musicpy source.
+
+Building a score means parsing, checking and executing its whole source, so
+the apps cache the result of `musicpy_ast.safe_exec_musicpy` by the SHA-256 of
+everything it depends on: the source, the output indentation, the musicpy
+version (a hash of the modules that build and check scores, see
+`musicpy_version`) and the MusicXML schema version. Entries never go stale;
+a changed library or schema simply produces different keys.
+
+There are two tiers: an in-memory LRU bounded by the size of its entries, and
+an optional directory of `<key>.musicxml` files, evicted least recently used
+first once they exceed their size limit (`DiskCache`, which also holds the
+compiled code of `musicpy_ast.compile_musicpy`). Only successful builds are
+cached.
+
+Environment variables:
+  MUSICPY_XML_CACHE_MB: Size of the in-memory tier of the default cache.
+    Defaults to 64.
+  MUSICPY_XML_DISK_CACHE_MB: Size of the on-disk tier of the default cache,
+    under $MUSICPY_CACHE_DIR/xml. Defaults to 0, which disables it.
+"""
+
+import collections
+import functools
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import musicpy_xsd
+
+# The modules whose code determines the output for a given source.
+_VERSIONED_MODULES = (
+    "musicpy.py",
+    "musicpy_schema.py",
+    "musicpy_ast.py",
+    "musicpy_columnar.py",
+)
+_SUFFIX = ".musicxml"
+
+
+@functools.cache
+def musicpy_version() -> str:
+  """Returns a hash of the source of the modules that build scores."""
+  directory = os.path.dirname(os.path.abspath(__file__))
+  digest = hashlib.sha256()
+  for name in _VERSIONED_MODULES:
+    with open(os.path.join(directory, name), "rb") as f:
+      digest.update(name.encode("utf-8") + b"\0" + f.read() + b"\0")
+  return digest.hexdigest()[:16]
+
+
+@functools.cache
+def _schema_version() -> str:
+  return musicpy_xsd.schema_version()
+
+
+def cache_key(musicpy: str, indent: int | None = 2) -> str:
+  """Returns the key of the XML built from `musicpy` with `indent`."""
+  digest = hashlib.sha256()
+  for part in (musicpy_version(), _schema_version(), repr(indent), musicpy):
+    digest.update(part.encode("utf-8") + b"\0")
+  return digest.hexdigest()
+
+
+class DiskCache:
+  """A directory of files by key, with a size limit. Thread-safe.
+
+  Once the files exceed the limit, the least recently used (by modification
+  time, which reads update) are removed down to 90% of it.
+  """
+
+  def __init__(self, directory: str, max_bytes: int, suffix: str):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.suffix = suffix
+    self._lock = threading.Lock()
+    self._bytes = None  # Computed on the first write.
+
+  def path(self, key: str) -> str:
+    return os.path.join(self.directory, key + self.suffix)
+
+  def get(self, key: str) -> bytes | None:
+    try:
+      with open(self.path(key), "rb") as f:
+        data = f.read()
+      os.utime(self.path(key))
+    except OSError:
+      return None
+    return data
+
+  def put(self, key: str, data: bytes):
+    """Stores `data`, logging instead of raising if the disk fails."""
+    try:
+      os.makedirs(self.directory, exist_ok=True)
+      fd, staging = tempfile.mkstemp(dir=self.directory, prefix=".")
+      with os.fdopen(fd, "wb") as f:
+        f.write(data)
+      os.replace(staging, self.path(key))
+      with self._lock:
+        if self._bytes is None:
+          self._bytes = sum(size for _, size, _ in self._entries())
+        else:
+          self._bytes += len(data)
+        if self._bytes > self.max_bytes:
+          self._evict()
+    except OSError as e:
+      logging.warning(f"Could not write {self.path(key)}: {e}")
+
+  def _entries(self) -> list[tuple[float, int, str]]:
+    """Returns (modification time, size, path) of the files."""
+    entries = []
+    with os.scandir(self.directory) as scan:
+      for entry in scan:
+        # Names starting with "." are files being written.
+        if entry.name.endswith(self.suffix) and entry.name[0] != ".":
+          try:
+            stat = entry.stat()
+          except OSError:
+            continue  # Evicted by another process.
+          entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+  def _evict(self):
+    entries = sorted(self._entries())
+    total = sum(size for _, size, _ in entries)
+    target = self.max_bytes * 9 // 10
+    for _, size, path in entries:
+      if total <= target:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+      total -= size
+    self._bytes = total
+
+
+class XmlCache:
+  """A two-tier cache of MusicXML strings by `cache_key`. Thread-safe."""
+
+  def __init__(
+      self,
+      max_memory_bytes: int = 64 << 20,
+      directory: str | None = None,
+      max_disk_bytes: int = 0,
+  ):
+    """Initializes the cache.
+
+    Args:
+      max_memory_bytes: Size limit of the in-memory tier, counted as the
+        UTF-8 size of the entries.
+      directory: Where to keep the on-disk tier, None to disable it.
+      max_disk_bytes: Size limit of the on-disk tier.
+    """
+    self.max_memory_bytes = max_memory_bytes
+    self.disk = None
+    if directory is not None and max_disk_bytes > 0:
+      self.disk = DiskCache(directory, max_disk_bytes, _SUFFIX)
+    self.hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    # (xml, size) by key, least recently used first.
+    self._entries = collections.OrderedDict()
+    self._memory_bytes = 0
+
+  def get(self, key: str) -> str | None:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+    data = self.disk.get(key) if self.disk is not None else None
+    if data is not None:
+      xml = data.decode("utf-8")
+      self._remember(key, xml)
+      with self._lock:
+        self.disk_hits += 1
+      return xml
+    with self._lock:
+      self.misses += 1
+    return None
+
+  def put(self, key: str, xml: str):
+    self._remember(key, xml)
+    if self.disk is not None:
+      self.disk.put(key, xml.encode("utf-8"))
+
+  def _remember(self, key: str, xml: str):
+    size = len(xml) if xml.isascii() else len(xml.encode("utf-8"))
+    if size > self.max_memory_bytes:
+      return
+    with self._lock:
+      previous = self._entries.pop(key, None)
+      if previous is not None:
+        self._memory_bytes -= previous[1]
+      self._entries[key] = (xml, size)
+      self._memory_bytes += size
+      while self._memory_bytes > self.max_memory_bytes:
+        _, (_, evicted_size) = self._entries.popitem(last=False)
+        self._memory_bytes -= evicted_size
+
+  def clear(self):
+    """Empties the in-memory tier."""
+    with self._lock:
+      self._entries.clear()
+      self._memory_bytes = 0
+
+
+@functools.cache
+def default_cache() -> XmlCache:
+  """Returns the process-wide cache, configured from the environment."""
+  return XmlCache(
+      max_memory_bytes=int(os.environ.get("MUSICPY_XML_CACHE_MB", "64")) << 20,
+      directory=os.path.join(musicpy_xsd.cache_dir(), "xml"),
+      max_disk_bytes=int(os.environ.get("MUSICPY_XML_DISK_CACHE_MB", "0"))
+      << 20,
+  )
+
+
+def safe_exec_musicpy(
+    musicpy: str,
+    indent: int | None = 2,
+    cache: XmlCache | None = None,
+    sandbox=None,
+) -> str:
+  """`musicpy_ast.safe_exec_musicpy`, skipped if the result is cached.
+
+  Args:
+    musicpy: The musicpy source code.
+    indent: Indentation of the returned XML, or None for compact output.
+    cache: The cache to use, defaults to `default_cache()`.
+    sandbox: A `musicpy_sandbox.SandboxPool` to build the score in, instead
+      of this process.
+  """
+  import musicpy_ast  # Which uses `DiskCache` for compiled code.
+
+  cache = default_cache() if cache is None else cache
+  key = cache_key(musicpy, indent)
+  xml = cache.get(key)
+  if xml is None:
+    if sandbox is not None:
+      xml = sandbox.run(musicpy, indent)
+    else:
+      xml = musicpy_ast.safe_exec_musicpy(musicpy, indent)
+    cache.put(key, xml)
+  return xml
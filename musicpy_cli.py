@@ -0,0 +1,325 @@
+"""Command-line entry point of musicpy.
+
+Commands:
+  build  Compiles every `.py` score under a directory to `.musicxml`, in
+         the worker processes of a `musicpy_sandbox.SandboxPool`. Each score
+         is built by a fresh worker with a wall-clock and memory limit, so a
+         score that fails, even by killing its worker, fails alone. With
+         `--svg`, the pages of each score are also rendered by
+         `musicpy_render` to `<score>-<page>.svg`. Scores are skipped if
+         neither their source nor musicpy, the MusicXML schema (see
+         `musicpy_cache.cache_key`) or, for SVG, verovio changed since their
+         last successful build, as recorded in `BUILD_MANIFEST` in the output
+         directory, unless `--force` is given.
+
+Usage:
+  python musicpy_cli.py build SOURCE_DIR [--output OUTPUT_DIR] [--jobs 8]
+      [--timeout 60] [--memory-limit 2048] [--svg] [--force]
+"""
+
+import argparse
+import concurrent.futures
+import dataclasses
+import hashlib
+import json
+import os
+import sys
+import time
+import musicpy_ast
+import musicpy_cache
+import musicpy_sandbox
+
+BUILD_MANIFEST = ".musicpy-build.json"
+
+
+@dataclasses.dataclass
+class BuildResult:
+  """The outcome of building one score.
+
+  Attributes:
+    path: The score, relative to the source directory.
+    digest: The `source_digest` of the score source.
+    status: "built", "skipped" or "failed".
+    seconds: Time spent building, 0 if skipped.
+    source_bytes: Size of the score source.
+    output_bytes: Size of the written MusicXML and SVG, 0 unless built.
+    pages: Number of SVG pages written.
+    error: Why the build failed.
+  """
+
+  path: str
+  digest: str
+  status: str
+  seconds: float = 0.0
+  source_bytes: int = 0
+  output_bytes: int = 0
+  pages: int = 0
+  error: str | None = None
+
+
+def source_digest(source: bytes) -> str:
+  """Returns the key of the MusicXML built from `source`.
+
+  It changes with the source, but also with musicpy and the schema, see
+  `musicpy_cache.cache_key`.
+  """
+  return musicpy_cache.cache_key(source.decode("utf-8", "replace"))
+
+
+def find_scores(directory: str) -> list[str]:
+  """Returns the `.py` files under `directory`, relative to it, sorted."""
+  scores = []
+  for root, dirs, files in os.walk(directory):
+    dirs[:] = sorted(d for d in dirs if not d.startswith((".", "__")))
+    for name in files:
+      if name.endswith(".py"):
+        scores.append(
+            os.path.relpath(os.path.join(root, name), directory)
+        )
+  return sorted(scores)
+
+
+def output_path(output_dir: str, score: str) -> str:
+  return os.path.join(output_dir, os.path.splitext(score)[0] + ".musicxml")
+
+
+def svg_path(output_dir: str, score: str, page: int) -> str:
+  return os.path.join(output_dir, f"{os.path.splitext(score)[0]}-{page}.svg")
+
+
+def _load_manifest(output_dir: str) -> dict[str, str]:
+  try:
+    with open(os.path.join(output_dir, BUILD_MANIFEST)) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+
+def _save_manifest(output_dir: str, manifest: dict[str, str]):
+  path = os.path.join(output_dir, BUILD_MANIFEST)
+  with open(path + ".tmp", "w") as f:
+    json.dump(manifest, f, indent=1, sort_keys=True)
+  os.replace(path + ".tmp", path)
+
+
+def _manifest_digest(digest: str, svg: bool) -> str:
+  """Returns what the manifest records for a score built from `digest`."""
+  if not svg:
+    return digest
+  import musicpy_render
+
+  return hashlib.sha256(
+      f"{digest}\0svg\0{musicpy_render.VEROVIO_VERSION}".encode("utf-8")
+  ).hexdigest()
+
+
+def _write(path: str, data: bytes):
+  os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+  with open(path + ".tmp", "wb") as f:
+    f.write(data)
+  os.replace(path + ".tmp", path)
+
+
+def _build(
+    pool: musicpy_sandbox.SandboxPool,
+    source: str,
+    output_dir: str,
+    score: str,
+    svg: bool,
+) -> tuple:
+  """Builds one score in `pool` and writes its outputs.
+
+  Returns:
+    The seconds spent, the size of the output, the number of SVG pages and
+    the error, if any.
+  """
+  start = time.perf_counter()
+  try:
+    xml = pool.run(musicpy_ast.strip_imports(source))
+  except MemoryError:
+    return time.perf_counter() - start, 0, 0, "Out of memory"
+  except Exception as e:
+    return time.perf_counter() - start, 0, 0, f"{type(e).__name__}: {e}"
+  outputs = [(output_path(output_dir, score), xml.encode("utf-8"))]
+  if svg:
+    import musicpy_render
+
+    try:
+      pages = musicpy_render.render_xml(xml)
+    except Exception as e:
+      return time.perf_counter() - start, 0, 0, f"{type(e).__name__}: {e}"
+    for page, page_svg in enumerate(pages, 1):
+      outputs.append((svg_path(output_dir, score, page), page_svg.encode()))
+    # Drop the pages of a longer earlier build.
+    page = len(pages) + 1
+    while os.path.exists(svg_path(output_dir, score, page)):
+      os.remove(svg_path(output_dir, score, page))
+      page += 1
+  for path, data in outputs:
+    _write(path, data)
+  return (
+      time.perf_counter() - start,
+      sum(len(data) for _, data in outputs),
+      len(outputs) - 1,
+      None,
+  )
+
+
+def build(
+    source_dir: str,
+    output_dir: str | None = None,
+    jobs: int | None = None,
+    timeout: float = 60,
+    memory_limit_mb: int = 2048,
+    force: bool = False,
+    report=None,
+    svg: bool = False,
+) -> list[BuildResult]:
+  """Builds the scores under `source_dir`, see the module docstring.
+
+  Args:
+    source_dir: Directory to search for `.py` scores.
+    output_dir: Where to write the `.musicxml` files, mirroring the layout of
+      `source_dir`. Defaults to `source_dir`.
+    jobs: Number of worker processes, defaults to the number of CPUs.
+    timeout: Seconds a score may take to build, 0 for no limit.
+    memory_limit_mb: Address space limit of the worker building each score,
+      0 for no limit.
+    force: Whether to rebuild scores whose `source_digest` is unchanged.
+    report: Called with each `BuildResult` as it completes.
+    svg: Whether to render the pages of each score to SVG too.
+
+  Returns:
+    The result of every score, in path order.
+  """
+  output_dir = source_dir if output_dir is None else output_dir
+  manifest = _load_manifest(output_dir)
+  results = {}
+  pending = {}
+  for score in find_scores(source_dir):
+    with open(os.path.join(source_dir, score), "rb") as f:
+      source = f.read()
+    digest = _manifest_digest(source_digest(source), svg)
+    result = BuildResult(score, digest, "skipped", source_bytes=len(source))
+    if (
+        not force
+        and manifest.get(score) == digest
+        and os.path.exists(output_path(output_dir, score))
+    ):
+      results[score] = result
+      if report is not None:
+        report(result)
+    else:
+      pending[score] = result, source.decode("utf-8", "replace")
+
+  if pending:
+    jobs = jobs or os.cpu_count() or 1
+    # Every score gets a fresh worker, and with it the whole memory limit.
+    with musicpy_sandbox.SandboxPool(
+        workers=min(jobs, len(pending)),
+        timeout=timeout or None,
+        cpu_seconds=0,
+        memory_limit_mb=memory_limit_mb,
+        max_jobs=1,
+    ) as pool, concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+      futures = {
+          executor.submit(_build, pool, source, output_dir, score, svg): score
+          for score, (_, source) in pending.items()
+      }
+      for future in concurrent.futures.as_completed(futures):
+        result = pending[futures[future]][0]
+        result.seconds, result.output_bytes, result.pages, result.error = (
+            future.result()
+        )
+        result.status = "failed" if result.error else "built"
+        if result.status == "built":
+          manifest[result.path] = result.digest
+        else:
+          manifest.pop(result.path, None)
+        results[result.path] = result
+        if report is not None:
+          report(result)
+    os.makedirs(output_dir, exist_ok=True)
+    _save_manifest(output_dir, manifest)
+  return [results[score] for score in sorted(results)]
+
+
+def summarize(results: list[BuildResult], seconds: float) -> str:
+  """Returns the throughput summary of a build that took `seconds`."""
+  counts = {
+      status: sum(1 for result in results if result.status == status)
+      for status in ("built", "skipped", "failed")
+  }
+  built = [result for result in results if result.status == "built"]
+  source_mb = sum(result.source_bytes for result in built) / 1e6
+  output_mb = sum(result.output_bytes for result in built) / 1e6
+  lines = [
+      f"{len(results)} scores in {seconds:.1f} s: {counts['built']} built,"
+      f" {counts['skipped']} skipped, {counts['failed']} failed"
+  ]
+  if built and seconds > 0:
+    slowest = max(built, key=lambda result: result.seconds)
+    lines.append(
+        f"{len(built) / seconds:.1f} scores/s, {source_mb / seconds:.2f} MB"
+        f" source/s, {output_mb / seconds:.2f} MB output/s; slowest"
+        f" {slowest.path} ({slowest.seconds:.2f} s)"
+    )
+  return "\n".join(lines)
+
+
+def _print_result(result: BuildResult):
+  if result.status == "failed":
+    print(f"failed   {result.path}: {result.error}", flush=True)
+  elif result.status == "built":
+    print(f"built    {result.path} ({result.seconds:.2f} s)", flush=True)
+
+
+def main(argv: list[str] | None = None) -> int:
+  parser = argparse.ArgumentParser(
+      prog="musicpy", description=__doc__.splitlines()[0]
+  )
+  commands = parser.add_subparsers(dest="command", required=True)
+  build_parser = commands.add_parser(
+      "build", help="Compile a directory of scores to MusicXML."
+  )
+  build_parser.add_argument("source_dir")
+  build_parser.add_argument(
+      "--output", help="Output directory, defaults to SOURCE_DIR."
+  )
+  build_parser.add_argument(
+      "--jobs", type=int, help="Worker processes, defaults to the CPU count."
+  )
+  build_parser.add_argument(
+      "--timeout", type=float, default=60, help="Seconds per score."
+  )
+  build_parser.add_argument(
+      "--memory-limit",
+      type=int,
+      default=2048,
+      help="Memory limit per worker in MB.",
+  )
+  build_parser.add_argument(
+      "--svg", action="store_true", help="Render the pages to SVG too."
+  )
+  build_parser.add_argument(
+      "--force", action="store_true", help="Rebuild unchanged scores too."
+  )
+  args = parser.parse_args(argv)
+
+  start = time.perf_counter()
+  results = build(
+      args.source_dir,
+      args.output,
+      jobs=args.jobs,
+      timeout=args.timeout,
+      memory_limit_mb=args.memory_limit,
+      force=args.force,
+      report=_print_result,
+      svg=args.svg,
+  )
+  print(summarize(results, time.perf_counter() - start))
+  return 1 if any(result.status == "failed" for result in results) else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,396 @@
+"""Column storage for the notes of partwise scores.
+
+Most of a score is `note` elements whose children follow a fixed pattern:
+pitch (step, alter, octave) or rest, chord, duration, voice, type and staff.
+`NoteColumns` keeps those values for all notes of a part in typed arrays, one
+row per note, so that their XML nodes can be dropped from the tree once a
+measure is complete (`compact`) and recreated when the score is serialized
+(`materialize`).
+
+Only values that round-trip exactly are moved into the columns. A note whose
+column children carry attributes, whose text would not be reproduced
+verbatim, or whose children are in an order `materialize` would not restore
+is left in the tree as is. The `note` element itself always stays, with its
+attributes and its other children (stem, beam, notations, ...), so the tree
+keeps its document order.
+"""
+
+import array
+import copy
+import math
+from lxml import etree
+
+STEPS = "ABCDEFG"
+NOTE_TYPES = (
+    "1024th",
+    "512th",
+    "256th",
+    "128th",
+    "64th",
+    "32nd",
+    "16th",
+    "eighth",
+    "quarter",
+    "half",
+    "whole",
+    "breve",
+    "long",
+    "maxima",
+)
+
+# Bits of `NoteColumns.flags`.
+CHORD = 1
+PITCH = 2
+REST = 4
+RAW = 8  # The note was left in the tree unchanged.
+
+# Children of `note` in the order of the MusicXML schema.
+_NOTE_CHILDREN = (
+    "grace",
+    "cue",
+    "chord",
+    "pitch",
+    "unpitched",
+    "rest",
+    "duration",
+    "tie",
+    "instrument",
+    "footnote",
+    "level",
+    "voice",
+    "type",
+    "dot",
+    "accidental",
+    "time-modification",
+    "stem",
+    "notehead",
+    "notehead-text",
+    "staff",
+    "beam",
+    "notations",
+    "lyric",
+    "play",
+    "listen",
+)
+_RANK = {tag: rank for rank, tag in enumerate(_NOTE_CHILDREN)}
+COLUMN_TAGS = frozenset(
+    ("chord", "pitch", "rest", "duration", "voice", "type", "staff")
+)
+
+
+class NoteColumns:
+  """The column-stored notes of one part, one row per `note` in document order.
+
+  Missing values are -1, or NaN for `alter` and `duration`. Rows of notes
+  that could not be compacted have the `RAW` flag and no values.
+  """
+
+  def __init__(self):
+    self.flags = array.array("B")
+    self.step = array.array("b")  # Index into `STEPS`.
+    self.alter = array.array("d")
+    self.octave = array.array("b")
+    self.duration = array.array("d")
+    self.voice = array.array("i")
+    self.type = array.array("b")  # Index into `NOTE_TYPES`.
+    self.staff = array.array("h")
+    # Number of children of the part whose notes have rows.
+    self.compacted_measures = 0
+
+  def __len__(self) -> int:
+    return len(self.flags)
+
+  def append(
+      self,
+      flags: int,
+      step: int = -1,
+      alter: float = math.nan,
+      octave: int = -1,
+      duration: float = math.nan,
+      voice: int = -1,
+      type: int = -1,
+      staff: int = -1,
+  ):
+    self.flags.append(flags)
+    self.step.append(step)
+    self.alter.append(alter)
+    self.octave.append(octave)
+    self.duration.append(duration)
+    self.voice.append(voice)
+    self.type.append(type)
+    self.staff.append(staff)
+
+  def nbytes(self) -> int:
+    """Returns the size of the column data in bytes."""
+    return sum(
+        len(column) * column.itemsize
+        for column in (
+            self.flags,
+            self.step,
+            self.alter,
+            self.octave,
+            self.duration,
+            self.voice,
+            self.type,
+            self.staff,
+        )
+    )
+
+
+def _format_number(value: float) -> str:
+  return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _number(node) -> float | None:
+  """Returns the text of a leaf `node` as a float if it round-trips."""
+  if node.attrib or len(node):
+    return None
+  try:
+    value = float(node.text)
+  except (TypeError, ValueError):
+    return None
+  if not math.isfinite(value) or _format_number(value) != node.text:
+    return None
+  return value
+
+
+def _integer(node, limit: int) -> int | None:
+  """Returns the text of a leaf `node` as an int below `limit`, if it fits."""
+  text = node.text
+  if node.attrib or len(node) or not text or not text.isdigit():
+    return None
+  value = int(text)
+  if str(value) != text or value >= limit:
+    return None
+  return value
+
+
+def _pitch(pitch) -> tuple[int, float, int] | None:
+  """Returns the (step, alter, octave) of a `pitch` if it round-trips."""
+  if pitch.attrib or pitch.text is not None:
+    return None
+  children = list(pitch)
+  if [child.tag for child in children] == ["step", "octave"]:
+    step, octave = children
+    alter = math.nan
+  elif [child.tag for child in children] == ["step", "alter", "octave"]:
+    step, alter_node, octave = children
+    alter = _number(alter_node)
+    if alter is None or alter_node.tail is not None:
+      return None
+  else:
+    return None
+  if step.attrib or len(step) or step.text is None or len(step.text) != 1:
+    return None
+  step_index = STEPS.find(step.text)
+  octave_value = _integer(octave, 10)
+  if step_index < 0 or octave_value is None:
+    return None
+  if step.tail is not None or octave.tail is not None:
+    return None
+  return step_index, alter, octave_value
+
+
+def _merge(remaining: list, inserted: list) -> list:
+  """Merges two lists of note children, each ordered by schema rank."""
+  merged = []
+  pending = iter(inserted)
+  following = next(pending, None)
+  for child in remaining:
+    rank = _RANK[child.tag]
+    while following is not None and _RANK[following.tag] < rank:
+      merged.append(following)
+      following = next(pending, None)
+    merged.append(child)
+  if following is not None:
+    merged.append(following)
+    merged.extend(pending)
+  return merged
+
+
+def _compact_note(note, columns: NoteColumns) -> list:
+  """Moves the column children of `note` into a new row of `columns`.
+
+  Returns:
+    The children removed from `note`, which is empty if the note was left in
+    the tree (and got a `RAW` row).
+  """
+  values = {}
+  removed = []
+  remaining = []
+  children = list(note) if note.text is None else None
+  for child in children or ():
+    tag = child.tag
+    if tag not in _RANK or child.tail is not None:
+      break
+    if tag not in COLUMN_TAGS:
+      remaining.append(child)
+      continue
+    if child.attrib or tag in values:
+      break
+    if tag == "pitch":
+      value = _pitch(child)
+    elif tag in ("chord", "rest"):
+      value = True if child.text is None and not len(child) else None
+    elif tag == "duration":
+      value = _number(child)
+    elif tag == "type":
+      value = NOTE_TYPES.index(child.text) if child.text in NOTE_TYPES else None
+      value = None if len(child) else value
+    else:
+      value = _integer(child, 2**15)
+    if value is None:
+      break
+    values[tag] = value
+    removed.append(child)
+  else:
+    # The note can be restored if `materialize` puts its children back in the
+    # same order.
+    removed.sort(key=lambda child: _RANK[child.tag])
+    if children and _merge(remaining, removed) == children:
+      flags = (
+          (CHORD if "chord" in values else 0)
+          | (PITCH if "pitch" in values else 0)
+          | (REST if "rest" in values else 0)
+      )
+      step, alter, octave = values.get("pitch", (-1, math.nan, -1))
+      columns.append(
+          flags,
+          step,
+          alter,
+          octave,
+          values.get("duration", math.nan),
+          values.get("voice", -1),
+          values.get("type", -1),
+          values.get("staff", -1),
+      )
+      for child in removed:
+        note.remove(child)
+      return removed
+  columns.append(RAW)
+  return []
+
+
+def compact(part, columns: NoteColumns) -> list:
+  """Compacts the notes of the children of `part` not compacted yet.
+
+  Returns:
+    The elements removed from the tree.
+  """
+  removed = []
+  for measure in part[columns.compacted_measures :]:
+    for note in measure.iterchildren("note"):
+      removed.extend(_compact_note(note, columns))
+  columns.compacted_measures = len(part)
+  return removed
+
+
+def _leaf(tag: str, text: str):
+  element = etree.Element(tag)
+  element.text = text
+  return element
+
+
+def _restore_note(note, columns: NoteColumns, row: int):
+  """Puts the column children of `row` back into `note`."""
+  flags = columns.flags[row]
+  if flags & RAW:
+    return
+  inserted = []
+  if flags & CHORD:
+    inserted.append(etree.Element("chord"))
+  if flags & PITCH:
+    pitch = etree.Element("pitch")
+    pitch.append(_leaf("step", STEPS[columns.step[row]]))
+    alter = columns.alter[row]
+    if not math.isnan(alter):
+      pitch.append(_leaf("alter", _format_number(alter)))
+    pitch.append(_leaf("octave", str(columns.octave[row])))
+    inserted.append(pitch)
+  if flags & REST:
+    inserted.append(etree.Element("rest"))
+  duration = columns.duration[row]
+  if not math.isnan(duration):
+    inserted.append(_leaf("duration", _format_number(duration)))
+  if columns.voice[row] >= 0:
+    inserted.append(_leaf("voice", str(columns.voice[row])))
+  if columns.type[row] >= 0:
+    inserted.append(_leaf("type", NOTE_TYPES[columns.type[row]]))
+  if columns.staff[row] >= 0:
+    inserted.append(_leaf("staff", str(columns.staff[row])))
+  note[:] = _merge(list(note), inserted)
+
+
+def has_compacted_notes(element, columns_by_part: dict) -> bool:
+  """Returns whether `materialize` would restore notes inside `element`.
+
+  This is cheap for the elements inside a measure that was not compacted
+  yet, such as the measure being built, which are validated as their `with`
+  blocks exit. Parts and scores are assumed to hold compacted notes.
+  """
+  measure = element
+  while measure is not None and measure.tag != "measure":
+    measure = measure.getparent()
+  if measure is None:
+    # Only parts and scores hold measures.
+    return element.tag in ("part", "score-partwise")
+  part = measure.getparent()
+  columns = columns_by_part.get(part)
+  if columns is None:
+    return False
+  # The measure was compacted unless it is among the last children of the
+  # part, which are not.
+  sibling = measure
+  for _ in range(len(part) - columns.compacted_measures):
+    sibling = sibling.getnext()
+    if sibling is None:
+      return False
+  return True
+
+
+def materialize(element, columns_by_part: dict):
+  """Returns a deep copy of `element` with its compacted notes restored.
+
+  Args:
+    element: Any element of a score built with compaction.
+    columns_by_part: The `NoteColumns` of each compacted part element.
+  """
+  result = copy.deepcopy(element)
+  rows_by_part = {}
+  for original, note in zip(element.iter("note"), result.iter("note")):
+    measure = original.getparent()
+    part = measure.getparent() if measure is not None else None
+    columns = columns_by_part.get(part)
+    if columns is None:
+      continue
+    rows = rows_by_part.get(part)
+    if rows is None:
+      rows = rows_by_part[part] = {
+          n: row for row, n in enumerate(part.iter("note"))
+      }
+    row = rows[original]
+    if row < len(columns):
+      _restore_note(note, columns, row)
+  return result
+
+
+def original_nodes(materialized, element) -> dict:
+  """Maps the nodes of `materialize(element)` to those of `element`.
+
+  Restored note children have no original and are left out.
+  """
+  mapping = {}
+  pending = [(materialized, element)]
+  while pending:
+    node, original = pending.pop()
+    mapping[node] = original
+    originals = iter(original)
+    for child in node:
+      if (
+          node.tag == "note"
+          and child.tag in COLUMN_TAGS
+          and original.find(child.tag) is None
+      ):
+        continue
+      pending.append((child, next(originals)))
+  return mapping
@@ -0,0 +1,481 @@
+"""Renders musicpy scores to SVG pages off the calling thread.
+
+`submit_render` builds a score to MusicXML (through `musicpy_cache`, in the
+workers of `musicpy_sandbox.default_pool`) and loads it into verovio on a
+thread of a shared executor. It returns a future of a `RenderResult`, which
+resolves as soon as verovio has loaded the score and counted its pages.
+Pages are only rendered when asked for, by `RenderResult.page`, so a viewer
+that looks at the first page of a long score does not pay for the others.
+Rendered pages are kept in a cache shared by all results (`page_cache`), by
+the hash of the MusicXML, the page and the verovio options. Toolkits are
+checked out of a shared `ToolkitPool` for every load and page, so their font
+and glyph data is read once per toolkit rather than once per render.
+Given a `RenderCache`, rendered scores are also kept on disk, across sessions
+and restarts, by the git blob SHA of their source (see `render_key`).
+`render_score` does the same as `submit_render` for asyncio:
+
+  result = await musicpy_render.render_score(source)
+  svg = await asyncio.wrap_future(result.page(1))
+
+Environment variables:
+  MUSICPY_RENDER_THREADS: Threads of the default executor. Defaults to 4.
+  MUSICPY_PAGE_CACHE_MB: Size of the page cache. Defaults to 64.
+  MUSICPY_TOOLKITS: Size of the default toolkit pool. Defaults to 4.
+  MUSICPY_RENDER_DISK_CACHE_MB: Size of `default_render_cache`, under
+    $MUSICPY_CACHE_DIR/render. Defaults to 512.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+import verovio
+import musicpy_cache
+import musicpy_sandbox
+import musicpy_xsd
+
+
+@functools.cache
+def page_cache() -> musicpy_cache.XmlCache:
+  """Returns the process-wide cache of rendered pages."""
+  return musicpy_cache.XmlCache(
+      max_memory_bytes=int(os.environ.get("MUSICPY_PAGE_CACHE_MB", "64")) << 20
+  )
+
+
+def options_key(options: dict | None) -> str:
+  """Returns a canonical form of verovio `options`."""
+  return json.dumps(options or {}, sort_keys=True)
+
+
+def data_key(xml: str, options: dict | None) -> str:
+  """Returns the key of `xml` rendered with `options`."""
+  return hashlib.sha256(
+      (options_key(options) + "\0" + xml).encode("utf-8")
+  ).hexdigest()
+
+
+class PooledToolkit:
+  """A verovio toolkit of a `ToolkitPool`.
+
+  Attributes:
+    toolkit: The toolkit, with the options of its pool entry set.
+    options_key: The `options_key` of those options.
+    data_key: Key of the score loaded into the toolkit, None if none is.
+  """
+
+  def __init__(self, options: dict | None):
+    self.toolkit = verovio.toolkit()
+    self.toolkit.setResourcePath(
+        os.path.join(os.path.dirname(verovio.__file__), "data")
+    )
+    self.options = dict(options or {})
+    self.options_key = options_key(options)
+    self.data_key = None
+    self.reset()
+
+  def reset(self):
+    """Restores the options of the entry, e.g. after a caller changed them."""
+    self.toolkit.resetOptions()
+    if self.options:
+      self.toolkit.setOptions(self.options)
+    self.toolkit.setInputFrom("musicxml")
+
+  def load(self, data_key: str, xml: str):
+    """Loads `xml` unless the score of `data_key` is loaded already."""
+    if self.data_key == data_key:
+      return
+    self.data_key = None
+    if not self.toolkit.loadData(xml):
+      raise ValueError("verovio could not load the MusicXML.")
+    self.data_key = data_key
+
+
+class ToolkitPool:
+  """A bounded pool of verovio toolkits by option set. Thread-safe.
+
+  Creating a toolkit reads verovio's fonts and glyphs from disk, so toolkits
+  are kept and lent out one caller at a time by `checkout`. Returned
+  toolkits get their options reset; the score they loaded stays, so that
+  rendering another page of it does not load it again.
+  """
+
+  def __init__(self, max_size: int = 4):
+    """Initializes the pool.
+
+    Args:
+      max_size: How many toolkits may exist at once, across option sets.
+        Callers wait for a toolkit once that many are checked out.
+    """
+    if max_size < 1:
+      raise ValueError("A toolkit pool needs room for one toolkit.")
+    self.max_size = max_size
+    self.created = 0
+    self.checkouts = 0
+    self.waits = 0
+    self._condition = threading.Condition()
+    self._idle = collections.OrderedDict()  # By `id`, least recent first.
+    self._in_use = 0
+    self._waiting = 0
+    self._busy_seconds = 0.0
+    self._started = time.monotonic()
+
+  def _take(self, key: str, data_key: str | None) -> PooledToolkit | None:
+    """Removes and returns the best idle toolkit for `key`, if any."""
+    match = None
+    for pooled in reversed(self._idle.values()):
+      if pooled.options_key == key:
+        match = pooled
+        if pooled.data_key == data_key:
+          break
+    if match is not None:
+      del self._idle[id(match)]
+    return match
+
+  @contextlib.contextmanager
+  def checkout(self, options: dict | None = None, data_key: str | None = None):
+    """Lends out a toolkit with `options` set, see `PooledToolkit`.
+
+    Args:
+      options: The verovio options.
+      data_key: The score the caller is going to load, to prefer a toolkit
+        that has it loaded already.
+
+    Yields:
+      The `PooledToolkit`, for the exclusive use of the caller.
+    """
+    key = options_key(options)
+    with self._condition:
+      pooled = self._take(key, data_key)
+      if pooled is None and self._in_use >= self.max_size:
+        self.waits += 1
+        self._waiting += 1
+        try:
+          while pooled is None and self._in_use >= self.max_size:
+            self._condition.wait()
+            pooled = self._take(key, data_key)
+        finally:
+          self._waiting -= 1
+      if pooled is None and self._in_use + len(self._idle) >= self.max_size:
+        # Make room by dropping the least recently used idle toolkit.
+        self._idle.popitem(last=False)
+      self._in_use += 1
+      self.checkouts += 1
+    start = time.monotonic()
+    try:
+      if pooled is None:
+        pooled = PooledToolkit(options)
+        with self._condition:
+          self.created += 1
+      yield pooled
+    finally:
+      if pooled is not None:
+        try:
+          pooled.reset()
+        except Exception:
+          pooled = None  # Not fit for reuse.
+      with self._condition:
+        self._in_use -= 1
+        self._busy_seconds += time.monotonic() - start
+        if pooled is not None:
+          self._idle[id(pooled)] = pooled
+        self._condition.notify()
+
+  def stats(self) -> dict[str, float]:
+    """Returns the metrics of the pool.
+
+    These are its maximum size, the numbers of idle, checked out and created
+    toolkits, of checkouts, of checkouts that had to wait and of callers
+    waiting now, and its utilization: the fraction of the capacity of the
+    pool that was checked out since it was created.
+    """
+    with self._condition:
+      elapsed = time.monotonic() - self._started
+      return {
+          "max_size": self.max_size,
+          "idle": len(self._idle),
+          "in_use": self._in_use,
+          "created": self.created,
+          "checkouts": self.checkouts,
+          "waits": self.waits,
+          "waiting": self._waiting,
+          "utilization": (
+              self._busy_seconds / (elapsed * self.max_size) if elapsed else 0
+          ),
+      }
+
+
+@functools.cache
+def toolkit_pool() -> ToolkitPool:
+  """Returns the process-wide toolkit pool, configured from the environment."""
+  return ToolkitPool(int(os.environ.get("MUSICPY_TOOLKITS", "4")))
+
+
+def render_xml(
+    xml: str, options: dict | None = None, pool: ToolkitPool | None = None
+) -> list[str]:
+  """Renders every page of `xml` on the calling thread.
+
+  Args:
+    xml: The MusicXML of the score.
+    options: verovio options, e.g. {"scale": 40}.
+    pool: The toolkits to render with, defaults to `toolkit_pool()`.
+
+  Returns:
+    The SVG of each page.
+  """
+  pool = toolkit_pool() if pool is None else pool
+  key = data_key(xml, options)
+  with pool.checkout(options, key) as pooled:
+    pooled.load(key, xml)
+    return [
+        pooled.toolkit.renderToSVG(page)
+        for page in range(1, pooled.toolkit.getPageCount() + 1)
+    ]
+
+
+def git_blob_sha(source: str) -> str:
+  """Returns the SHA git (and the GitHub API) gives `source` as a file."""
+  data = source.encode("utf-8")
+  return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+# The version of verovio, read from a toolkit without its resources (which
+# take long to load) rather than one checked out of a pool.
+VEROVIO_VERSION = verovio.toolkit(False).getVersion()
+
+
+def render_key(blob_sha: str, options: dict | None) -> str:
+  """Returns the key of a score in a `RenderCache`.
+
+  Args:
+    blob_sha: The `git_blob_sha` of the musicpy source.
+    options: The verovio options.
+  """
+  digest = hashlib.sha256()
+  for part in (
+      blob_sha,
+      musicpy_cache.musicpy_version(),
+      VEROVIO_VERSION,
+      options_key(options),
+  ):
+    digest.update(part.encode("utf-8") + b"\0")
+  return digest.hexdigest()
+
+
+class RenderCache:
+  """Rendered scores on disk, by `render_key`. Thread-safe.
+
+  A score is kept as `<key>.musicxml`, `<key>.json` (its page count) and a
+  `<key>-<page>.svg` per rendered page, in one `musicpy_cache.DiskCache`
+  that evicts the least recently used files once they exceed its size.
+  """
+
+  def __init__(self, directory: str, max_bytes: int):
+    self.files = musicpy_cache.DiskCache(directory, max_bytes, "")
+
+  def get_score(self, key: str) -> tuple[str, int] | None:
+    """Returns the MusicXML and page count of a score, if cached."""
+    meta = self.files.get(key + ".json")
+    xml = self.files.get(key + ".musicxml") if meta is not None else None
+    if xml is None:
+      return None
+    return xml.decode("utf-8"), json.loads(meta)["page_count"]
+
+  def put_score(self, key: str, xml: str, page_count: int):
+    self.files.put(key + ".musicxml", xml.encode("utf-8"))
+    meta = json.dumps({"page_count": page_count})
+    self.files.put(key + ".json", meta.encode("utf-8"))
+
+  def get_page(self, key: str, page: int) -> str | None:
+    svg = self.files.get(f"{key}-{page}.svg")
+    return svg.decode("utf-8") if svg is not None else None
+
+  def put_page(self, key: str, page: int, svg: str):
+    self.files.put(f"{key}-{page}.svg", svg.encode("utf-8"))
+
+
+@functools.cache
+def default_render_cache() -> RenderCache:
+  """Returns the process-wide render cache, configured from the environment."""
+  return RenderCache(
+      os.path.join(musicpy_xsd.cache_dir(), "render"),
+      int(os.environ.get("MUSICPY_RENDER_DISK_CACHE_MB", "512")) << 20,
+  )
+
+
+class RenderResult:
+  """A score loaded into verovio, whose pages are rendered on demand.
+
+  Iterating over it, synchronously or with `async for`, renders and yields
+  the SVG of every page in order.
+
+  Attributes:
+    xml: The MusicXML of the score.
+    page_count: The number of pages.
+    options: The verovio options.
+    render_key: The key of the score in `disk`, None without it.
+  """
+
+  def __init__(
+      self,
+      xml: str,
+      page_count: int,
+      options: dict | None,
+      executor: concurrent.futures.Executor,
+      pool: ToolkitPool,
+      disk: RenderCache | None = None,
+      render_key: str | None = None,
+  ):
+    self.xml = xml
+    self.page_count = page_count
+    self.options = options
+    self.render_key = render_key
+    self._executor = executor
+    self._pool = pool
+    self._disk = disk
+    self._key = data_key(xml, options)
+    self._on_disk = set()  # Pages known to be in `disk`.
+
+  def page_key(self, page: int) -> str:
+    """Returns the key of `page` in `page_cache`."""
+    return f"{self._key}-{page}"
+
+  def page(self, page: int) -> concurrent.futures.Future:
+    """Returns a future of the SVG of `page`, counted from 1.
+
+    The page is rendered on the executor unless it is cached, in memory or
+    on disk. Pages found in memory are written to `disk` too, since they may
+    have been rendered for a result without it.
+    """
+    if not 1 <= page <= self.page_count:
+      raise IndexError(f"Page {page} of {self.page_count}")
+    svg = page_cache().get(self.page_key(page))
+    if self._disk is not None:
+      if svg is None:
+        svg = self._disk.get_page(self.render_key, page)
+        if svg is not None:
+          page_cache().put(self.page_key(page), svg)
+          self._on_disk.add(page)
+      elif page not in self._on_disk:
+        self._disk.put_page(self.render_key, page, svg)
+        self._on_disk.add(page)
+    if svg is not None:
+      future = concurrent.futures.Future()
+      future.set_result(svg)
+      return future
+    return self._executor.submit(self._render_page, page)
+
+  def _render_page(self, page: int) -> str:
+    with self._pool.checkout(self.options, self._key) as pooled:
+      pooled.load(self._key, self.xml)
+      svg = pooled.toolkit.renderToSVG(page)
+    page_cache().put(self.page_key(page), svg)
+    if self._disk is not None:
+      self._disk.put_page(self.render_key, page, svg)
+      self._on_disk.add(page)
+    return svg
+
+  def svg(self, page: int, timeout: float | None = None) -> str:
+    """Waits for and returns the SVG of `page`, counted from 1."""
+    return self.page(page).result(timeout)
+
+  def __iter__(self):
+    for page in range(1, self.page_count + 1):
+      yield self.svg(page)
+
+  async def __aiter__(self):
+    for page in range(1, self.page_count + 1):
+      yield await asyncio.wrap_future(self.page(page))
+
+
+@functools.cache
+def default_executor() -> concurrent.futures.ThreadPoolExecutor:
+  """Returns the process-wide executor, configured from the environment."""
+  return concurrent.futures.ThreadPoolExecutor(
+      max_workers=int(os.environ.get("MUSICPY_RENDER_THREADS", "4")),
+      thread_name_prefix="musicpy-render",
+  )
+
+
+def _render(
+    musicpy: str,
+    options: dict | None,
+    executor: concurrent.futures.Executor,
+    pool: ToolkitPool,
+    disk: RenderCache | None,
+    loaded: concurrent.futures.Future,
+):
+  """Resolves `loaded` with a `RenderResult`."""
+  if not loaded.set_running_or_notify_cancel():
+    return
+  try:
+    key = cached = None
+    if disk is not None:
+      key = render_key(git_blob_sha(musicpy), options)
+      cached = disk.get_score(key)
+    if cached is not None:
+      xml, page_count = cached
+    else:
+      xml = musicpy_cache.safe_exec_musicpy(
+          musicpy, sandbox=musicpy_sandbox.default_pool()
+      )
+      loaded_key = data_key(xml, options)
+      with pool.checkout(options, loaded_key) as pooled:
+        pooled.load(loaded_key, xml)
+        page_count = pooled.toolkit.getPageCount()
+      if disk is not None:
+        disk.put_score(key, xml, page_count)
+    result = RenderResult(xml, page_count, options, executor, pool, disk, key)
+  except Exception as e:
+    loaded.set_exception(e)
+    return
+  loaded.set_result(result)
+
+
+def submit_render(
+    musicpy: str,
+    options: dict | None = None,
+    executor: concurrent.futures.Executor | None = None,
+    pool: ToolkitPool | None = None,
+    disk: RenderCache | None = None,
+) -> concurrent.futures.Future:
+  """Starts rendering a score, see the module docstring.
+
+  Args:
+    musicpy: The musicpy source code.
+    options: verovio options, e.g. {"scale": 40}.
+    executor: Where to load the score and render its pages, defaults to
+      `default_executor()`.
+    pool: The toolkits to render with, defaults to `toolkit_pool()`.
+    disk: Where to look for and keep the MusicXML and pages across
+      processes, e.g. `default_render_cache()`. None to not keep them.
+
+  Returns:
+    A future of the `RenderResult`, or of the error that building or loading
+    the score raised.
+  """
+  loaded = concurrent.futures.Future()
+  executor = default_executor() if executor is None else executor
+  pool = toolkit_pool() if pool is None else pool
+  executor.submit(_render, musicpy, options, executor, pool, disk, loaded)
+  return loaded
+
+
+async def render_score(
+    musicpy: str,
+    options: dict | None = None,
+    executor: concurrent.futures.Executor | None = None,
+    pool: ToolkitPool | None = None,
+    disk: RenderCache | None = None,
+) -> RenderResult:
+  """`submit_render` for asyncio: returns the result once it is loaded."""
+  return await asyncio.wrap_future(
+      submit_render(musicpy, options, executor, pool, disk)
+  )
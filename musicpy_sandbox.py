@@ -0,0 +1,339 @@
+"""Runs musicpy sources in a pool of sandboxed worker processes.
+
+`musicpy_ast.safe_exec_musicpy` limits what a score can do, but not what it
+costs: a pathological score (deep nesting, a huge document to validate) can
+hold a server thread, and all the memory it asks for, for as long as it likes.
+`SandboxPool` builds scores in worker processes instead:
+
+  - Workers are started and warmed up (musicpy_schema imported, validators
+    compiled by `musicpy.prewarm`) before their first job, in a fork server
+    that has musicpy_ast preloaded where the platform has one.
+  - Each job gets a CPU time limit (RLIMIT_CPU, raised as `TimeoutError` in
+    the worker) and each worker an address space limit (RLIMIT_AS; Linux does
+    not enforce RLIMIT_RSS), which fails large allocations with
+    `MemoryError`.
+  - A job that exceeds its wall-clock timeout, e.g. stuck in native code,
+    has its worker killed and replaced, and raises `TimeoutError`.
+  - Workers are replaced after `max_jobs` jobs, so that memory fragmentation
+    and caches do not build up.
+
+Jobs and results travel over a pipe per worker. Callers block until a worker
+is free; `SandboxPool.queue_depth` is the number of callers waiting.
+
+Environment variables (for `default_pool`):
+  MUSICPY_SANDBOX_WORKERS: Number of worker processes. Defaults to 2.
+  MUSICPY_SANDBOX_TIMEOUT: Wall-clock seconds per job. Defaults to 30.
+  MUSICPY_SANDBOX_CPU_SECONDS: CPU seconds per job. Defaults to 20.
+  MUSICPY_SANDBOX_MEMORY_MB: Address space of a worker. Defaults to 2048.
+  MUSICPY_SANDBOX_MAX_JOBS: Jobs before a worker is replaced. Defaults to 100.
+"""
+
+import atexit
+import functools
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import threading
+
+try:
+  import resource
+except ImportError:  # Not available on Windows.
+  resource = None
+
+# Seconds a new worker may take to start and warm up.
+_STARTUP_TIMEOUT = 60
+
+
+def _on_cpu_limit(signum, frame):
+  # Lift the limit first: another SIGXCPU a second later must not interrupt
+  # the handling of this one.
+  _limit_cpu(0)
+  raise TimeoutError("Exceeded the CPU time limit")
+
+
+def _limit_cpu(cpu_seconds: float):
+  """Lets the calling process use `cpu_seconds` more CPU time, 0 for any.
+
+  Only the soft limit is set, so that it can be raised again for the next
+  job; the kernel sends SIGXCPU every second past it.
+  """
+  if resource is None:
+    return
+  _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+  limit = hard
+  if cpu_seconds > 0:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    limit = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+    if hard != resource.RLIM_INFINITY:
+      limit = min(limit, hard)
+  resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+
+
+def _portable(error: BaseException) -> BaseException:
+  """Returns `error`, or a `RuntimeError` describing it if it cannot be sent."""
+  try:
+    return pickle.loads(pickle.dumps(error))
+  except Exception:
+    return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+def _worker_main(conn, cpu_seconds: float, memory_limit_mb: int):
+  """Builds the scores sent over `conn` until it is closed."""
+  # Interrupts are for the server, which stops the workers itself.
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  if resource is not None:
+    if memory_limit_mb > 0:
+      limit = memory_limit_mb << 20
+      resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+  logging.disable(logging.WARNING)
+  import musicpy
+  import musicpy_ast
+
+  musicpy.prewarm()
+  conn.send(None)  # Ready.
+  while True:
+    try:
+      job = conn.recv()
+    except EOFError:
+      return
+    if job is None:
+      return
+    musicpy_source, indent = job
+    try:
+      _limit_cpu(cpu_seconds)
+      result = True, musicpy_ast.safe_exec_musicpy(musicpy_source, indent)
+    except MemoryError:
+      result = False, MemoryError("Exceeded the memory limit")
+    except Exception as e:  # Includes RecursionError.
+      result = False, _portable(e)
+    finally:
+      _limit_cpu(0)  # No SIGXCPU between jobs.
+    conn.send(result)
+
+
+class _Worker:
+  """A worker process and the parent's end of its pipe."""
+
+  def __init__(self, context, cpu_seconds: float, memory_limit_mb: int):
+    self.conn, child_conn = context.Pipe()
+    self.process = context.Process(
+        target=_worker_main,
+        args=(child_conn, cpu_seconds, memory_limit_mb),
+        name="musicpy-sandbox",
+        daemon=True,
+    )
+    self.process.start()
+    child_conn.close()
+    self.ready = False
+    self.jobs = 0
+
+  def run(self, job: tuple, timeout: float | None) -> tuple:
+    """Sends `job` and returns its result.
+
+    Raises:
+      TimeoutError: If the worker did not answer within `timeout` seconds.
+      EOFError: If the worker died.
+    """
+    if not self.ready:
+      if not self.conn.poll(_STARTUP_TIMEOUT):
+        raise TimeoutError("The sandbox worker did not start")
+      self.conn.recv()
+      self.ready = True
+    self.jobs += 1
+    self.conn.send(job)
+    if not self.conn.poll(timeout):
+      raise TimeoutError(f"Timed out after {timeout:g} s")
+    return self.conn.recv()
+
+  def death(self) -> str:
+    """Describes why the worker process ended."""
+    self.process.join(1)
+    code = self.process.exitcode
+    if code is None:
+      return "The sandbox worker stopped answering"
+    if code < 0:
+      try:
+        return f"The sandbox worker was killed by {signal.Signals(-code).name}"
+      except ValueError:
+        pass
+    return f"The sandbox worker exited with code {code}"
+
+  def stop(self, kill: bool = False):
+    if kill:
+      self.process.kill()
+    else:
+      try:
+        self.conn.send(None)
+      except OSError:
+        pass
+    self.process.join(1 if kill else 5)
+    if self.process.is_alive():
+      self.process.kill()
+      self.process.join()
+    self.conn.close()
+
+
+class SandboxPool:
+  """A pool of worker processes that build scores, see the module docstring.
+
+  Thread-safe: every thread that calls `run` gets a worker of its own, or
+  waits for one.
+  """
+
+  def __init__(
+      self,
+      workers: int = 2,
+      timeout: float | None = 30,
+      cpu_seconds: float = 20,
+      memory_limit_mb: int = 2048,
+      max_jobs: int = 100,
+  ):
+    """Starts the workers.
+
+    Args:
+      workers: Number of worker processes.
+      timeout: Wall-clock seconds per job, None for no limit.
+      cpu_seconds: CPU seconds per job, 0 for no limit.
+      memory_limit_mb: Address space limit of each worker, 0 for no limit.
+      max_jobs: Jobs after which a worker is replaced, 0 to keep workers.
+    """
+    if workers < 1:
+      raise ValueError("A sandbox pool needs at least one worker.")
+    methods = multiprocessing.get_all_start_methods()
+    if "forkserver" in methods:
+      self._context = multiprocessing.get_context("forkserver")
+      self._context.set_forkserver_preload(["musicpy_ast"])
+    else:
+      self._context = multiprocessing.get_context("spawn")
+    self.timeout = timeout
+    self.cpu_seconds = cpu_seconds
+    self.memory_limit_mb = memory_limit_mb
+    self.max_jobs = max_jobs
+    self.size = workers
+    self.completed = 0
+    self.failed = 0
+    self.timeouts = 0
+    self.recycled = 0
+    self._condition = threading.Condition()
+    self._waiting = 0
+    self._closed = False
+    self._idle = [self._start_worker() for _ in range(workers)]
+
+  def _start_worker(self) -> _Worker:
+    return _Worker(self._context, self.cpu_seconds, self.memory_limit_mb)
+
+  @property
+  def queue_depth(self) -> int:
+    """The number of jobs waiting for a free worker."""
+    return self._waiting
+
+  def stats(self) -> dict[str, int]:
+    """Returns the metrics of the pool.
+
+    These are its size, the number of busy workers, the queue depth, the
+    number of completed, failed and timed out jobs and the number of
+    replaced workers.
+    """
+    with self._condition:
+      return {
+          "workers": self.size,
+          "busy": self.size - len(self._idle),
+          "queue_depth": self._waiting,
+          "completed": self.completed,
+          "failed": self.failed,
+          "timeouts": self.timeouts,
+          "recycled": self.recycled,
+      }
+
+  def run(self, musicpy: str, indent: int | None = 2) -> str:
+    """Builds `musicpy` like `musicpy_ast.safe_exec_musicpy`, in a worker.
+
+    Raises:
+      TimeoutError: If the job exceeded its wall-clock or CPU time.
+      MemoryError: If the job exceeded the memory limit.
+      RuntimeError: If the worker died, or the pool is closed.
+      Exception: Whatever `safe_exec_musicpy` raised in the worker, or a
+        `RuntimeError` describing it if it could not be sent back.
+    """
+    with self._condition:
+      self._waiting += 1
+      try:
+        while not self._idle and not self._closed:
+          self._condition.wait()
+      finally:
+        self._waiting -= 1
+      if self._closed:
+        raise RuntimeError("The sandbox pool is closed.")
+      worker = self._idle.pop()
+    replace = True
+    try:
+      try:
+        ok, value = worker.run((musicpy, indent), self.timeout)
+      except TimeoutError:
+        self._count("timeouts")
+        raise
+      except (EOFError, OSError):
+        self._count("failed")
+        raise RuntimeError(worker.death()) from None
+      # A worker that ran out of memory may be left in a bad state.
+      replace = 0 < self.max_jobs <= worker.jobs or isinstance(
+          value, MemoryError
+      )
+      if ok:
+        self._count("completed")
+        return value
+      self._count("timeouts" if isinstance(value, TimeoutError) else "failed")
+      raise value
+    finally:
+      self._release(worker, replace)
+
+  def _count(self, metric: str):
+    with self._condition:
+      setattr(self, metric, getattr(self, metric) + 1)
+
+  def _release(self, worker: _Worker, replace: bool):
+    """Returns `worker` to the pool, or a new one in its place."""
+    if replace:
+      worker.stop(kill=True)
+      worker = None if self._closed else self._start_worker()
+    with self._condition:
+      if replace:
+        self.recycled += 1
+      if worker is not None and not self._closed:
+        self._idle.append(worker)
+        worker = None
+      self._condition.notify()
+    if worker is not None:  # Closed while the job ran.
+      worker.stop()
+
+  def close(self):
+    """Stops the idle workers, and the busy ones once their job is done."""
+    with self._condition:
+      self._closed = True
+      idle, self._idle = self._idle, []
+      self._condition.notify_all()
+    for worker in idle:
+      worker.stop()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+
+@functools.cache
+def default_pool() -> SandboxPool:
+  """Returns the process-wide pool, configured from the environment."""
+  pool = SandboxPool(
+      workers=int(os.environ.get("MUSICPY_SANDBOX_WORKERS", "2")),
+      timeout=float(os.environ.get("MUSICPY_SANDBOX_TIMEOUT", "30")),
+      cpu_seconds=float(os.environ.get("MUSICPY_SANDBOX_CPU_SECONDS", "20")),
+      memory_limit_mb=int(os.environ.get("MUSICPY_SANDBOX_MEMORY_MB", "2048")),
+      max_jobs=int(os.environ.get("MUSICPY_SANDBOX_MAX_JOBS", "100")),
+  )
+  atexit.register(pool.close)
+  return pool
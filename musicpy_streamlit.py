@@ -0,0 +1,22 @@
+"""Streamlit widgets shared by the MusicPy and Open Music Sheet apps."""
+
+import musicpy_render
+import streamlit as st
+
+
+def show_page(score: musicpy_render.RenderResult, key: str):
+  """Shows the page of `score` chosen with a selector, rendering only it."""
+  page = 1
+  if score.page_count > 1:
+    page = st.radio(
+        "Page",
+        range(1, score.page_count + 1),
+        format_func=lambda page: f"Page {page}",
+        horizontal=True,
+        key=key,
+        label_visibility="collapsed",
+    )
+  try:
+    st.image(score.svg(page))
+  except Exception as e:
+    st.error(e)
@@ -0,0 +1,381 @@
+"""Checks that the measures of a musicpy score add up to their time signature.
+
+XSD validation checks the structure of a score but not its timing, so a
+measure whose voices are longer or shorter than the time signature is valid
+MusicXML. `check_timeline` finds those measures in musicpy source, without
+executing it, by walking its statements once in document order and keeping
+per part:
+
+  divisions  From `Divisions` in `Attributes`.
+  time       Beats per measure from `Time` (`Beats` and `BeatType`).
+  position   The current time in the measure, moved by the `Duration` of
+             `Note` (not for `Chord` and `Grace` notes), `Backup` and
+             `Forward`.
+
+The work is constant per statement, and elements that cannot affect timing
+(pitches, notations, directions, ...) are skipped with everything inside
+them, so the walk is linear in the size of the source: about 0.6 s for a
+10,000 measure score of 1.1 million lines. Parsing that score takes far
+longer, so source is parsed with `musicpy_ast.parse_musicpy`, which shares
+the tree with a build of the same source. Issues carry the source line of
+the offending element, e.g. the note that overfills a measure.
+
+Measures are not checked before the part has both divisions and a time
+signature, under `SenzaMisura`, when they hold no notes, or for being short
+if they are `implicit` (pickup measures).
+
+Usage:
+  python musicpy_timeline.py score.py
+"""
+
+import argparse
+import ast
+import dataclasses
+import musicpy
+import musicpy_ast
+
+# Values of `TimelineIssue.kind`.
+OVERFULL = "overfull"
+UNDERFULL = "underfull"
+BACKUP = "backup"  # A backup to before the start of the measure.
+
+# The children that matter for timing of each element, by tag; the walk skips
+# all other elements and everything inside them. None is the top level.
+_TIMED_CHILDREN = {
+    None: frozenset(("score-partwise", "part", "measure")),
+    "score-partwise": frozenset(("part",)),
+    "part": frozenset(("measure",)),
+    "measure": frozenset(("attributes", "note", "backup", "forward")),
+    "attributes": frozenset(("divisions", "time")),
+    "time": frozenset(("beats", "beat-type", "senza-misura")),
+    "note": frozenset(("chord", "grace", "duration", "voice")),
+    "backup": frozenset(("duration",)),
+    "forward": frozenset(("duration", "voice")),
+}
+_NO_CHILDREN = frozenset()
+
+# Tolerance for durations that are not whole numbers of divisions.
+_EPSILON = 1e-9
+
+
+@dataclasses.dataclass(frozen=True)
+class TimelineIssue:
+  """A measure that does not add up to its time signature.
+
+  Attributes:
+    kind: `OVERFULL`, `UNDERFULL` or `BACKUP`.
+    line: Source line of the element the issue was found at. That is the
+      first note, backup or forward ending after the measure for `OVERFULL`,
+      the measure for `UNDERFULL` and the backup for `BACKUP`.
+    part: The `id` of the part, if given.
+    measure: The `number` of the measure, if given.
+    voice: The voice that does not add up, None if the notes have no voice.
+    expected: Length of the measure in divisions, from the time signature.
+    actual: End of the voice in divisions, or the position backed up to.
+  """
+
+  kind: str
+  line: int
+  part: str | None
+  measure: str | None
+  voice: str | None
+  expected: float
+  actual: float
+
+  def __str__(self) -> str:
+    where = f"measure {self.measure or '?'}"
+    if self.part is not None:
+      where += f" of part {self.part}"
+    if self.voice is not None:
+      where += f", voice {self.voice}"
+    if self.kind == BACKUP:
+      return (
+          f"line {self.line}: {where} backs up to {self.actual:g} divisions"
+          " before the start of the measure"
+      )
+    return (
+        f"line {self.line}: {where} is {self.kind}: {self.actual:g} divisions"
+        f" instead of {self.expected:g}"
+    )
+
+
+def _number(text: str | None) -> float | None:
+  try:
+    return float(text)
+  except (TypeError, ValueError):
+    return None
+
+
+def _beats(text: str | None) -> float | None:
+  """Parses `beats`, including compound values such as "3+2"."""
+  if text is None:
+    return None
+  values = [_number(value) for value in text.split("+")]
+  return None if None in values else sum(values)
+
+
+def _value(node: ast.AST):
+  """Returns the value of a constant argument, None for anything else."""
+  if isinstance(node, ast.Constant):
+    return node.value
+  try:
+    return ast.literal_eval(node)
+  except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+    return None
+
+
+class _Event:
+  """A note, backup or forward whose children are being read."""
+
+  __slots__ = ("tag", "line", "chord", "grace", "duration", "voice")
+
+  def __init__(self, tag: str, line: int):
+    self.tag = tag
+    self.line = line
+    self.chord = False
+    self.grace = False
+    self.duration = None
+    self.voice = None
+
+
+class _Timeline:
+  """The state of the walk over a score, see the module docstring."""
+
+  def __init__(self):
+    self.issues = []
+    # Part state.
+    self.part = None
+    self.divisions = None
+    self.time = None  # Measure length in quarter notes; 0 if unmetered.
+    # Time signature being read, as [beats, beat type] pairs.
+    self.signature = None
+    # Measure state.
+    self.measure = None
+    self.measure_line = 0
+    self.implicit = False
+    self.position = 0.0
+    self.onset = 0.0  # Start of the last note that was not a chord note.
+    self.ends = {}  # Latest end per voice.
+    self.overflow = {}  # First line ending after the measure, per voice.
+    self.event = None
+
+  def start(self, tag: str, parent: str | None, line: int, text, attributes):
+    if parent in ("note", "backup", "forward"):
+      event = self.event
+      if tag == "duration":
+        event.duration = _number(text)
+      elif tag == "voice":
+        event.voice = text
+      elif tag == "chord":
+        event.chord = True
+      else:
+        event.grace = True
+    elif parent == "time":
+      signature = self.signature
+      if signature is None:
+        return
+      if tag == "beats":
+        signature.append([_beats(text), None])
+      elif tag == "beat-type" and signature:
+        signature[-1][1] = _number(text)
+      elif tag == "senza-misura":
+        self.signature = None
+        self.time = 0.0
+    elif tag in ("note", "backup", "forward"):
+      self.event = _Event(tag, line)
+    elif tag == "measure":
+      self.measure = attributes.get("number")
+      self.measure_line = line
+      self.implicit = attributes.get("implicit") == "yes"
+      self.position = self.onset = 0.0
+      self.ends = {}
+      self.overflow = {}
+    elif tag == "divisions":
+      self.divisions = _number(text)
+    elif tag == "time":
+      self.signature = []
+    elif tag == "part":
+      self.part = attributes.get("id")
+      self.divisions = self.time = None
+
+  def end(self, tag: str):
+    if tag in ("note", "backup", "forward"):
+      self._advance(self.event)
+      self.event = None
+    elif tag == "time":
+      signature = self.signature
+      if signature and all(
+          beats is not None and beat_type for beats, beat_type in signature
+      ):
+        self.time = sum(4 * beats / beat_type for beats, beat_type in signature)
+      self.signature = None
+    elif tag == "measure":
+      self._check_measure()
+      self.measure = None
+
+  def _length(self) -> float | None:
+    if not self.divisions or not self.time:
+      return None
+    return self.time * self.divisions
+
+  def _advance(self, event: _Event):
+    duration = event.duration or 0.0
+    if event.tag == "backup":
+      self.position -= duration
+      if self.position < -_EPSILON and self._length() is not None:
+        self.issues.append(
+            TimelineIssue(
+                BACKUP,
+                event.line,
+                self.part,
+                self.measure,
+                None,
+                self._length(),
+                self.position,
+            )
+        )
+      return
+    if event.tag == "note":
+      if event.grace:
+        return
+      if event.chord:
+        end = self.onset + duration
+      else:
+        self.onset = self.position
+        self.position += duration
+        end = self.position
+    else:
+      self.position += duration
+      end = self.position
+    voice = event.voice
+    self.ends[voice] = max(end, self.ends.get(voice, end))
+    length = self._length()
+    if (
+        length is not None
+        and end > length + _EPSILON
+        and voice not in self.overflow
+    ):
+      self.overflow[voice] = event.line
+
+  def _check_measure(self):
+    length = self._length()
+    if length is None or not self.ends:
+      return
+    for voice, end in self.ends.items():
+      if voice in self.overflow:
+        kind, line = OVERFULL, self.overflow[voice]
+      elif end < length - _EPSILON and not self.implicit:
+        kind, line = UNDERFULL, self.measure_line
+      else:
+        continue
+      self.issues.append(
+          TimelineIssue(
+              kind, line, self.part, self.measure, voice, length, end
+          )
+      )
+
+  def walk(self, statements: list[ast.stmt], parent: str | None):
+    for statement in statements:
+      if isinstance(statement, ast.With):
+        # `with A(), B():` nests B in A.
+        tags = []
+        inner = parent
+        for item in statement.items:
+          inner = self.call(item.context_expr, inner)
+          if inner is None:
+            break
+          tags.append(inner)
+        else:
+          self.walk(statement.body, inner)
+        for tag in reversed(tags):
+          self.end(tag)
+      elif isinstance(statement, ast.Expr):
+        tag = self.call(statement.value, parent)
+        if tag is not None:
+          self.end(tag)
+
+  def call(
+      self, node: ast.expr, parent: str | None, name: str | None = None
+  ) -> str | None:
+    """Starts the element that `node` constructs and its keyword children.
+
+    Args:
+      node: The constructor call, or the value of a keyword argument that
+        names a child class.
+      parent: Tag of the enclosing element.
+      name: The keyword, for keyword argument values.
+
+    Returns:
+      The tag of the element if it was started and has to be ended, None if
+      it does not matter for timing.
+    """
+    if name is None:
+      if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Name):
+        return None
+      name = node.func.id
+    tag = musicpy.kebab_name(name)
+    if tag not in _TIMED_CHILDREN.get(parent, _NO_CHILDREN):
+      return None
+    if isinstance(node, ast.Call):
+      args, keywords = node.args, node.keywords  # Also `_(...)`.
+    elif isinstance(node, ast.Tuple):
+      args, keywords = node.elts, ()
+    else:
+      args, keywords = (node,), ()
+    text = _value(args[0]) if args else None
+    attributes = {}
+    children = []
+    for keyword in keywords:
+      key = keyword.arg
+      if key is None:
+        continue
+      if key == "plain_text":
+        text = _value(keyword.value)
+      elif key == key.lower():
+        attributes[key] = _value(keyword.value)
+      else:
+        children.append(keyword)
+    if text is not None:
+      text = str(text)
+    self.start(tag, parent, node.lineno, text, attributes)
+    for keyword in children:
+      value = keyword.value
+      if isinstance(value, ast.Constant) and value.value is None:
+        continue
+      if isinstance(value, ast.Call) and not (
+          isinstance(value.func, ast.Name) and value.func.id == "_"
+      ):
+        # Only `_()` builds child arguments; the constructor rejects elements.
+        continue
+      child = self.call(value, tag, keyword.arg)
+      if child is not None:
+        self.end(child)
+    return tag
+
+
+def check_timeline(source: str | ast.Module) -> list[TimelineIssue]:
+  """Returns the measures of a musicpy score that do not fill their time.
+
+  Args:
+    source: musicpy source code, or its parsed module.
+
+  Raises:
+    SyntaxError: If `source` is not valid Python.
+  """
+  if isinstance(source, str):
+    source = musicpy_ast.parse_musicpy(source)
+  timeline = _Timeline()
+  timeline.walk(source.body, None)
+  return timeline.issues
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("file_path", help="Path to the musicpy score.")
+  args = parser.parse_args()
+  with open(args.file_path, "r") as f:
+    issues = check_timeline(f.read())
+  for issue in issues:
+    print(issue)
+  if not issues:
+    print(f"All measures of '{args.file_path}' fill their time signature.")
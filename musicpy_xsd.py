@@ -0,0 +1,229 @@
+"""Loading, compiling and caching of the MusicXML schema.
+
+The MusicXML XSD is compiled once per thread. Instead of compiling a wrapper
+schema for every element class, `musicxml.xsd` is resolved into a single
+schema file that also declares every element it defines as a global element,
+so one compiled `XMLSchema` can validate any MusicXML element as the root of
+a (sub)tree. Each thread gets its own copy, since an `XMLSchema` keeps the
+error log of its last validation and must not be used by two threads at once.
+
+The resolved schema, the copies of `xml.xsd` and `xlink.xsd` it imports and
+the element→type index are persisted under the cache directory, keyed by a
+hash of the source schema files. A fresh process then only has to compile the
+resolved file.
+
+Environment variables:
+  MUSICPY_SCHEMA_DIR: Directory containing musicxml.xsd, xml.xsd and
+    xlink.xsd. Defaults to the current directory.
+  MUSICPY_CACHE_DIR: Root of the on-disk caches. Defaults to
+    $XDG_CACHE_HOME/musicpy or ~/.cache/musicpy.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from lxml import etree
+
+SCHEMA_FILES = ("musicxml.xsd", "xml.xsd", "xlink.xsd")
+# The `schema_version` of a directory without the schema files.
+MISSING_SCHEMA_VERSION = "none"
+RESOLVED_SCHEMA_FILE_NAME = "musicxml-resolved.xsd"
+ELEMENT_TYPES_FILE_NAME = "element-types.json"
+
+_XSD = "{http://www.w3.org/2001/XMLSchema}"
+# Remote locations imported by musicxml.xsd, mapped to the local copies.
+_IMPORT_LOCATIONS = {
+    "http://www.musicxml.org/xsd/xml.xsd": "xml.xsd",
+    "http://www.musicxml.org/xsd/xlink.xsd": "xlink.xsd",
+}
+
+_lock = threading.Lock()
+_schema_document: etree._ElementTree | None = None
+_element_types: dict[str, str | None] | None = None
+# Holds the `schema` compiled for each thread.
+_local = threading.local()
+
+
+def _reset_lock_after_fork():
+  # The compiled schema is inherited, but a lock held by another thread of the
+  # parent at fork time would never be released in the child.
+  global _lock
+  _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_lock_after_fork)
+
+
+def schema_dir() -> str:
+  return os.environ.get("MUSICPY_SCHEMA_DIR", "")
+
+
+def cache_dir() -> str:
+  """Returns the root directory of musicpy's on-disk caches."""
+  if "MUSICPY_CACHE_DIR" in os.environ:
+    return os.environ["MUSICPY_CACHE_DIR"]
+  return os.path.join(
+      os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+      "musicpy",
+  )
+
+
+def schema_version(directory: str | None = None) -> str:
+  """Returns a hash identifying the contents of the MusicXML schema files.
+
+  That is `MISSING_SCHEMA_VERSION` if they cannot be read, in which case
+  scores are built without validation.
+  """
+  directory = schema_dir() if directory is None else directory
+  digest = hashlib.sha256()
+  try:
+    for name in SCHEMA_FILES:
+      with open(os.path.join(directory, name), "rb") as f:
+        digest.update(name.encode("utf-8") + b"\0" + f.read() + b"\0")
+  except OSError:
+    return MISSING_SCHEMA_VERSION
+  return digest.hexdigest()[:16]
+
+
+def _index_element_types(xsd: etree._ElementTree) -> dict[str, str | None]:
+  """Maps every element name declared in `xsd` to its type.
+
+  Elements declared with an inline (anonymous) type map to None. Names that
+  are declared more than once with different types are left out, since they
+  cannot be validated without knowing their parent.
+  """
+  declared = {}
+  for declaration in xsd.iter(f"{_XSD}element"):
+    name = declaration.get("name")
+    if name is not None:
+      declared.setdefault(name, []).append(declaration.get("type"))
+  return {
+      name: types[0]
+      for name, types in declared.items()
+      if len(types) == 1 or (None not in types and len(set(types)) == 1)
+  }
+
+
+def _resolve(source: str, target: str) -> dict[str, str | None]:
+  """Writes the resolved schema and its imports from `source` to `target`.
+
+  Returns:
+    The element→type index.
+  """
+  xsd = etree.parse(os.path.join(source, SCHEMA_FILES[0]))
+  root = xsd.getroot()
+  element_types = _index_element_types(xsd)
+
+  for declaration in root.iter(f"{_XSD}import", f"{_XSD}include"):
+    location = declaration.get("schemaLocation")
+    declaration.set(
+        "schemaLocation", _IMPORT_LOCATIONS.get(location, location)
+    )
+
+  global_elements = {
+      declaration.get("name") for declaration in root.findall(f"{_XSD}element")
+  }
+  inline_declarations = {
+      declaration.get("name"): declaration
+      for declaration in root.iter(f"{_XSD}element")
+      if declaration.get("name") is not None
+      and declaration.get("type") is None
+  }
+  for name, type_name in element_types.items():
+    if name in global_elements:
+      continue
+    if type_name is None:
+      declaration = copy.deepcopy(inline_declarations[name])
+      for occurs in ("minOccurs", "maxOccurs"):
+        declaration.attrib.pop(occurs, None)
+    else:
+      declaration = etree.Element(
+          f"{_XSD}element", name=name, type=type_name
+      )
+    declaration.tail = "\n"
+    root.append(declaration)
+
+  xsd.write(os.path.join(target, RESOLVED_SCHEMA_FILE_NAME), encoding="utf-8")
+  for name in SCHEMA_FILES[1:]:
+    shutil.copyfile(os.path.join(source, name), os.path.join(target, name))
+  with open(os.path.join(target, ELEMENT_TYPES_FILE_NAME), "w") as f:
+    json.dump(element_types, f, indent=1, sort_keys=True)
+  return element_types
+
+
+def _resolved_schema_dir() -> str:
+  """Returns the cache entry for the current schema, creating it if needed."""
+  source = schema_dir()
+  version = schema_version(source)
+  if version == MISSING_SCHEMA_VERSION:
+    raise FileNotFoundError(
+        f"The MusicXML schema files {SCHEMA_FILES} are not in"
+        f" {os.path.abspath(source)}"
+    )
+  parent = os.path.join(cache_dir(), "schema")
+  entry = os.path.join(parent, version)
+  if os.path.exists(os.path.join(entry, ELEMENT_TYPES_FILE_NAME)):
+    return entry
+  try:
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{version}-", dir=parent)
+  except OSError as e:
+    logging.warning(f"Schema cache {parent} is not writable: {e}")
+    staging = entry = tempfile.mkdtemp(prefix=f"musicpy-schema-{version}-")
+  _resolve(source, staging)
+  if staging != entry:
+    try:
+      os.rename(staging, entry)
+    except OSError:
+      # Another process published the same version first.
+      shutil.rmtree(staging, ignore_errors=True)
+  logging.info(f"Resolved MusicXML schema {version} into {entry}")
+  return entry
+
+
+def _load():
+  global _schema_document, _element_types
+  with _lock:
+    if _schema_document is not None:
+      return
+    entry = _resolved_schema_dir()
+    with open(os.path.join(entry, ELEMENT_TYPES_FILE_NAME)) as f:
+      element_types = json.load(f)
+    _element_types = element_types
+    _schema_document = etree.parse(
+        os.path.join(entry, RESOLVED_SCHEMA_FILE_NAME)
+    )
+
+
+def compiled_schema() -> etree.XMLSchema:
+  """Returns the MusicXML schema of this thread, compiling it on first use."""
+  schema = getattr(_local, "schema", None)
+  if schema is None:
+    if _schema_document is None:
+      _load()
+    schema = _local.schema = etree.XMLSchema(_schema_document)
+  return schema
+
+
+def element_types() -> dict[str, str | None]:
+  """Returns the element→type index of the MusicXML schema."""
+  if _element_types is None:
+    _load()
+  return _element_types
+
+
+def validator(element_name: str) -> etree.XMLSchema | None:
+  """Returns a schema that validates `element_name` as the root element.
+
+  All validators of a thread are its compiled MusicXML schema; None is
+  returned for elements that it cannot validate on their own.
+  """
+  schema = compiled_schema()
+  if element_name not in _element_types:
+    return None
+  return schema
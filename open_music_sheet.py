@@ -3,9 +3,11 @@ import textwrap
 
 import requests
 import streamlit as st
-import verovio
 import logging
-import musicpy_ast
+import musicpy_render
+import musicpy_streamlit
+import musicpy_xsd
+import sheet_index
 
 
 st.set_page_config(page_title="Open Music Sheet", page_icon="🎼", layout="wide")
@@ -26,23 +28,18 @@ def rate_limit():
   )
   st.code(response.json())
 
-@st.cache_data
-def list_sheet(dir=""):
-  url = (
-      "https://api.github.com/repos/yufanyufan/open_music_sheet/contents" + dir
-  )
-  headers={"Authorization": st.secrets["github_key"]}
-  response = requests.get(
-      url, headers=headers
+@st.cache_resource
+def get_sheet_index() -> sheet_index.SheetIndex:
+  # One request for the whole tree, revalidated with its ETag.
+  return sheet_index.SheetIndex(
+      "yufanyufan/open_music_sheet",
+      token=st.secrets["github_key"],
+      cache_path=os.path.join(musicpy_xsd.cache_dir(), "sheet_index.json"),
   )
-  logging.info(response)
-  response.raise_for_status()  # Raise an exception for bad status codes
-  data = response.json()
-  return [
-      item["name"] + "/" if item["type"] == "dir" else item["name"]
-      for item in data
-      if item["name"].endswith(".py") or item["type"] == "dir"
-  ]
+
+
+def list_sheet(dir=""):
+  return get_sheet_index().list(dir)
 
 
 st.markdown("Choose a file")
@@ -72,34 +69,30 @@ def render_path_chooser(path: str) -> str:
 
 
 @st.cache_data
-def get_music_sheet(path: str) -> str:
-  url = (
-      "https://raw.githubusercontent.com/yufanyufan/open_music_sheet/main/"
-      + path
-  )
-  response = requests.get(url)
-  response.raise_for_status()  # Raise an exception for bad status codes
-  return response.text
+def get_music_sheet(sha: str) -> str:
+  """Fetches the sheet whose blob SHA is `sha`, see `SheetIndex.blob`."""
+  return get_sheet_index().blob(sha).decode("utf-8")
 
 
 def render_music_sheet(path: str) -> str:
-  st.session_state.svg = []
+  st.session_state.score = None
   st.session_state.path = path
-  music_sheet = get_music_sheet(path)
+  sha = get_sheet_index().sha(path)
+  if sha is None:
+    st.error(f"{path} is not in the repository.")
+    return
+  music_sheet = get_music_sheet(sha)
   try:
-    xml = musicpy_ast.safe_exec_musicpy(music_sheet)
+    # Popular sheets are rendered once, not once per visitor.
+    result = musicpy_render.submit_render(
+        music_sheet, disk=musicpy_render.default_render_cache()
+    ).result()
   except Exception as e:
     st.error(e)
     return
-  toolkit = verovio.toolkit()
-  toolkit.setResourcePath(
-      os.path.join(os.path.dirname(verovio.__file__), "data")
-  )
-  toolkit.setInputFrom("musicxml")
-  toolkit.loadData(xml)
-  page_count = toolkit.getPageCount()
-  for i in range(page_count):
-    st.session_state.svg.append(toolkit.renderToSVG(i + 1))
+  # Pages are rendered when shown, and cached across sessions.
+  st.session_state.score = result
+
 
 path = render_path_chooser("/")
 if path.endswith("/"):
@@ -119,19 +112,11 @@ if path and path.endswith(".py"):
 if path and path.endswith(".py"):
   if "path" not in st.session_state:
     st.session_state.path = None
-  if "svg" not in st.session_state:
-    st.session_state.svg = None
+  if "score" not in st.session_state:
+    st.session_state.score = None
 
   if st.session_state.path != path:
     render_music_sheet(path)
 
-  if st.session_state.svg:
-    if len(st.session_state.svg) > 1:
-      tabs = st.tabs(
-          [f"Page {i + 1}" for i in range(len(st.session_state.svg))]
-      )
-      for i, svg in enumerate(st.session_state.svg):
-        with tabs[i]:
-          st.image(svg)
-    else:
-      st.image(st.session_state.svg[0])
+  if st.session_state.score:
+    musicpy_streamlit.show_page(st.session_state.score, key=f"page:{path}")
@@ -1,13 +1,56 @@
-import os
+import concurrent.futures
 import textwrap
 from code_editor import code_editor
-import musicpy_ast
+import musicpy_render
+import musicpy_streamlit
+import musicpy_timeline
 import streamlit as st
-import verovio
 
 st.set_page_config(page_title="MusicPy", page_icon="🎼", layout="wide")
 
 
+@st.cache_resource
+def timeline_executor() -> concurrent.futures.ThreadPoolExecutor:
+  """Checks timing off the script thread, since parsing a long score is slow."""
+  return concurrent.futures.ThreadPoolExecutor(
+      max_workers=1, thread_name_prefix="musicpy-timeline"
+  )
+
+
+def _check_timeline(musicpy: str) -> list[musicpy_timeline.TimelineIssue]:
+  try:
+    return musicpy_timeline.check_timeline(musicpy)
+  except SyntaxError:
+    return []
+
+
+@st.cache_resource(max_entries=16)
+def check_timeline(musicpy: str) -> concurrent.futures.Future:
+  """Starts checking each source once, rather than on every rerun of the app."""
+  return timeline_executor().submit(_check_timeline, musicpy)
+
+
+def _wait_for_timeline(check: concurrent.futures.Future):
+  if check.done():
+    st.rerun()  # Shows the issues, and stops polling.
+  st.caption("Checking the timing of the measures...")
+
+
+def show_timeline(musicpy: str):
+  check = check_timeline(musicpy)
+  if not check.done():
+    st.fragment(run_every=0.5)(_wait_for_timeline)(check)
+    return
+  issues = check.result()
+  if issues:
+    with st.expander(
+        f"{len(issues)} timing issue(s): measures that do not fill their"
+        " time signature",
+        expanded=True,
+    ):
+      st.code("\n".join(str(issue) for issue in issues), language=None)
+
+
 def main():
   musicpy = code_editor(
       "",
@@ -18,45 +61,32 @@ def main():
       response_mode="blur",
   )["text"]
 
-  if "svg" not in st.session_state:
-    st.session_state.svg = None
+  show_timeline(musicpy)
+
+  if "score" not in st.session_state:
+    st.session_state.score = None
   if "xml" not in st.session_state:
     st.session_state.xml = None
 
   if st.button("Render", icon=":material/save:", type="primary"):
     try:
-      st.session_state.xml = musicpy_ast.safe_exec_musicpy(musicpy)
+      result = musicpy_render.submit_render(musicpy).result()
     except Exception as e:
       st.session_state.xml = None
-      st.session_state.svg = None
+      st.session_state.score = None
       st.error(e)
       return
-    toolkit = verovio.toolkit()
-    toolkit.setResourcePath(
-        os.path.join(os.path.dirname(verovio.__file__), "data")
-    )
-    toolkit.setInputFrom("musicxml")
-    toolkit.loadData(st.session_state.xml)
-    page_count = toolkit.getPageCount()
-    st.session_state.svg = []
-    for i in range(page_count):
-      st.session_state.svg.append(toolkit.renderToSVG(i + 1))
-    st.rerun()
+    st.session_state.xml = result.xml
+    # Pages are rendered when shown, and cached across sessions.
+    st.session_state.score = result
+    st.session_state.pop("page", None)  # Back to the first page.
 
   if st.session_state.xml:
     with st.expander("MusicXML"):
       st.code(st.session_state.xml)
 
-  if st.session_state.svg:
-    if len(st.session_state.svg) > 1:
-      tabs = st.tabs(
-          [f"Page {i + 1}" for i in range(len(st.session_state.svg))]
-      )
-      for i, svg in enumerate(st.session_state.svg):
-        with tabs[i]:
-          st.image(svg)
-    else:
-      st.image(st.session_state.svg[0])
+  if st.session_state.score:
+    musicpy_streamlit.show_page(st.session_state.score, key="page")
 
 
 main()
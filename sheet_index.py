@@ -0,0 +1,252 @@
+"""Index of the files in a GitHub repository of music sheets.
+
+`SheetIndex` loads the whole file tree of a repository with one recursive git
+trees request,
+
+  GET {base_url}/repos/{repo}/git/trees/{ref}?recursive=1
+
+instead of one contents request per directory, and answers directory
+listings from memory. The tree is revalidated at most every `max_age`
+seconds with `If-None-Match` and the ETag of the last response; GitHub
+answers 304 Not Modified when nothing changed, which does not count against
+the rate limit. With a `cache_path`, the tree and its ETag are also kept on
+disk, so that a restarted server revalidates rather than downloads it.
+
+Files are fetched by the SHA of their blob in the tree (`SheetIndex.blob`),
+
+  GET {base_url}/repos/{repo}/git/blobs/{sha}
+
+so their content always matches the SHA they are cached by, unlike that of a
+branch, which a CDN may serve stale.
+
+Environment variables:
+  MUSICPY_GITHUB_API: Base URL of the GitHub API, e.g. of a local stand-in
+    for testing. Defaults to https://api.github.com.
+"""
+
+import dataclasses
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import requests
+
+_DEFAULT_API = "https://api.github.com"
+
+# Values of `TreeEntry.type`.
+BLOB = "blob"
+TREE = "tree"
+
+
+@dataclasses.dataclass(frozen=True)
+class TreeEntry:
+  """A file or directory of the repository.
+
+  Attributes:
+    path: The path from the root of the repository, without a leading "/".
+    type: `BLOB` for files, `TREE` for directories.
+    sha: The git object SHA, which changes with the content.
+  """
+
+  path: str
+  type: str
+  sha: str
+
+
+class SheetIndex:
+  """The file tree of a GitHub repository, see the module docstring.
+
+  Thread-safe.
+  """
+
+  def __init__(
+      self,
+      repo: str,
+      ref: str = "main",
+      token: str | None = None,
+      base_url: str | None = None,
+      cache_path: str | None = None,
+      max_age: float = 60,
+      timeout: float = 10,
+  ):
+    """Initializes the index, from `cache_path` if it exists.
+
+    Args:
+      repo: The repository, as "owner/name".
+      ref: The branch, tag or commit to list.
+      token: The value of the Authorization header, if any.
+      base_url: Base URL of the GitHub API, defaults to $MUSICPY_GITHUB_API.
+      cache_path: A JSON file to keep the tree in across processes.
+      max_age: Seconds before the tree is revalidated.
+      timeout: Seconds to wait for GitHub.
+    """
+    self.repo = repo
+    self.ref = ref
+    self.token = token
+    self.base_url = (
+        base_url or os.environ.get("MUSICPY_GITHUB_API", _DEFAULT_API)
+    ).rstrip("/")
+    self.cache_path = cache_path
+    self.max_age = max_age
+    self.timeout = timeout
+    # Requests made, and how many of them were answered with 304.
+    self.requests = 0
+    self.not_modified = 0
+    self._lock = threading.Lock()
+    self._entries = None  # `TreeEntry` by path.
+    self._children = None  # Entries by the path of their directory.
+    self._etag = None
+    self._checked = None  # When the tree was last fetched or revalidated.
+    if cache_path is not None:
+      self._load()
+
+  @property
+  def url(self) -> str:
+    return f"{self.base_url}/repos/{self.repo}/git/trees/{self.ref}"
+
+  def _set_tree(self, entries: list[TreeEntry], etag: str | None):
+    self._entries = {entry.path: entry for entry in entries}
+    self._children = {}
+    for entry in entries:
+      parent = entry.path.rpartition("/")[0]
+      self._children.setdefault(parent, []).append(entry)
+    self._etag = etag
+
+  def _load(self):
+    try:
+      with open(self.cache_path, "r") as f:
+        data = json.load(f)
+      entries = [TreeEntry(*entry) for entry in data["tree"]]
+    except (OSError, ValueError, KeyError, TypeError):
+      return
+    self._set_tree(entries, data.get("etag"))
+
+  def _save(self):
+    data = {
+        "etag": self._etag,
+        "tree": [dataclasses.astuple(e) for e in self._entries.values()],
+    }
+    directory = os.path.dirname(self.cache_path) or "."
+    try:
+      os.makedirs(directory, exist_ok=True)
+      fd, staging = tempfile.mkstemp(dir=directory, prefix=".")
+      with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+      os.replace(staging, self.cache_path)
+    except OSError as e:
+      logging.warning(f"Could not write {self.cache_path}: {e}")
+
+  def refresh(self, force: bool = False) -> bool:
+    """Fetches or revalidates the tree, unless it is recent enough.
+
+    A failed revalidation keeps the tree that was loaded before.
+
+    Args:
+      force: Whether to revalidate even a tree younger than `max_age`.
+
+    Returns:
+      Whether the tree changed.
+
+    Raises:
+      requests.RequestException: If there is no tree to fall back to.
+    """
+    with self._lock:
+      now = time.monotonic()
+      if (
+          not force
+          and self._checked is not None
+          and now - self._checked < self.max_age
+      ):
+        return False
+      headers = {"Accept": "application/vnd.github+json"}
+      if self.token:
+        headers["Authorization"] = self.token
+      if self._entries is not None and self._etag:
+        headers["If-None-Match"] = self._etag
+      try:
+        self.requests += 1
+        response = requests.get(
+            self.url,
+            params={"recursive": "1"},
+            headers=headers,
+            timeout=self.timeout,
+        )
+        if response.status_code == 304:
+          self.not_modified += 1
+          self._checked = now
+          return False
+        response.raise_for_status()
+        data = response.json()
+      except (requests.RequestException, ValueError) as e:
+        if self._entries is None:
+          raise
+        logging.warning(f"Using the cached tree of {self.repo}: {e}")
+        self._checked = now  # Do not retry on every listing.
+        return False
+      if data.get("truncated"):
+        logging.warning(f"The tree of {self.repo} is truncated by GitHub.")
+      self._set_tree(
+          [
+              TreeEntry(item["path"], item["type"], item["sha"])
+              for item in data["tree"]
+              if item["type"] in (BLOB, TREE)
+          ],
+          response.headers.get("ETag"),
+      )
+      self._checked = now
+      if self.cache_path is not None:
+        self._save()
+      return True
+
+  def entries(self) -> dict[str, TreeEntry]:
+    """Returns every file and directory by path."""
+    self.refresh()
+    return self._entries
+
+  def list(self, directory: str = "/", suffix: str = ".py") -> list[str]:
+    """Lists a directory like the "Choose a file" menus of open_music_sheet.
+
+    Args:
+      directory: The directory, e.g. "/" or "/Bach/".
+      suffix: The files to list; directories are always listed.
+
+    Returns:
+      The names of the files ending with `suffix` and of the directories,
+      which end with "/", in git order. Empty if the directory does not
+      exist.
+    """
+    self.refresh()
+    names = []
+    for entry in self._children.get(directory.strip("/"), ()):
+      name = entry.path.rpartition("/")[2]
+      if entry.type == TREE:
+        names.append(name + "/")
+      elif name.endswith(suffix):
+        names.append(name)
+    return names
+
+  def sha(self, path: str) -> str | None:
+    """Returns the git SHA of the file or directory at `path`, if any."""
+    entry = self.entries().get(path.strip("/"))
+    return entry.sha if entry is not None else None
+
+  def blob(self, sha: str) -> bytes:
+    """Fetches the content of the file whose git SHA is `sha`.
+
+    Blobs never change, so the result can be cached by `sha` for good.
+
+    Raises:
+      requests.RequestException: If the request fails.
+    """
+    headers = {"Accept": "application/vnd.github.raw+json"}
+    if self.token:
+      headers["Authorization"] = self.token
+    response = requests.get(
+        f"{self.base_url}/repos/{self.repo}/git/blobs/{sha}",
+        headers=headers,
+        timeout=self.timeout,
+    )
+    response.raise_for_status()
+    return response.content
@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep the on-disk caches of the modules under test out of the home directory.
+os.environ.setdefault(
+    "MUSICPY_CACHE_DIR", tempfile.mkdtemp(prefix="musicpy-test-cache-")
+)
+
+import musicpy
+import musicpy_cache
+import musicpy_xsd
+
+# A small stand-in for the MusicXML schema: partwise scores whose notes have a
+# positive duration and an optional voice.
+MUSICXML_XSD = """\
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="score-partwise">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="part" maxOccurs="unbounded">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:element name="measure" maxOccurs="unbounded">
+                <xs:complexType>
+                  <xs:sequence>
+                    <xs:element name="note" type="note" minOccurs="0"
+                        maxOccurs="unbounded"/>
+                  </xs:sequence>
+                  <xs:attribute name="number" type="xs:token" use="required"/>
+                </xs:complexType>
+              </xs:element>
+            </xs:sequence>
+            <xs:attribute name="id" type="xs:token" use="required"/>
+          </xs:complexType>
+        </xs:element>
+      </xs:sequence>
+      <xs:attribute name="version" type="xs:token"/>
+    </xs:complexType>
+  </xs:element>
+  <xs:complexType name="note">
+    <xs:sequence>
+      <xs:element name="duration" type="xs:positiveInteger"/>
+      <xs:element name="voice" type="xs:string" minOccurs="0"/>
+    </xs:sequence>
+  </xs:complexType>
+</xs:schema>
+"""
+IMPORTED_XSD = '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"/>\n'
+
+
+def _forget_schemas():
+  musicpy_xsd._schema_document = None
+  musicpy_xsd._element_types = None
+  musicpy_xsd._local = threading.local()
+  musicpy_cache._schema_version.cache_clear()
+  pending = [musicpy.MusicElementBase]
+  while pending:
+    cls = pending.pop()
+    if "schema" in cls.__dict__ and cls is not musicpy.MusicElementBase:
+      type.__delattr__(cls, "schema")
+    pending.extend(cls.__subclasses__())
+
+
+@pytest.fixture
+def schema_dir(tmp_path, monkeypatch):
+  """Points musicpy at the stand-in schema, returns its directory."""
+  directory = tmp_path / "schema"
+  directory.mkdir()
+  (directory / "musicxml.xsd").write_text(MUSICXML_XSD)
+  (directory / "xml.xsd").write_text(IMPORTED_XSD)
+  (directory / "xlink.xsd").write_text(IMPORTED_XSD)
+  monkeypatch.setenv("MUSICPY_SCHEMA_DIR", str(directory))
+  monkeypatch.setenv("MUSICPY_CACHE_DIR", str(tmp_path / "cache"))
+  _forget_schemas()
+  yield directory
+  _forget_schemas()
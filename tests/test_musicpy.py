@@ -0,0 +1,304 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import gc
+import io
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+from lxml import etree
+import pytest
+import musicpy
+from musicpy import MusicElementBase, MusicPy, _
+import musicpy_schema
+
+
+def _build(element_class, *args, **kwargs) -> str:
+  with MusicPy(validation_policy="off") as session:
+    element_class(*args, **kwargs)
+  return session.get_xml(None)
+
+
+def test_element_wrappers_have_no_dict():
+  note = musicpy_schema.Note(Duration=1)
+  assert not hasattr(note, "__dict__")
+  # Aliases, which AutoAlias subclasses, get empty slots too.
+  assert musicpy_schema.Note.Duration.__dict__["__slots__"] == ()
+  assert not hasattr(musicpy_schema.Note.Duration(1), "__dict__")
+
+
+# Prints whether the constructors were compiled, then the example score.
+_BUILD_EXAMPLE = textwrap.dedent("""\
+    import sys
+    import musicpy
+    import musicpy_ast
+    with open(sys.argv[1]) as f:
+      source = musicpy_ast.strip_imports(f.read())
+    print(musicpy.COMPILED_CONSTRUCTORS)
+    print(musicpy_ast.safe_exec_musicpy(source))
+""")
+
+
+def test_compiled_constructors_build_the_same_elements():
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  outputs = {}
+  for compiled in ("0", "1"):
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            _BUILD_EXAMPLE,
+            os.path.join(root, "example", "op299-no1.py"),
+        ],
+        capture_output=True,
+        check=True,
+        cwd=root,
+        env={
+            **os.environ,
+            "MUSICPY_COMPILED_CONSTRUCTORS": compiled,
+            # Run the score itself, so constructors are called from its frame.
+            "MUSICPY_EVALUATOR": "0",
+            "MUSICPY_VALIDATION": "off",
+        },
+        text=True,
+    )
+    flag, _, outputs[compiled] = result.stdout.partition("\n")
+    assert flag == str(compiled == "1")
+  assert outputs["0"].count("<note") > 400
+  assert outputs["0"] == outputs["1"]
+
+
+def _live_wrappers() -> list[MusicElementBase]:
+  gc.collect()
+  return [o for o in gc.get_objects() if isinstance(o, MusicElementBase)]
+
+
+def test_only_the_wrappers_of_open_blocks_stay_alive():
+  with MusicPy(validation_policy="off") as session:
+    with musicpy_schema.ScorePartwise(version="4.0") as score:
+      with musicpy_schema.ScorePartwise.Part(id="P1") as part:
+        for number in range(1, 11):
+          with musicpy_schema.ScorePartwise.Part.Measure(number=number) as m:
+            for _ in range(10):
+              musicpy_schema.Note(Duration=1)
+            assert set(map(id, _live_wrappers())) == {
+                id(score),
+                id(part),
+                id(m),
+            }
+  del part, m
+  # The session keeps the root of its score.
+  assert [id(o) for o in _live_wrappers()] == [id(session.child)]
+
+
+def test_rebinding_an_alias_clears_the_keyword_caches():
+
+  class Leaf(MusicElementBase):
+
+    def __init__(self, plain_text: str):
+      self.init()
+
+  class Numbered(MusicElementBase):
+
+    def __init__(self, number: str):
+      self.init()
+
+  class Holder(MusicElementBase):
+    Item = Leaf
+
+    def __init__(self, Item: Item = None):
+      self.init()
+
+  class Derived(Holder):
+    pass
+
+  assert _build(Holder, Item="x") == "<holder><item>x</item></holder>"
+  assert _build(Derived, Item="x") == "<derived><item>x</item></derived>"
+  Holder.Item = Numbered
+  numbered = '<item number="1"/>'
+  assert _build(Holder, Item=_(number=1)) == f"<holder>{numbered}</holder>"
+  assert _build(Derived, Item=_(number=1)) == f"<derived>{numbered}</derived>"
+
+
+def _build_measures(measures: int, fail_in: int | None = None):
+  with musicpy_schema.ScorePartwise(version="4.0"):
+    with musicpy_schema.ScorePartwise.Part(id="P1"):
+      for number in range(1, measures + 1):
+        with musicpy_schema.ScorePartwise.Part.Measure(number=number):
+          musicpy_schema.Note(Duration=1)
+          if number == fail_in:
+            raise KeyError(number)
+
+
+@pytest.mark.parametrize("policy", ["eager", "deferred", "off"])
+def test_streamed_score_matches_the_score_built_in_memory(schema_dir, policy):
+  with MusicPy(validation_policy=policy) as session:
+    _build_measures(50)
+  sink = io.BytesIO()
+  with MusicPy(stream=sink, validation_policy=policy):
+    _build_measures(50)
+  parser = etree.XMLParser(remove_blank_text=True)
+  streamed = etree.fromstring(sink.getvalue(), parser)
+  assert etree.tostring(streamed, method="c14n") == etree.tostring(
+      etree.fromstring(session.get_xml(None)), method="c14n"
+  )
+
+
+def test_failed_stream_is_left_unterminated():
+  sink = io.BytesIO()
+  with pytest.raises(KeyError):
+    with MusicPy(stream=sink, validation_policy="off") as session:
+      _build_measures(5, fail_in=3)
+  assert session.stream_writer.failed
+  output = sink.getvalue().decode("utf-8")
+  # The completed measures were written, nothing after them.
+  assert output.endswith('<measure number="2"><note><duration>1</duration>'
+                         "</note></measure>")
+  with pytest.raises(etree.XMLSyntaxError):
+    etree.fromstring(sink.getvalue())
+
+
+# Prints how much the resident memory grew while the score was built, taken
+# inside its last measure, before an in-memory tree could be released.
+_BUILD_MEMORY = textwrap.dedent("""\
+    import os, sys
+    import musicpy
+    from musicpy_schema import Note, ScorePartwise
+
+    def resident():
+      with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    measures = int(sys.argv[1])
+    stream = os.devnull if sys.argv[2] == "stream" else None
+    with musicpy.MusicPy(stream=stream, validation_policy="off"):
+      with ScorePartwise(version="4.0"):
+        with ScorePartwise.Part(id="P1"):
+          Note(Duration=1)  # Warms up the constructors.
+          before = resident()
+          for number in range(1, measures + 1):
+            with ScorePartwise.Part.Measure(number=number):
+              Note(Duration=1)
+          print(resident() - before)
+""")
+
+
+def _build_memory(measures: int, mode: str) -> int:
+  result = subprocess.run(
+      [sys.executable, "-c", _BUILD_MEMORY, str(measures), mode],
+      capture_output=True,
+      check=True,
+      cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+      text=True,
+  )
+  return int(result.stdout)
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/statm"), reason="Needs /proc/self/statm."
+)
+def test_streaming_memory_does_not_grow_with_the_score():
+  megabyte = 1024 * 1024
+  assert _build_memory(2000, "stream") < 2 * megabyte
+  assert _build_memory(20000, "stream") < 2 * megabyte
+  assert _build_memory(20000, "memory") > 8 * megabyte
+
+
+# The validation policy of the session each build was started with.
+_build_policy = contextvars.ContextVar("build_policy")
+
+
+def _build_concurrently(policy: str, backend: str, barrier=None) -> str:
+  _build_policy.set(policy)
+  if barrier is not None:
+    barrier.wait()  # Starts the builds of all threads together.
+  with MusicPy(validation_policy=policy, backend=backend) as session:
+    _build_measures(40)
+  return session.get_xml()
+
+
+async def _build_in_task(policy: str, backend: str) -> str:
+  _build_policy.set(policy)
+  with MusicPy(validation_policy=policy, backend=backend) as session:
+    with musicpy_schema.ScorePartwise(version="4.0"):
+      with musicpy_schema.ScorePartwise.Part(id="P1"):
+        for number in range(1, 41):
+          with musicpy_schema.ScorePartwise.Part.Measure(number=number):
+            musicpy_schema.Note(Duration=1)
+            await asyncio.sleep(0)  # Lets the other builds run.
+  return session.get_xml()
+
+
+def test_concurrent_builds_keep_their_own_sessions(schema_dir, monkeypatch):
+  validations = []  # (policy of the build, policy of the session, kind)
+
+  def spy(kind, validate):
+    def spied(self, *args, **kwargs):
+      session = musicpy._current_session.get()
+      validations.append(
+          (_build_policy.get(), session.validation_policy, kind)
+      )
+      return validate(self, *args, **kwargs)
+
+    return spied
+
+  for kind, name in (
+      ("eager", "_validate_xml_subtree"),
+      ("deferred", "_validate_document"),
+  ):
+    monkeypatch.setattr(
+        MusicElementBase, name, spy(kind, getattr(MusicElementBase, name))
+    )
+  expected = _build_concurrently("off", "lxml")
+  combinations = [
+      (policy, backend)
+      for policy in musicpy.VALIDATION_POLICIES
+      for backend in ("lxml", "columnar")
+  ]
+
+  async def build_in_tasks():
+    return await asyncio.gather(*(
+        _build_in_task(*combinations[i % len(combinations)]) for i in range(12)
+    ))
+
+  barrier = threading.Barrier(8)
+  with concurrent.futures.ThreadPoolExecutor(8) as executor:
+    futures = [
+        executor.submit(
+            _build_concurrently,
+            *combinations[i % len(combinations)],
+            barrier,
+        )
+        for i in range(32)
+    ]
+    # The tasks run on this thread while the pool builds.
+    outputs = asyncio.run(build_in_tasks())
+    outputs += [future.result() for future in futures]
+  assert outputs == [expected] * 44
+  assert {kind for _, _, kind in validations} == {"eager", "deferred"}
+  for build_policy, session_policy, kind in validations:
+    assert build_policy == session_policy == kind
+
+
+@pytest.mark.parametrize("backend", musicpy.BACKENDS)
+def test_compact_output_is_the_indented_output_without_whitespace(backend):
+  with MusicPy(backend=backend, validation_policy="off") as session:
+    with musicpy_schema.ScorePartwise(version="4.0"):
+      with musicpy_schema.ScorePartwise.Part(id="P1"):
+        with musicpy_schema.ScorePartwise.Part.Measure(number=1):
+          musicpy_schema.Note(Pitch=_(Step="C", Octave=4), Duration=1)
+          with musicpy_schema.Note(Duration=2):
+            musicpy_schema.Lyric(Text="la la")
+  compact = session.get_xml(None)
+  assert "<text>la la</text>" in compact
+  for element in etree.fromstring(compact).iter():
+    assert element.tail is None
+    assert not len(element) or element.text is None
+  indented = session.get_xml()
+  assert indented.count("\n") > 10
+  parser = etree.XMLParser(remove_blank_text=True)
+  assert etree.tostring(
+      etree.fromstring(compact), method="c14n"
+  ) == etree.tostring(etree.fromstring(indented, parser), method="c14n")
@@ -0,0 +1,154 @@
+import os
+import numpy as np
+import pytest
+import musicpy
+from musicpy import MusicPy, _
+import musicpy_analysis
+import musicpy_ast
+from musicpy_schema import Backup, Note, ScorePartwise
+
+EXAMPLE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "example",
+    "op299-no1.py",
+)
+
+# Voice 2 of the first measure is shorter than voice 1, and the second
+# measure starts voice 2 with a forward.
+SCORE = """\
+<score-partwise version="4.0"><part id="P1">
+  <measure number="1">
+    <attributes><divisions>2</divisions></attributes>
+    <note><pitch><step>C</step><octave>4</octave></pitch>
+      <duration>4</duration><voice>1</voice></note>
+    <note><chord/><pitch><step>E</step><octave>4</octave></pitch>
+      <duration>4</duration><voice>1</voice></note>
+    <note><pitch><step>G</step><alter>1</alter><octave>4</octave></pitch>
+      <duration>2</duration><voice>1</voice></note>
+    <backup><duration>6</duration></backup>
+    <note><rest/><duration>4</duration><voice>2</voice></note>
+  </measure>
+  <measure number="2">
+    <note><pitch><step>A</step><octave>3</octave></pitch>
+      <duration>4</duration><voice>1</voice></note>
+    <backup><duration>4</duration></backup>
+    <forward><duration>2</duration><voice>2</voice></forward>
+    <note><pitch><step>B</step><alter>-1</alter><octave>3</octave></pitch>
+      <duration>2</duration><voice>2</voice></note>
+  </measure>
+</part></score-partwise>
+"""
+
+
+@pytest.fixture
+def table() -> musicpy_analysis.NoteTable:
+  return musicpy_analysis.score_tables(SCORE)["P1"]
+
+
+def test_score_tables(table):
+  N, B, F = (
+      musicpy_analysis.NOTE,
+      musicpy_analysis.BACKUP,
+      musicpy_analysis.FORWARD,
+  )
+  assert table.measure_numbers == ["1", "2"]
+  assert table.measure.tolist() == [0, 0, 0, 0, 0, 1, 1, 1, 1]
+  assert table.kind.tolist() == [N, N, N, B, N, N, B, F, N]
+  assert table.chord.tolist() == [0, 1, 0, 0, 0, 0, 0, 0, 0]
+  assert table.rest.tolist() == [0, 0, 0, 0, 1, 0, 0, 0, 0]
+  assert table.voice.tolist() == [1, 1, 1, -1, 2, 1, -1, 2, 2]
+  assert table.divisions.tolist() == [2] * 9
+
+
+def test_onsets_per_measure(table):
+  assert musicpy_analysis.onsets(table, absolute=False).tolist() == [
+      0, 0, 4, 6, 0, 0, 4, 0, 2
+  ]
+
+
+def test_onsets_from_the_start_of_the_part(table):
+  assert musicpy_analysis.onsets(table).tolist() == [
+      0, 0, 4, 6, 0, 6, 10, 6, 8
+  ]
+
+
+def test_measure_durations_are_those_of_the_longest_voice(table):
+  assert musicpy_analysis.measure_durations(table).tolist() == [6, 4]
+
+
+def test_voice_durations(table):
+  voices, durations = musicpy_analysis.voice_durations(table)
+  assert voices.tolist() == [1, 2]
+  # Chord notes do not count, forwards do.
+  assert durations.tolist() == [[6, 4], [4, 4]]
+
+
+def test_voice_counts_include_chord_notes_and_rests(table):
+  assert musicpy_analysis.voice_counts(table) == {1: 4, 2: 2}
+
+
+def test_pitch_range_includes_alterations(table):
+  pitches = musicpy_analysis.midi_pitches(table)
+  assert pitches[[0, 1, 2, 5, 8]].tolist() == [60, 64, 68, 57, 58]
+  assert np.isnan(pitches[[3, 4, 6, 7]]).all()
+  assert musicpy_analysis.pitch_range(table) == (57, 68)
+
+
+def test_empty_part():
+  table = musicpy_analysis.score_tables(
+      '<score-partwise><part id="P1"><measure number="1"/></part>'
+      "</score-partwise>"
+  )["P1"]
+  assert not len(table)
+  assert musicpy_analysis.onsets(table).tolist() == []
+  assert musicpy_analysis.measure_durations(table).tolist() == [0]
+  assert musicpy_analysis.pitch_range(table) is None
+
+
+def _assert_same_tables(tables, expected):
+  assert tables.keys() == expected.keys()
+  for part, table in tables.items():
+    assert table.measure_numbers == expected[part].measure_numbers
+    for name in musicpy_analysis._DTYPES:
+      np.testing.assert_array_equal(
+          getattr(table, name), getattr(expected[part], name), err_msg=name
+      )
+
+
+def test_columnar_tables_match_the_parsed_xml():
+  sessions = {}
+  for backend in ("lxml", "columnar"):
+    with MusicPy(backend=backend, validation_policy="off") as session:
+      with ScorePartwise(version="4.0"):
+        with ScorePartwise.Part(id="P1"):
+          for number in range(1, 4):
+            with ScorePartwise.Part.Measure(number=number):
+              Note(Pitch=_(Step="C", Alter=-1, Octave=4), Duration=2)
+              Note(Chord=_(), Pitch=_(Step="E", Octave=4), Duration=2, Voice=1)
+              Backup(Duration=2)
+              Note(Rest=_(), Duration=1.5, Voice=2, Staff=2)
+              # Not compacted by the columnar backend.
+              Note(Rest=_(), Duration="01", Voice=2)
+    sessions[backend] = session
+  parsed = musicpy_analysis.score_tables(sessions["lxml"].get_xml())
+  _assert_same_tables(musicpy_analysis.score_tables(sessions["lxml"]), parsed)
+  _assert_same_tables(
+      musicpy_analysis.score_tables(sessions["columnar"]), parsed
+  )
+
+
+def test_example_tables_match_the_parsed_xml(monkeypatch):
+  monkeypatch.setattr(musicpy._default_session, "validation_policy", "off")
+  monkeypatch.setattr(
+      musicpy._default_session, "backend", musicpy._new_backend("columnar")
+  )
+  with open(EXAMPLE) as f:
+    source = musicpy_ast.strip_imports(f.read())
+  result = musicpy.ScopedNames()
+  exec(musicpy_ast.compile_musicpy(source), {}, result)
+  session = result["__score"]
+  tables = musicpy_analysis.score_tables(session)
+  assert len(tables["P1"]) > 400
+  _assert_same_tables(
+      tables, musicpy_analysis.score_tables(session.get_xml())
+  )
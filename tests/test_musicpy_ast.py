@@ -0,0 +1,146 @@
+import logging
+import os
+import traceback
+import pytest
+import musicpy
+import musicpy_ast
+
+# The notes on lines 4 and 8 have durations that are not positive.
+INVALID_SCORE = """\
+with ScorePartwise(version="4.0"):
+  with Part(id="P1"):
+    with Measure(number=1):
+      Note(Duration=0)
+    with (
+        Measure(number=2),
+    ):
+      Note(Duration=-1)
+"""
+
+EXAMPLE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "example",
+    "op299-no1.py",
+)
+
+
+@pytest.mark.parametrize("backend", musicpy.BACKENDS)
+@pytest.mark.parametrize("policy", musicpy.VALIDATION_POLICIES)
+def test_evaluator_output_is_identical_to_exec(
+    schema_dir, monkeypatch, backend, policy
+):
+  monkeypatch.setattr(
+      musicpy._default_session, "backend", musicpy._new_backend(backend)
+  )
+  monkeypatch.setattr(musicpy._default_session, "validation_policy", policy)
+  with open(EXAMPLE) as f:
+    source = musicpy_ast.strip_imports(f.read())
+  evaluated = musicpy_ast.evaluate_musicpy(source)
+  assert evaluated is not None
+  monkeypatch.setattr(musicpy_ast, "EVALUATOR", False)
+  assert evaluated == musicpy_ast.safe_exec_musicpy(source)
+
+
+def _error_origins(caplog) -> list[str]:
+  return [
+      record.getMessage().partition(": Schema Validation Error")[0]
+      for record in caplog.records
+      if "Schema Validation Error" in record.getMessage()
+  ]
+
+
+@pytest.mark.parametrize("policy", ["eager", "deferred"])
+def test_evaluator_reports_errors_at_the_same_origin_as_exec(
+    schema_dir, monkeypatch, caplog, policy
+):
+  monkeypatch.setattr(musicpy._default_session, "validation_policy", policy)
+  # Not left to `exec`.
+  assert musicpy_ast.evaluate_musicpy(INVALID_SCORE) is not None
+  origins = {}
+  for evaluator in (True, False):
+    monkeypatch.setattr(musicpy_ast, "EVALUATOR", evaluator)
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+      musicpy_ast.safe_exec_musicpy(INVALID_SCORE)
+    origins[evaluator] = _error_origins(caplog)
+  assert origins[False]
+  assert origins[True] == origins[False]
+  assert all(origin.startswith("<string>:") for origin in origins[True])
+
+
+@pytest.mark.parametrize("evaluator", [True, False])
+@pytest.mark.parametrize(
+    "policy, expected",
+    [
+        # Every block that holds an invalid note, as it exits.
+        ("eager", ["<string>:3", "<string>:5", "<string>:2", "<string>:1"]),
+        # The lines that created the invalid notes.
+        ("deferred", ["<string>:4", "<string>:8"]),
+    ],
+)
+def test_errors_are_reported_at_their_source_lines(
+    schema_dir, monkeypatch, caplog, evaluator, policy, expected
+):
+  monkeypatch.setattr(musicpy._default_session, "validation_policy", policy)
+  monkeypatch.setattr(musicpy_ast, "EVALUATOR", evaluator)
+  with caplog.at_level(logging.INFO):
+    musicpy_ast.safe_exec_musicpy(INVALID_SCORE)
+  assert _error_origins(caplog) == expected
+
+
+
+def _exec_xml(code) -> str:
+  result = musicpy.ScopedNames()
+  exec(code, {}, result)
+  return result["__score"].get_xml()
+
+
+@pytest.mark.parametrize(
+    "source, error",
+    [
+        ("", ValueError),
+        ("import os\n", ValueError),
+        ("Note(Duration=len('ab'))\n", ValueError),
+        ("with Note(:\n", SyntaxError),
+    ],
+)
+def test_compile_rejects_invalid_sources(source, error):
+  with pytest.raises(error):
+    musicpy_ast.compile_musicpy(source)
+
+
+def test_compiled_code_is_cached_in_memory_and_on_disk(monkeypatch):
+  source = INVALID_SCORE + "# Not compiled by another test.\n"
+  code = musicpy_ast.compile_musicpy(source)
+  assert musicpy_ast.compile_musicpy(source) is code
+
+  def no_parse(musicpy):
+    raise AssertionError("parsed again")
+
+  monkeypatch.setattr(musicpy_ast, "parse_musicpy", no_parse)
+  monkeypatch.setattr(musicpy_ast, "_codes", type(musicpy_ast._codes)())
+  from_disk = musicpy_ast.compile_musicpy(source)
+  assert from_disk is not code
+  assert _exec_xml(from_disk) == _exec_xml(code)
+
+
+def test_corrupt_compiled_code_on_disk_is_ignored(monkeypatch):
+  source = INVALID_SCORE + "# Corrupted.\n"
+  key = musicpy_ast._code_key(source)
+  musicpy_ast._code_disk_cache().put(key, b"not marshal data")
+  code = musicpy_ast.compile_musicpy(source)
+  assert _exec_xml(code) == musicpy_ast.safe_exec_musicpy(INVALID_SCORE)
+
+
+def test_errors_point_at_the_lines_of_the_source():
+  code = musicpy_ast.compile_musicpy(
+      'with ScorePartwise(version="4.0"):\n  Note(Bogus=1)\n'
+  )
+  with pytest.raises(TypeError) as raised:
+    exec(code, {}, musicpy.ScopedNames())
+  lines = [
+      frame.lineno
+      for frame in traceback.extract_tb(raised.tb)
+      if frame.filename == "<string>"
+  ]
+  assert lines == [2]
@@ -0,0 +1,84 @@
+import os
+import musicpy_ast
+import musicpy_cache
+import musicpy_xsd
+
+SCORE = """\
+with ScorePartwise(version="4.0"):
+  with Part(id="P1"):
+    with Measure(number=1):
+      Note(Duration=1)
+"""
+
+
+def test_key_changes_with_everything_the_output_depends_on(monkeypatch):
+  key = musicpy_cache.cache_key(SCORE)
+  assert musicpy_cache.cache_key(SCORE) == key
+  assert musicpy_cache.cache_key(SCORE + "\n") != key
+  assert musicpy_cache.cache_key(SCORE, indent=None) != key
+  monkeypatch.setattr(musicpy_cache, "musicpy_version", lambda: "changed")
+  assert musicpy_cache.cache_key(SCORE) != key
+  monkeypatch.undo()
+  monkeypatch.setattr(musicpy_cache, "_schema_version", lambda: "changed")
+  assert musicpy_cache.cache_key(SCORE) != key
+
+
+def test_builds_without_the_schema_files(tmp_path, monkeypatch):
+  monkeypatch.setenv("MUSICPY_SCHEMA_DIR", str(tmp_path))
+  musicpy_cache._schema_version.cache_clear()
+  try:
+    assert musicpy_xsd.schema_version() == musicpy_xsd.MISSING_SCHEMA_VERSION
+    xml = musicpy_cache.safe_exec_musicpy(SCORE, cache=musicpy_cache.XmlCache())
+  finally:
+    musicpy_cache._schema_version.cache_clear()
+  assert "<duration>1</duration>" in xml
+
+
+def test_hits_skip_the_build_and_survive_on_disk(tmp_path, monkeypatch):
+  builds = []
+  build = musicpy_ast.safe_exec_musicpy
+
+  def counting_build(musicpy, indent=2):
+    builds.append(musicpy)
+    return build(musicpy, indent)
+
+  monkeypatch.setattr(musicpy_ast, "safe_exec_musicpy", counting_build)
+  directory = str(tmp_path / "xml")
+  cache, restarted = (
+      musicpy_cache.XmlCache(directory=directory, max_disk_bytes=1 << 20)
+      for _ in range(2)
+  )
+  xml = musicpy_cache.safe_exec_musicpy(SCORE, cache=cache)
+  assert musicpy_cache.safe_exec_musicpy(SCORE, cache=cache) == xml
+  assert (cache.hits, cache.misses) == (1, 1)
+
+  assert musicpy_cache.safe_exec_musicpy(SCORE, cache=restarted) == xml
+  assert restarted.disk_hits == 1
+  assert len(builds) == 1
+
+
+def test_memory_tier_evicts_least_recently_used_entries():
+  cache = musicpy_cache.XmlCache(max_memory_bytes=10)
+  cache.put("a", "aaaa")
+  cache.put("b", "bbbb")
+  assert cache.get("a") == "aaaa"
+  cache.put("c", "cccc")
+  assert cache.get("b") is None
+  assert cache.get("a") == "aaaa" and cache.get("c") == "cccc"
+  cache.put("big", "x" * 11)  # Larger than the whole cache.
+  assert cache.get("big") is None
+
+
+def test_disk_tier_evicts_least_recently_used_files(tmp_path):
+  disk = musicpy_cache.DiskCache(str(tmp_path), 100, ".musicxml")
+  for key in "abcd":
+    disk.put(key, b"x" * 30)
+    # Modification times order the files for eviction.
+    os.utime(disk.path(key), (ord(key), ord(key)))
+  # Down to 90% of the limit, which only takes dropping the oldest file.
+  assert [disk.get(key) is not None for key in "abcd"] == [
+      False,
+      True,
+      True,
+      True,
+  ]
@@ -0,0 +1,112 @@
+import os
+import musicpy_cache
+import musicpy_cli
+
+EXAMPLE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "example",
+    "op299-no1.py",
+)
+
+SCORE = """\
+with ScorePartwise(version="4.0"):
+  with Part(id="P1"):
+    with Measure(number=1):
+      Note(Duration=1)
+"""
+
+
+def _statuses(source_dir, output_dir) -> list[str]:
+  results = musicpy_cli.build(
+      str(source_dir), str(output_dir), jobs=1, memory_limit_mb=0
+  )
+  return [result.status for result in results]
+
+
+def test_build_skips_unchanged_scores_until_musicpy_changes(
+    tmp_path, monkeypatch
+):
+  source_dir = tmp_path / "scores"
+  source_dir.mkdir()
+  (source_dir / "score.py").write_text(SCORE)
+  output_dir = tmp_path / "build"
+  assert _statuses(source_dir, output_dir) == ["built"]
+  assert (output_dir / "score.musicxml").exists()
+  assert _statuses(source_dir, output_dir) == ["skipped"]
+
+  monkeypatch.setattr(musicpy_cache, "musicpy_version", lambda: "changed")
+  assert _statuses(source_dir, output_dir) == ["built"]
+
+
+def _long_score(measures: int = 20000) -> str:
+  lines = ['with ScorePartwise(version="4.0"):', '  with Part(id="P1"):']
+  for number in range(1, measures + 1):
+    lines.append(f"    with Measure(number={number}):")
+    lines.extend(["      Note(Duration=1)"] * 4)
+  return "\n".join(lines) + "\n"
+
+
+def test_a_failing_score_fails_alone(tmp_path):
+  source_dir = tmp_path / "scores"
+  source_dir.mkdir()
+  for name in "abcd":
+    (source_dir / f"{name}.py").write_text(SCORE)
+  (source_dir / "long.py").write_text(_long_score())
+  output_dir = tmp_path / "build"
+  # The long score is killed with its worker once it times out.
+  results = musicpy_cli.build(
+      str(source_dir), str(output_dir), jobs=2, timeout=1, memory_limit_mb=0
+  )
+  assert [(result.path, result.status) for result in results] == [
+      ("a.py", "built"),
+      ("b.py", "built"),
+      ("c.py", "built"),
+      ("d.py", "built"),
+      ("long.py", "failed"),
+  ]
+  assert results[-1].error.startswith("TimeoutError")
+  assert sorted(musicpy_cli._load_manifest(str(output_dir))) == [
+      "a.py",
+      "b.py",
+      "c.py",
+      "d.py",
+  ]
+
+
+def test_memory_limit_applies_to_each_score(tmp_path):
+  source_dir = tmp_path / "scores"
+  source_dir.mkdir()
+  (source_dir / "long.py").write_text(_long_score())
+  for name in "abc":
+    (source_dir / f"{name}.py").write_text(SCORE)
+  results = musicpy_cli.build(
+      str(source_dir), str(tmp_path / "build"), jobs=1, memory_limit_mb=200
+  )
+  assert [result.status for result in results] == [
+      "built",
+      "built",
+      "built",
+      "failed",
+  ]
+  assert results[-1].error == "Out of memory"
+
+
+def test_svg_pages_are_rendered_and_recorded(tmp_path):
+  with open(EXAMPLE) as f:
+    example = f.read()
+  source_dir = tmp_path / "scores"
+  source_dir.mkdir()
+  (source_dir / "example.py").write_text(example)
+  output_dir = tmp_path / "build"
+  assert _statuses(source_dir, output_dir) == ["built"]
+  # Rendering pages is a different build of the same source.
+  results = musicpy_cli.build(
+      str(source_dir), str(output_dir), jobs=1, memory_limit_mb=0, svg=True
+  )
+  assert results[0].status == "built" and results[0].pages > 0
+  for page in range(1, results[0].pages + 1):
+    assert (output_dir / f"example-{page}.svg").read_text().startswith("<")
+  results = musicpy_cli.build(
+      str(source_dir), str(output_dir), jobs=1, memory_limit_mb=0, svg=True
+  )
+  assert results[0].status == "skipped"
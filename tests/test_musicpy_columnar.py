@@ -0,0 +1,81 @@
+import math
+import os
+import pytest
+import musicpy
+from musicpy import MusicPy, _
+import musicpy_ast
+import musicpy_columnar
+from musicpy_schema import Note, ScorePartwise
+
+EXAMPLE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "example",
+    "op299-no1.py",
+)
+
+
+def _build_example(monkeypatch, backend: str, policy: str) -> str:
+  monkeypatch.setattr(
+      musicpy._default_session, "backend", musicpy._new_backend(backend)
+  )
+  monkeypatch.setattr(musicpy._default_session, "validation_policy", policy)
+  with open(EXAMPLE) as f:
+    return musicpy_ast.safe_exec_musicpy(musicpy_ast.strip_imports(f.read()))
+
+
+@pytest.mark.parametrize("policy", musicpy.VALIDATION_POLICIES)
+def test_output_is_identical_to_lxml(schema_dir, monkeypatch, policy):
+  expected = _build_example(monkeypatch, "lxml", "off")
+  for backend in ("lxml", "columnar"):
+    assert _build_example(monkeypatch, backend, policy) == expected
+
+
+def test_compacted_notes_round_trip():
+  outputs = {}
+  for backend in ("lxml", "columnar"):
+    with MusicPy(backend=backend, validation_policy="off") as session:
+      with ScorePartwise(version="4.0"):
+        with ScorePartwise.Part(id="P1"):
+          with ScorePartwise.Part.Measure(number=1):
+            Note(Pitch=_(Step="C", Alter=-1, Octave=4), Duration=2, Voice=1)
+            Note(Chord=_(), Pitch=_(Step="E", Octave=4), Duration=2, Voice=1)
+            Note(Rest=_(), Duration=1.5, Type="quarter", Staff=2)
+            # Not round-tripped as a number, so left in the tree.
+            Note(Rest=_(), Duration="01")
+    outputs[backend] = session.get_xml()
+  assert outputs["columnar"] == outputs["lxml"]
+
+  columns = session.note_columns()["P1"]
+  assert list(columns.flags) == [
+      musicpy_columnar.PITCH,
+      musicpy_columnar.CHORD | musicpy_columnar.PITCH,
+      musicpy_columnar.REST,
+      musicpy_columnar.RAW,
+  ]
+  assert columns.step[0] == musicpy_columnar.STEPS.index("C")
+  assert columns.alter[0] == -1 and math.isnan(columns.alter[1])
+  assert columns.duration[2] == 1.5
+  assert columns.staff[2] == 2
+
+
+def test_eager_validation_materializes_only_compacted_subtrees(
+    schema_dir, monkeypatch
+):
+  materialized = []
+  materialize = musicpy_columnar.materialize
+
+  def counting_materialize(element, columns_by_part):
+    materialized.append(element.tag)
+    return materialize(element, columns_by_part)
+
+  monkeypatch.setattr(musicpy_columnar, "materialize", counting_materialize)
+  with MusicPy(backend="columnar", validation_policy="eager") as session:
+    with ScorePartwise(version="4.0"):
+      with ScorePartwise.Part(id="P1"):
+        for number in range(1, 51):
+          with ScorePartwise.Part.Measure(number=number):
+            with Note(Duration=1):
+              pass
+  assert len(session.note_columns()["P1"]) == 50
+  # Once for the part and once for the score, not for every measure.
+  assert materialized == ["part", "score-partwise"]
@@ -0,0 +1,92 @@
+import os
+import threading
+import musicpy_ast
+import musicpy_render
+
+EXAMPLE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "example",
+    "op299-no1.py",
+)
+
+
+def _example() -> str:
+  with open(EXAMPLE) as f:
+    return musicpy_ast.strip_imports(f.read())
+
+
+def test_pages_rendered_without_disk_are_written_to_disk(tmp_path):
+  source = _example()
+  pool = musicpy_render.ToolkitPool(1)
+  first = musicpy_render.submit_render(source, pool=pool).result()
+  svg = first.svg(1)
+
+  disk = musicpy_render.RenderCache(str(tmp_path), 64 << 20)
+  second = musicpy_render.submit_render(source, pool=pool, disk=disk).result()
+  assert second.svg(1) == svg
+  assert disk.get_page(second.render_key, 1) == svg
+  assert disk.get_score(second.render_key) == (first.xml, first.page_count)
+
+
+def test_render_key_does_not_wait_for_the_toolkit_pool():
+  pool = musicpy_render.toolkit_pool()
+  checked_out = []
+  try:
+    for _ in range(pool.max_size):
+      checkout = pool.checkout()
+      checkout.__enter__()
+      checked_out.append(checkout)
+    key = musicpy_render.render_key("0" * 40, None)
+  finally:
+    for checkout in checked_out:
+      checkout.__exit__(None, None, None)
+  assert key == musicpy_render.render_key("0" * 40, None)
+  assert key != musicpy_render.render_key("0" * 40, {"scale": 40})
+
+
+def test_pool_lends_each_toolkit_to_one_caller_at_a_time():
+  pool = musicpy_render.ToolkitPool(2)
+  entered = threading.Event()
+  with pool.checkout() as first, pool.checkout({"scale": 40}) as second:
+    assert first is not second
+
+    def third():
+      with pool.checkout():
+        entered.set()
+
+    thread = threading.Thread(target=third)
+    thread.start()
+    assert not entered.wait(0.2)
+    assert pool.stats()["waiting"] == 1
+  thread.join(5)
+  assert entered.is_set()
+  stats = pool.stats()
+  assert (stats["created"], stats["waits"], stats["in_use"]) == (2, 1, 0)
+
+
+def test_returned_toolkits_get_their_options_back():
+  pool = musicpy_render.ToolkitPool(1)
+  with pool.checkout({"scale": 40}) as pooled:
+    pooled.toolkit.setOptions({"scale": 20})
+  with pool.checkout({"scale": 40}) as again:
+    assert again is pooled
+    assert again.toolkit.getOptions()["scale"] == 40
+  with pool.checkout() as other:
+    # The only toolkit had other options, so it was replaced.
+    assert other is not pooled
+    assert other.toolkit.getOptions()["scale"] == 100
+
+
+def test_pool_prefers_the_toolkit_that_has_the_score_loaded():
+  xml = musicpy_ast.safe_exec_musicpy(_example())
+  key = musicpy_render.data_key(xml, None)
+  pool = musicpy_render.ToolkitPool(2)
+  with pool.checkout() as loaded, pool.checkout() as idle:
+    loaded.load(key, xml)
+  assert idle.data_key is None
+  with pool.checkout(data_key=key) as pooled:
+    assert pooled is loaded
+    loads = []
+    pooled.toolkit.loadData = loads.append  # Would load the score again.
+    pooled.load(key, xml)
+    assert loads == []
@@ -0,0 +1,78 @@
+import pytest
+import musicpy_ast
+import musicpy_sandbox
+
+SCORE = """\
+with ScorePartwise(version="4.0"):
+  with Part(id="P1"):
+    with Measure(number=1):
+      Note(Duration=1)
+"""
+
+
+def _long_score(measures: int = 20000) -> str:
+  """Returns a score that takes several seconds and 100s of MB to build."""
+  lines = ['with ScorePartwise(version="4.0"):', '  with Part(id="P1"):']
+  for number in range(1, measures + 1):
+    lines.append(f"    with Measure(number={number}):")
+    lines.extend(["      Note(Duration=1)"] * 4)
+  return "\n".join(lines) + "\n"
+
+
+needs_rlimits = pytest.mark.skipif(
+    musicpy_sandbox.resource is None, reason="Needs resource limits."
+)
+
+
+def test_builds_like_this_process_and_reports_errors():
+  with musicpy_sandbox.SandboxPool(1) as pool:
+    assert pool.run(SCORE) == musicpy_ast.safe_exec_musicpy(SCORE)
+    with pytest.raises(ValueError):
+      pool.run("import os\n")
+    assert pool.run(SCORE, indent=None) == musicpy_ast.safe_exec_musicpy(
+        SCORE, indent=None
+    )
+    stats = pool.stats()
+  assert (stats["completed"], stats["failed"], stats["recycled"]) == (2, 1, 0)
+
+
+@needs_rlimits
+def test_cpu_limit_fails_the_job_but_keeps_the_worker():
+  with musicpy_sandbox.SandboxPool(1, timeout=None, cpu_seconds=1) as pool:
+    with pytest.raises(TimeoutError):
+      pool.run(_long_score())
+    assert pool.run(SCORE) == musicpy_ast.safe_exec_musicpy(SCORE)
+    stats = pool.stats()
+  assert (stats["timeouts"], stats["recycled"]) == (1, 0)
+
+
+def test_wall_clock_timeout_replaces_the_worker():
+  with musicpy_sandbox.SandboxPool(1, timeout=0.5, cpu_seconds=0) as pool:
+    # Let the worker start, which the timeout does not cover.
+    pool.run(SCORE)
+    with pytest.raises(TimeoutError):
+      pool.run(_long_score())
+    assert pool.run(SCORE) == musicpy_ast.safe_exec_musicpy(SCORE)
+    stats = pool.stats()
+  assert (stats["timeouts"], stats["recycled"]) == (1, 1)
+
+
+@needs_rlimits
+def test_memory_limit_fails_the_job_and_replaces_the_worker():
+  with musicpy_sandbox.SandboxPool(
+      1, cpu_seconds=0, memory_limit_mb=200
+  ) as pool:
+    with pytest.raises(MemoryError):
+      pool.run(_long_score())
+    assert pool.run(SCORE) == musicpy_ast.safe_exec_musicpy(SCORE)
+    assert pool.stats()["recycled"] == 1
+
+
+def test_workers_are_replaced_after_max_jobs():
+  with musicpy_sandbox.SandboxPool(1, max_jobs=2) as pool:
+    first = pool._idle[0].process.pid
+    pool.run(SCORE)
+    assert pool._idle[0].process.pid == first
+    pool.run(SCORE)
+    assert pool._idle[0].process.pid != first
+    assert pool.stats()["recycled"] == 1
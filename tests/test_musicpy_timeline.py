@@ -0,0 +1,138 @@
+import textwrap
+import musicpy_timeline
+from musicpy_timeline import BACKUP, OVERFULL, UNDERFULL, TimelineIssue
+
+# 4/4 with a quarter note of 4 divisions, so measures last 16 divisions.
+HEADER = """\
+with ScorePartwise(version="4.0"):
+  with Part(id="P1"):
+    with Measure(number="1"):
+      with Attributes():
+        Divisions(4)
+        Time(Beats=4, BeatType=4)
+      Note(Duration=16)
+"""
+
+
+def _check(measures: str) -> list[TimelineIssue]:
+  return musicpy_timeline.check_timeline(
+      HEADER + textwrap.indent(textwrap.dedent(measures), "    ")
+  )
+
+
+def test_full_measures_have_no_issues():
+  assert not _check("""\
+      with Measure(number="2"):
+        Note(Duration=8)
+        Note(Duration=4)
+        Note(Duration=4)
+      """)
+
+
+def test_overfull_measures_are_reported_at_the_first_note_past_the_end():
+  assert _check("""\
+      with Measure(number="2"):
+        Note(Duration=8)
+        Note(Duration=4)
+        Note(Duration=8)
+        Note(Duration=4)
+      """) == [TimelineIssue(OVERFULL, 11, "P1", "2", None, 16, 24)]
+
+
+def test_underfull_measures_are_reported_at_the_measure():
+  assert _check("""\
+      with Measure(number="2"):
+        Note(Duration=8)
+      with Measure(number="3"):
+        Note(Duration=16)
+      """) == [TimelineIssue(UNDERFULL, 8, "P1", "2", None, 16, 8)]
+
+
+def test_implicit_measures_may_be_short_but_not_long():
+  assert _check("""\
+      with Measure(number="0", implicit="yes"):
+        Note(Duration=2)
+      with Measure(number="2", implicit="yes"):
+        Note(Duration=18)
+      """) == [TimelineIssue(OVERFULL, 11, "P1", "2", None, 16, 18)]
+
+
+def test_voices_are_checked_separately():
+  assert _check("""\
+      with Measure(number="2"):
+        Note(Duration=16, Voice="1")
+        Backup(Duration=16)
+        Note(Duration=8, Voice="2")
+      """) == [TimelineIssue(UNDERFULL, 8, "P1", "2", "2", 16, 8)]
+
+
+def test_backup_before_the_start_of_the_measure():
+  assert _check("""\
+      with Measure(number="2"):
+        Note(Duration=8, Voice="1")
+        Backup(Duration=12)
+        Note(Duration=20, Voice="2")
+      """) == [
+      TimelineIssue(BACKUP, 10, "P1", "2", None, 16, -4),
+      TimelineIssue(UNDERFULL, 8, "P1", "2", "1", 16, 8),
+  ]
+
+
+def test_forward_moves_the_position():
+  assert not _check("""\
+      with Measure(number="2"):
+        Note(Duration=8)
+        Forward(Duration=8)
+      """)
+
+
+def test_chord_and_grace_notes_do_not_move_the_position():
+  assert not _check("""\
+      with Measure(number="2"):
+        Note(Duration=8)
+        Note(Chord=True, Duration=8)
+        with Note():
+          Grace()
+          Duration(4)
+        Note(Duration=8)
+        Note(Chord=True, Duration=8)
+      """)
+
+
+def test_senza_misura_measures_are_not_checked():
+  assert not _check("""\
+      with Measure(number="2"):
+        with Attributes():
+          with Time():
+            SenzaMisura()
+        Note(Duration=3)
+      with Measure(number="3"):
+        Note(Duration=40)
+      """)
+
+
+def test_time_signature_changes_apply_to_later_measures():
+  assert _check("""\
+      with Measure(number="2"):
+        with Attributes():
+          Time(Beats="3+2", BeatType=8)
+        Note(Duration=10)
+      with Measure(number="3"):
+        Note(Duration=4)
+      """) == [TimelineIssue(UNDERFULL, 12, "P1", "3", None, 10, 4)]
+
+
+def test_issue_lines_follow_nested_with_items():
+  issues = _check("""\
+      with (
+          Measure(number="2"),
+      ):
+        Note(Duration=4)
+        Note(
+            Duration=16,
+        )
+      """)
+  assert issues == [TimelineIssue(OVERFULL, 12, "P1", "2", None, 16, 20)]
+  assert str(issues[0]) == (
+      "line 12: measure 2 of part P1 is overfull: 20 divisions instead of 16"
+  )
@@ -0,0 +1,117 @@
+import os
+import threading
+import pytest
+from lxml import etree
+import musicpy
+import musicpy_schema
+import musicpy_xsd
+
+
+def _forget_loaded_schema(monkeypatch):
+  monkeypatch.setattr(musicpy_xsd, "_schema_document", None)
+  monkeypatch.setattr(musicpy_xsd, "_element_types", None)
+  monkeypatch.setattr(musicpy_xsd, "_local", threading.local())
+
+
+def _accepts_duration(duration: str) -> bool:
+  note = etree.fromstring(f"<note><duration>{duration}</duration></note>")
+  return musicpy_xsd.compiled_schema().validate(note)
+
+
+def test_resolved_schema_is_cached_by_hash_and_rebuilt_on_change(
+    schema_dir, monkeypatch
+):
+  version = musicpy_xsd.schema_version()
+  assert musicpy_xsd.element_types()["note"] == "note"
+  entry = os.path.join(musicpy_xsd.cache_dir(), "schema", version)
+  assert sorted(os.listdir(entry)) == sorted((
+      musicpy_xsd.ELEMENT_TYPES_FILE_NAME,
+      musicpy_xsd.RESOLVED_SCHEMA_FILE_NAME,
+      "xlink.xsd",
+      "xml.xsd",
+  ))
+  assert not _accepts_duration("0")
+
+  # A new process only loads the resolved schema from the cache.
+  def no_resolve(source, target):
+    raise AssertionError("resolved again")
+
+  resolve = musicpy_xsd._resolve
+  monkeypatch.setattr(musicpy_xsd, "_resolve", no_resolve)
+  _forget_loaded_schema(monkeypatch)
+  assert musicpy_xsd.element_types()["note"] == "note"
+  assert not _accepts_duration("0")
+
+  # Changing the schema files changes the hash, and the schema is resolved
+  # again into a new entry.
+  xsd = schema_dir / "musicxml.xsd"
+  xsd.write_text(
+      xsd.read_text().replace("xs:positiveInteger", "xs:nonNegativeInteger")
+  )
+  assert musicpy_xsd.schema_version() != version
+  monkeypatch.setattr(musicpy_xsd, "_resolve", resolve)
+  _forget_loaded_schema(monkeypatch)
+  assert _accepts_duration("0")
+  assert sorted(os.listdir(os.path.dirname(entry))) == sorted(
+      (version, musicpy_xsd.schema_version())
+  )
+
+
+def test_missing_schema_is_reported(tmp_path, monkeypatch):
+  monkeypatch.setenv("MUSICPY_SCHEMA_DIR", str(tmp_path))
+  _forget_loaded_schema(monkeypatch)
+  assert musicpy_xsd.schema_version() == musicpy_xsd.MISSING_SCHEMA_VERSION
+  with pytest.raises(FileNotFoundError):
+    musicpy_xsd.compiled_schema()
+
+
+def test_prewarm_compiles_the_validators_ahead_of_use(schema_dir, monkeypatch):
+  warmed = musicpy.prewarm()
+  # The stand-in schema only declares these of `PREWARM_ELEMENTS`.
+  assert sorted(warmed) == ["Note", "ScorePartwise"]
+  assert musicpy.prewarm(["ScorePartwise.Part"]).keys() == {
+      "ScorePartwise.Part"
+  }
+  for element_class in (
+      musicpy_schema.ScorePartwise,
+      musicpy_schema.ScorePartwise.Part,
+      musicpy_schema.Note,
+  ):
+    assert element_class.__dict__["schema"]
+
+  def no_compile(document):
+    raise AssertionError("compiled again")
+
+  monkeypatch.setattr(musicpy_xsd.etree, "XMLSchema", no_compile)
+  with musicpy.MusicPy(validation_policy="eager") as session:
+    with musicpy_schema.ScorePartwise(version="4.0"):
+      with musicpy_schema.ScorePartwise.Part(id="P1"):
+        with musicpy_schema.ScorePartwise.Part.Measure(number=1):
+          musicpy_schema.Note(Duration=1)
+  assert "<duration>1</duration>" in session.get_xml()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Needs fork().")
+def test_schema_lock_is_reset_after_fork():
+  # A lock held by another thread at fork time would never be released in
+  # the child.
+  holding, release = threading.Event(), threading.Event()
+
+  def hold_lock():
+    with musicpy_xsd._lock:
+      holding.set()
+      release.wait()
+
+  holder = threading.Thread(target=hold_lock)
+  holder.start()
+  holding.wait()
+  try:
+    pid = os.fork()
+    if pid == 0:
+      acquired = musicpy_xsd._lock.acquire(timeout=10)
+      os._exit(0 if acquired else 1)
+    _, status = os.waitpid(pid, 0)
+  finally:
+    release.set()
+    holder.join()
+  assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,113 @@
+import http.server
+import json
+import threading
+import pytest
+import requests
+import sheet_index
+
+TREE = {
+    "sha": "0" * 40,
+    "truncated": False,
+    "tree": [
+        {"path": "Bach", "type": "tree", "sha": "1" * 40},
+        {"path": "Bach/minuet.py", "type": "blob", "sha": "2" * 40},
+        {"path": "Bach/notes.txt", "type": "blob", "sha": "3" * 40},
+        {"path": "README.md", "type": "blob", "sha": "4" * 40},
+    ],
+}
+ETAG = '"tree-1"'
+BLOBS = {"2" * 40: b"with ScorePartwise():\n  pass\n"}
+
+
+class _GitHubHandler(http.server.BaseHTTPRequestHandler):
+  """Answers the git trees and blobs requests of a stand-in GitHub API."""
+
+  def do_GET(self):
+    server = self.server
+    server.requests.append((self.path, dict(self.headers)))
+    if server.failing:
+      self.send_error(503)
+    elif self.path == "/repos/owner/sheets/git/trees/main?recursive=1":
+      if self.headers.get("If-None-Match") == ETAG:
+        self.send_response(304)
+        self.end_headers()
+        return
+      body = json.dumps(TREE).encode("utf-8")
+      self.send_response(200)
+      self.send_header("ETag", ETAG)
+      self.send_header("Content-Type", "application/json")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+    elif self.path.startswith("/repos/owner/sheets/git/blobs/"):
+      body = BLOBS.get(self.path.rpartition("/")[2])
+      if body is None:
+        self.send_error(404)
+        return
+      self.send_response(200)
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+    else:
+      self.send_error(404)
+
+  def log_message(self, format, *args):
+    pass
+
+
+@pytest.fixture
+def github():
+  """Runs the stand-in, returns its server (whose `failing` can be set)."""
+  server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _GitHubHandler)
+  server.requests = []
+  server.failing = False
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  server.url = f"http://127.0.0.1:{server.server_address[1]}"
+  yield server
+  server.shutdown()
+  server.server_close()
+
+
+def _index(github, **kwargs) -> sheet_index.SheetIndex:
+  return sheet_index.SheetIndex("owner/sheets", base_url=github.url, **kwargs)
+
+
+def test_fetches_then_revalidates_then_falls_back_to_the_cached_tree(github):
+  index = _index(github, token="token")
+  assert index.list("/") == ["Bach/"]
+  assert index.list("/Bach/") == ["minuet.py"]
+  assert index.sha("/Bach/minuet.py") == "2" * 40
+  assert len(github.requests) == 1  # Listings are answered from memory.
+  assert github.requests[0][1]["Authorization"] == "token"
+  assert "If-None-Match" not in github.requests[0][1]
+
+  assert not index.refresh(force=True)
+  assert github.requests[-1][1]["If-None-Match"] == ETAG
+  assert index.not_modified == 1
+
+  github.failing = True
+  assert not index.refresh(force=True)
+  assert index.requests == 3
+  assert index.list("/Bach/") == ["minuet.py"]
+
+
+def test_fails_without_a_cached_tree(github):
+  github.failing = True
+  with pytest.raises(requests.RequestException):
+    _index(github).list("/")
+
+
+def test_restarted_index_revalidates_the_tree_on_disk(github, tmp_path):
+  cache_path = str(tmp_path / "index.json")
+  _index(github, cache_path=cache_path).refresh()
+  restarted = _index(github, cache_path=cache_path)
+  assert restarted.list("/Bach/") == ["minuet.py"]
+  assert github.requests[-1][1]["If-None-Match"] == ETAG
+  assert restarted.not_modified == 1
+
+
+def test_fetches_files_by_blob_sha(github):
+  index = _index(github)
+  assert index.blob(index.sha("Bach/minuet.py")) == BLOBS["2" * 40]
+  assert github.requests[-1][0] == f"/repos/owner/sheets/git/blobs/{'2' * 40}"
@@ -0,0 +1,29 @@
+import os
+from lxml import etree
+import musicpy
+import musicpy_ast
+import musicpy_schema
+import xml_to_py
+
+EXAMPLE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "example",
+    "op299-no1.py",
+)
+
+
+def _canonical(xml: str) -> bytes:
+  return etree.tostring(etree.fromstring(xml), method="c14n")
+
+
+def test_translated_example_runs_as_a_plain_script(monkeypatch):
+  monkeypatch.setattr(musicpy._default_session, "validation_policy", "off")
+  with open(EXAMPLE) as f:
+    xml = musicpy_ast.safe_exec_musicpy(musicpy_ast.strip_imports(f.read()))
+  code = xml_to_py.translate_xml_to_python(xml)
+  assert "with ScorePartwise.Part(id='P1'):" in code
+  assert "with ScorePartwise.Part.Measure(" in code
+  # Without a ScopedNames namespace, as `python score.py` would run it.
+  with musicpy.MusicPy(validation_policy="off") as session:
+    exec(code, dict(vars(musicpy_schema)))
+  assert _canonical(session.get_xml()) == _canonical(xml)
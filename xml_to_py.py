@@ -1,9 +1,10 @@
+import ast
 import inspect
 import types
 import typing
 import logging
 import xml.etree.ElementTree as ET
-import musicxml_schema
+import musicpy_schema
 
 
 def to_snake_case(name: str) -> str:
@@ -68,7 +69,14 @@ def _convert_to_python_value(value: str, param_type: str) -> str:
   if param_type == "int":
     return str(int(value))
   elif param_type == "float":
-    return str(float(value))
+    number = float(value)
+    # Keep numbers as written, e.g. "40" rather than "40.0".
+    try:
+      if isinstance(ast.literal_eval(value.strip()), (int, float)):
+        return value.strip()
+    except (ValueError, SyntaxError):
+      pass
+    return repr(number)
   elif param_type == "bool":
     if value.lower() == "true":
       return "True"
@@ -81,13 +89,22 @@ def _convert_to_python_value(value: str, param_type: str) -> str:
 
 
 def _generate_code(
-    element: ET.Element, indent_level: int, parent_schema_class: type = None
+    element: ET.Element,
+    indent_level: int,
+    parent_schema_class: type = None,
+    parent_name: str = "",
 ) -> str:
   """Recursively traverses the ElementTree and generates the Python code string.
 
+  Classes that are only nested in their parent's class are named qualified,
+  e.g. `ScorePartwise.Part`, so the code also runs as a plain Python script
+  and not only in a `musicpy.ScopedNames` namespace.
+
   Args:
       element: The current xml.etree.ElementTree.Element node.
       indent_level: The current level of indentation for pretty-printing.
+      parent_schema_class: The class of the parent element.
+      parent_name: The name the generated code uses for the parent's class.
 
   Returns:
       The generated Python code string for the element and its children.
@@ -100,11 +117,13 @@ def _generate_code(
 
   has_plain_text_arg = False
   schema_class = None
-  # Dynamically get the class from the musicxml_schema module
+  # Dynamically get the class from the musicpy_schema module
   if parent_schema_class:
     schema_class = getattr(parent_schema_class, class_name, None)
   if not schema_class:
-    schema_class = getattr(musicxml_schema, class_name)
+    schema_class = getattr(musicpy_schema, class_name)
+  elif schema_class is not getattr(musicpy_schema, class_name, None):
+    class_name = f"{parent_name}.{class_name}"
   # Inspect the __init__ method for plain_text argument
   init_signature = inspect.signature(schema_class.__init__)
   if "plain_text" in init_signature.parameters:
@@ -150,7 +169,9 @@ def _generate_code(
 
     # Recursively generate code for each child element
     for child in children:
-      code_lines.append(_generate_code(child, indent_level + 1, schema_class))
+      code_lines.append(
+          _generate_code(child, indent_level + 1, schema_class, class_name)
+      )
 
     return "\n".join(code_lines)
   else:
@@ -162,8 +183,8 @@ def _generate_code(
 if __name__ == "__main__":
   with open("score.xml", "r") as f:
     xml_string = f.read()
-  print("""from musicxml_schema import *
-from musicxml import _
+  print("""from musicpy_schema import *
+from musicpy import _
 
 """)
   result = translate_xml_to_python(xml_string)